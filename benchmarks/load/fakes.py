@@ -0,0 +1,162 @@
+"""
+Servidores falsos para el benchmark de carga.
+
+- OpenAI compatible (/v1/chat/completions) con latencia y tokens de salida configurables.
+- Transactions (/api/transactions, /api/transactions/reports) y Goals (/api/goals)
+  con usuarios sintéticos deterministas. El usuario se toma del token:
+  "Bearer bench-user-<n>".
+"""
+import asyncio
+import json
+import random
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from fastapi import FastAPI, Header, Request
+
+DESCRIPTIONS = [
+    "UBER *TRIP", "Uber Eats Bogota", "RAPPI*RESTAURANTE", "Tienda D1", "Cafe Juan Valdez",
+    "Netflix.com", "Spotify", "Exito Calle 80", "Gasolina Terpel", "Farmacia Cruz Verde",
+    "Arriendo", "Claro Hogar", "Cine Colombia", "Panaderia La 14", "Smart Fit"
+]
+GOAL_CATEGORIES = ["TRAVEL", "EMERGENCY_FUND", "EDUCATION", "TECHNOLOGY", "HOME", "OTHER"]
+
+def _user_seed(authorization: Optional[str]) -> int:
+    token = (authorization or "").replace("Bearer ", "")
+    try:
+        return int(token.rsplit("-", 1)[-1])
+    except ValueError:
+        return 0
+
+def synthetic_transactions(user_seed: int, history_size: int) -> list:
+    rng = random.Random(user_seed)
+    today = date.today()
+    transactions = []
+    for i in range(history_size):
+        day = today - timedelta(days=rng.randint(0, 180))
+        if rng.random() < 0.1:
+            transactions.append({
+                "id": i + 1,
+                "amount": float(rng.randint(2_000_000, 6_000_000)),
+                "description": "Nomina",
+                "date": day.isoformat(),
+                "type": "INCOME",
+                "categoryId": 0
+            })
+            continue
+        description = rng.choice(DESCRIPTIONS)
+        transactions.append({
+            "id": i + 1,
+            "amount": float(rng.choice([rng.randint(1_000, 5_000), rng.randint(5_000, 300_000)])),
+            "description": f"{description} {rng.randint(1000, 9999)}",
+            "date": day.isoformat(),
+            "type": "EXPENSE",
+            "categoryId": DESCRIPTIONS.index(description) % 8 + 1
+        })
+    transactions.sort(key=lambda t: t["date"])
+    return transactions
+
+def synthetic_goals(user_seed: int, goal_count: int) -> list:
+    rng = random.Random(user_seed * 7919)
+    today = date.today()
+    goals = []
+    for i in range(goal_count):
+        target = float(rng.randint(1, 40) * 500_000)
+        goals.append({
+            "id": i + 1,
+            "name": f"Meta {i + 1}",
+            "targetAmount": target,
+            "savedAmount": round(target * rng.random(), 2),
+            "category": rng.choice(GOAL_CATEGORIES),
+            "dueDate": (today + timedelta(days=rng.randint(30, 720))).isoformat(),
+            "status": "ACTIVE"
+        })
+    return goals
+
+def create_upstream_app(history_size: int, goal_count: int, latency_ms: float = 0.0) -> FastAPI:
+    """Microservicios Transactions + Goals bajo el prefijo /api"""
+    app = FastAPI()
+
+    async def delay():
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+
+    @app.get("/api/transactions")
+    async def transactions(authorization: Optional[str] = Header(None)):
+        await delay()
+        return synthetic_transactions(_user_seed(authorization), history_size)
+
+    @app.get("/api/transactions/reports")
+    async def reports(authorization: Optional[str] = Header(None)):
+        await delay()
+        data = synthetic_transactions(_user_seed(authorization), history_size)
+        income = sum(t["amount"] for t in data if t["type"] == "INCOME")
+        expense = sum(t["amount"] for t in data if t["type"] == "EXPENSE")
+        return {"totalIncome": income, "totalExpense": expense}
+
+    @app.get("/api/goals")
+    async def goals(authorization: Optional[str] = Header(None)):
+        await delay()
+        return synthetic_goals(_user_seed(authorization), goal_count)
+
+    return app
+
+def _cached_prefix_tokens(messages: List[Dict], prompt_tokens: int, seen_prefixes: set) -> int:
+    """
+    Imita la caché de prefijos de OpenAI: solo prompts de 1024+ tokens, en
+    bloques de 128, y solo si el mensaje system ya se vio antes.
+    """
+    system = "".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+    if not system:
+        return 0
+    if system not in seen_prefixes:
+        seen_prefixes.add(system)
+        return 0
+    if prompt_tokens < 1024:
+        return 0
+    return (len(system) // 4) // 128 * 128
+
+def create_openai_app(latency_ms: float, jitter_ms: float, output_tokens: int) -> FastAPI:
+    """API de chat completions compatible con OpenAI que responde JSON genérico"""
+    app = FastAPI()
+    rng = random.Random(42)
+    seen_prefixes = set()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+        cached_tokens = _cached_prefix_tokens(body.get("messages", []), prompt_chars // 4, seen_prefixes)
+        await asyncio.sleep(max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000)
+
+        # ~4 caracteres por token
+        filler = " ".join("ok" for _ in range(max(output_tokens - 20, 0)))
+        content = json.dumps({
+            "message": f"Respuesta sintética. {filler}".strip(),
+            "health_score": 70,
+            "status": "bien",
+            "viable": True,
+            "suggested_amount": 100000.0,
+            "recommendations": [],
+            "goals_status": []
+        }, ensure_ascii=False)
+
+        return {
+            "id": f"chatcmpl-bench-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": output_tokens,
+                "total_tokens": prompt_chars // 4 + output_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens}
+            }
+        }
+
+    return app
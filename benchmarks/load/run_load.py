@@ -0,0 +1,229 @@
+"""
+Benchmark de carga end-to-end del servicio de IA.
+
+Levanta la app (uvicorn, subproceso) apuntando a servidores falsos de
+OpenAI, Transactions y Goals, ejecuta una mezcla de requests sobre
+/analyze, /budget/* y /chat con concurrencia fija y guarda los resultados
+(throughput y p50/p95/p99 por endpoint) en JSON para comparar corridas.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.load.run_load --concurrency 16 --duration 60 \
+        --llm-latency-ms 800 --history-size 500 --output bench_results/run.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List
+import httpx
+import uvicorn
+from benchmarks.load.fakes import create_openai_app, create_upstream_app
+
+DEFAULT_MIX = "analyze=0.4,budget_suggest=0.15,budget_review=0.15,chat=0.3"
+
+ANALYZE_QUERIES = [
+    "análisis general",
+    "¿Cuáles son mis gastos hormiga?",
+    "detecta fugas de dinero",
+    "gastos repetitivos",
+    "progreso de mis metas",
+    "evaluar si es viable ahorrar para un viaje"
+]
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _serve_in_thread(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def _parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        weights[name.strip()] = float(weight)
+    return weights
+
+def _build_request(endpoint: str, user: int, rng: random.Random):
+    today = date.today()
+    start = (today - timedelta(days=15)).isoformat()
+    end = (today + timedelta(days=15)).isoformat()
+    category_id = rng.randint(1, 8)
+    if endpoint == "analyze":
+        return "/analyze", {"user_id": user, "user_query": rng.choice(ANALYZE_QUERIES)}
+    if endpoint == "chat":
+        return "/chat", {"user_id": user, "user_query": "hola"}
+    if endpoint == "budget_suggest":
+        return "/budget/suggest", {
+            "user_id": str(user),
+            "category_id": category_id,
+            "category_name": f"Categoría {category_id}",
+            "start_date": start,
+            "end_date": end
+        }
+    if endpoint == "budget_review":
+        return "/budget/review", {
+            "user_id": str(user),
+            "budget": {"category_id": category_id, "amount": 300000.0, "start_date": start, "end_date": end}
+        }
+    raise ValueError(f"Endpoint desconocido: {endpoint}")
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+async def _drive(base_url: str, args, weights: Dict[str, float]) -> Dict:
+    names = list(weights)
+    probabilities = [weights[n] for n in names]
+    samples: Dict[str, List[float]] = {n: [] for n in names}
+    errors: Dict[str, int] = {n: 0 for n in names}
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(worker_id: int, client: httpx.AsyncClient):
+        rng = random.Random(args.seed + worker_id)
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(names, probabilities)[0]
+            user = rng.randint(1, args.users)
+            path, payload = _build_request(endpoint, user, rng)
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload, headers={"Authorization": f"Bearer bench-user-{user}"})
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - start
+            if ok:
+                samples[endpoint].append(elapsed)
+            else:
+                errors[endpoint] += 1
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout) as client:
+        await asyncio.gather(*(worker(i, client) for i in range(args.concurrency)))
+    wall = time.perf_counter() - started
+
+    endpoints = {}
+    for name in names:
+        values = sorted(samples[name])
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "throughput_rps": len(values) / wall,
+            "mean_ms": statistics.fmean(values) * 1000 if values else 0.0,
+            "p50_ms": _percentile(values, 50) * 1000,
+            "p95_ms": _percentile(values, 95) * 1000,
+            "p99_ms": _percentile(values, 99) * 1000
+        }
+    total = sum(len(v) for v in samples.values())
+    return {
+        "wall_seconds": wall,
+        "total_requests": total,
+        "total_errors": sum(errors.values()),
+        "throughput_rps": total / wall,
+        "endpoints": endpoints
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga end-to-end")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="Segundos de carga")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Pesos por endpoint: analyze,budget_suggest,budget_review,chat")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--history-size", type=int, default=200, help="Transacciones por usuario sintético")
+    parser.add_argument("--goal-count", type=int, default=3)
+    parser.add_argument("--upstream-latency-ms", type=float, default=20.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=500.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--output-tokens", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=1, help="Workers de uvicorn para la app")
+    parser.add_argument("--database-url", default=None, help="Por defecto SQLite temporal")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default="bench_results/load.json")
+    args = parser.parse_args()
+
+    openai_port = _free_port()
+    upstream_port = _free_port()
+    app_port = _free_port()
+    _serve_in_thread(create_openai_app(args.llm_latency_ms, args.llm_jitter_ms, args.output_tokens), openai_port)
+    _serve_in_thread(create_upstream_app(args.history_size, args.goal_count, args.upstream_latency_ms), upstream_port)
+
+    workdir = tempfile.mkdtemp(prefix="finzen-bench-")
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_API_BASE": f"http://127.0.0.1:{openai_port}/v1",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "DATABASE_URL": args.database_url or f"sqlite:///{workdir}/bench.db",
+        "TRANSACTIONS_SERVICE_URL": f"http://127.0.0.1:{upstream_port}/api",
+        "GOALS_SERVICE_URL": f"http://127.0.0.1:{upstream_port}/api"
+    }
+    # El esquema se crea con las migraciones, igual que en despliegue
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], env=env, check=True, stdout=subprocess.DEVNULL)
+    started = time.perf_counter()
+    app_process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1",
+         "--port", str(app_port), "--workers", str(args.workers), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        for _ in range(300):
+            try:
+                if httpx.get(f"{base_url}/ready", timeout=1.0).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        else:
+            raise RuntimeError("La app no respondió en /ready")
+        startup_seconds = time.perf_counter() - started
+
+        results = asyncio.run(_drive(base_url, args, _parse_mix(args.mix)))
+    finally:
+        app_process.terminate()
+        app_process.wait(timeout=10)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "config": vars(args),
+        "startup_seconds": startup_seconds,
+        "results": results
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"{'endpoint':<16}{'req':>8}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results["endpoints"].items():
+        print(f"{name:<16}{r['requests']:>8}{r['errors']:>6}{r['throughput_rps']:>9.2f}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+    print(f"Startup (hasta /ready): {startup_seconds:.2f}s")
+    print(f"Total: {results['total_requests']} requests, {results['throughput_rps']:.2f} rps -> {args.output}")
+
+if __name__ == "__main__":
+    main()
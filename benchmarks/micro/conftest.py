@@ -0,0 +1,109 @@
+"""
+Configuración de los microbenchmarks (pytest-benchmark).
+
+Uso (desde la raíz del repo):
+    pip install -r requirements-bench.txt
+    pytest benchmarks/micro --benchmark-only --benchmark-json bench_results/micro.json
+
+BENCH_MAX_SIZE limita el tamaño máximo de entrada (por defecto 1,000,000).
+"""
+import os
+import random
+import tracemalloc
+from datetime import date, timedelta
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+# Los agentes leen settings al importarse; no se usan servicios externos
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+# Importar los módulos crea el engine: SQLite en memoria (los benchmarks no consultan la BD)
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("TRANSACTIONS_SERVICE_URL", "http://localhost")
+os.environ.setdefault("GOALS_SERVICE_URL", "http://localhost")
+
+ALL_SIZES = [100, 1_000, 10_000, 100_000, 1_000_000]
+MAX_SIZE = int(os.environ.get("BENCH_MAX_SIZE", ALL_SIZES[-1]))
+SIZES = [n for n in ALL_SIZES if n <= MAX_SIZE]
+
+DESCRIPTIONS = ["UBER *TRIP", "Cafe Juan Valdez", "Tienda D1", "Netflix.com", "RAPPI*RESTAURANTE", "Arriendo"]
+
+def _raw_transactions(n: int) -> list:
+    rng = random.Random(n)
+    start = date(2024, 1, 1)
+    return [
+        {
+            "id": i,
+            "amount": float(rng.randint(1_000, 300_000)),
+            "description": f"{rng.choice(DESCRIPTIONS)} {rng.randint(1000, 9999)}",
+            "date": (start + timedelta(days=rng.randint(0, 365))).isoformat(),
+            "type": "INCOME" if rng.random() < 0.05 else "EXPENSE",
+            "categoryId": rng.randint(1, 10)
+        }
+        for i in range(n)
+    ]
+
+_cache = {}
+
+@pytest.fixture(params=SIZES, ids=lambda n: f"n={n}")
+def size(request):
+    return request.param
+
+@pytest.fixture
+def raw_transactions(size):
+    """Respuesta JSON simulada de /transactions con `size` elementos"""
+    key = ("raw", size)
+    if key not in _cache:
+        _cache.clear()
+        _cache[key] = _raw_transactions(size)
+    return _cache[key]
+
+@pytest.fixture
+def transactions(raw_transactions):
+    """Transacciones ya convertidas a dict (como las reciben los agentes)"""
+    return [
+        {
+            "id": t["id"],
+            "amount": t["amount"],
+            "description": t["description"],
+            "date": t["date"],
+            "type": t["type"],
+            "category_id": t["categoryId"]
+        }
+        for t in raw_transactions
+    ]
+
+@pytest.fixture
+def goals(size):
+    rng = random.Random(size)
+    return [
+        {
+            "id": i,
+            "name": f"Meta {i}",
+            "target_amount": float(rng.randint(1, 100) * 100_000),
+            "saved_amount": float(rng.randint(0, 100) * 50_000),
+            "category": "OTHER",
+            "due_date": "2026-12-31",
+            "status": "ACTIVE"
+        }
+        for i in range(size)
+    ]
+
+@pytest.fixture
+def run(benchmark, size):
+    """
+    Ejecuta `func(*args)` con pytest-benchmark (menos rondas para entradas
+    grandes) y registra el pico de memoria en `extra_info`.
+    """
+    def _run(func, *args):
+        tracemalloc.start()
+        try:
+            func(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["size"] = size
+        benchmark.extra_info["peak_memory_mb"] = round(peak / 1024 / 1024, 3)
+        rounds = 20 if size <= 10_000 else 3
+        return benchmark.pedantic(func, args=args, rounds=rounds, iterations=1, warmup_rounds=1)
+    return _run
@@ -0,0 +1,75 @@
+"""
+Microbenchmarks de los caminos de CPU que se ejecutan por request.
+"""
+from datetime import date
+from src.config import settings
+from src.clients.upstream import parse_transactions
+from src.agents.financial_analyzer import (
+    filter_small_expenses,
+    summarize_recent_transactions,
+    format_small_expenses
+)
+from src.agents.budget_advisor import filter_category_transactions, format_category_transactions
+from src.agents.goal_analyzer import format_goal_projection
+from src.analytics.goal_projection import project_goals
+from src.analytics.goal_viability import evaluate_goal_viability
+from src.analytics.budget_forecast import forecast_budget
+from src.analytics.merchants import MerchantIndex, normalize_description, group_by_merchant
+
+def test_parse_transactions(run, raw_transactions):
+    """JSON de /transactions -> TransactionInput (fetch_transactions)"""
+    result = run(parse_transactions, raw_transactions)
+    assert len(result) == len(raw_transactions)
+
+def test_transactions_model_dump(run, raw_transactions):
+    """TransactionInput -> dict antes de llamar a los agentes (/analyze)"""
+    parsed = parse_transactions(raw_transactions)
+    run(lambda items: [t.model_dump() for t in items], parsed)
+
+def test_filter_small_expenses(run, transactions):
+    run(filter_small_expenses, transactions, settings.ANT_EXPENSE_THRESHOLD)
+
+def test_ant_expenses_prompt_text(run, transactions):
+    """Filtro de gastos hormiga + texto del prompt (_analyze_ant_expenses)"""
+    run(lambda txs: format_small_expenses(filter_small_expenses(txs, settings.ANT_EXPENSE_THRESHOLD)), transactions)
+
+def test_health_prompt_text(run, transactions):
+    """Texto del prompt de _analyze_health"""
+    run(summarize_recent_transactions, transactions)
+
+def test_leaks_prompt_text(run, transactions):
+    """str(transactions[-30:]) de _analyze_leaks"""
+    run(lambda txs: str(txs[-30:]), transactions)
+
+def test_merchant_grouping(run, transactions):
+    """Descripción -> merchant_id con los alias ya resueltos + agrupación por comercio"""
+    index = MerchantIndex()
+    for t in transactions:
+        index.assign(normalize_description(t["description"]))
+
+    def canonicalize(txs):
+        return group_by_merchant([{**t, "merchant_id": index.aliases[normalize_description(t["description"])]} for t in txs])
+
+    groups = run(canonicalize, transactions)
+    assert len(groups) <= len(index.names)
+
+def test_review_budget_filter(run, transactions):
+    """Filtro por categoría y fechas + texto del prompt (review_budget)"""
+    run(
+        lambda txs: format_category_transactions(filter_category_transactions(txs, 3, "2024-03-01", "2024-03-31")),
+        transactions
+    )
+
+def test_review_budget_forecast(run, transactions):
+    """Pronóstico del gasto al cierre del periodo (review_budget)"""
+    category = filter_category_transactions(transactions, 3)
+    run(lambda txs: forecast_budget(txs, 500_000, 200_000, "2024-12-01", "2024-12-31", today=date(2024, 12, 10)), category)
+
+def test_track_goals_projection(run, goals):
+    """Proyección y reparto del excedente en _track_goals (motor local + texto del prompt)"""
+    run(lambda gs: format_goal_projection(project_goals(gs, 2_000_000)["goals_status"]), goals)
+
+def test_evaluate_goal_simulation(run, transactions):
+    """Historial mensual + simulación Monte Carlo de _evaluate_goal (10k trayectorias)"""
+    result = run(evaluate_goal_viability, "es viable ahorrar 5 millones en 12 meses", transactions, [], {"month_surplus": 500_000})
+    assert result["simulation"]["paths"] == settings.GOAL_SIMULATION_PATHS
@@ -0,0 +1,49 @@
+"""Esquema inicial: memoria episódica y perfil semántico
+
+Las bases existentes ya tienen estas tablas (antes se creaban con
+create_all al importar la app), así que solo se crean si faltan.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "episodic_memory" not in existing:
+        op.create_table(
+            "episodic_memory",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("query", sa.String(), nullable=False),
+            sa.Column("agent_used", sa.String(), nullable=False),
+            sa.Column("response", sa.JSON(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False)
+        )
+        op.create_index("ix_episodic_memory_id", "episodic_memory", ["id"])
+        op.create_index("ix_episodic_memory_user_id", "episodic_memory", ["user_id"])
+        op.create_index("idx_user_created", "episodic_memory", ["user_id", "created_at"])
+
+    if "semantic_profile" not in existing:
+        op.create_table(
+            "semantic_profile",
+            sa.Column("user_id", sa.Integer(), primary_key=True),
+            sa.Column("attributes", sa.JSON(), nullable=False),
+            sa.Column("last_updated", sa.DateTime(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False)
+        )
+
+def downgrade() -> None:
+    op.drop_table("semantic_profile")
+    op.drop_index("idx_user_created", table_name="episodic_memory")
+    op.drop_index("ix_episodic_memory_user_id", table_name="episodic_memory")
+    op.drop_index("ix_episodic_memory_id", table_name="episodic_memory")
+    op.drop_table("episodic_memory")
@@ -0,0 +1,41 @@
+"""Tabla cache_entries (nivel L2 de la caché compartida)
+
+En Postgres se crea UNLOGGED: no escribe WAL, así que las escrituras son más
+baratas y la tabla se vacía tras una caída, lo cual es aceptable para una caché.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("""
+            CREATE UNLOGGED TABLE cache_entries (
+                namespace VARCHAR NOT NULL,
+                key VARCHAR NOT NULL,
+                value TEXT NOT NULL,
+                expires_at FLOAT NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+    else:
+        op.create_table(
+            "cache_entries",
+            sa.Column("namespace", sa.String(), primary_key=True),
+            sa.Column("key", sa.String(), primary_key=True),
+            sa.Column("value", sa.Text(), nullable=False),
+            sa.Column("expires_at", sa.Float(), nullable=False)
+        )
+    op.create_index("idx_cache_entries_expires_at", "cache_entries", ["expires_at"])
+
+def downgrade() -> None:
+    op.drop_index("idx_cache_entries_expires_at", table_name="cache_entries")
+    op.drop_table("cache_entries")
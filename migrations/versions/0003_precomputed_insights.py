@@ -0,0 +1,26 @@
+"""Tabla precomputed_insights (insights del dashboard ya calculados)
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        "precomputed_insights",
+        sa.Column("user_id", sa.Integer(), primary_key=True),
+        sa.Column("data_version", sa.String(), nullable=False),
+        sa.Column("analysis_type", sa.String(), nullable=False),
+        sa.Column("result", sa.JSON(), nullable=False),
+        sa.Column("computed_at", sa.DateTime(), nullable=False)
+    )
+
+def downgrade() -> None:
+    op.drop_table("precomputed_insights")
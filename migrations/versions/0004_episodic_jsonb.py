@@ -0,0 +1,51 @@
+"""episodic_memory: response a JSONB y campos promovidos
+
+En Postgres `response` pasa de JSON a JSONB (binario, sin re-parsear al leer
+campos). message, health_score y health_status se copian a columnas propias
+para que /chat y los listados no tengan que leer el JSON completo.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    postgres = op.get_bind().dialect.name == "postgresql"
+    if postgres:
+        op.execute("ALTER TABLE episodic_memory ALTER COLUMN response TYPE JSONB USING response::jsonb")
+
+    op.add_column("episodic_memory", sa.Column("message", sa.Text(), nullable=True))
+    op.add_column("episodic_memory", sa.Column("health_score", sa.Float(), nullable=True))
+    op.add_column("episodic_memory", sa.Column("health_status", sa.String(), nullable=True))
+
+    # Relleno de las filas existentes (health_score solo si es numérico)
+    if postgres:
+        op.execute("""
+            UPDATE episodic_memory SET
+                message = response->>'message',
+                health_score = CASE WHEN jsonb_typeof(response->'health_score') = 'number'
+                                    THEN (response->>'health_score')::float END,
+                health_status = response->>'health_status'
+        """)
+    else:
+        op.execute("""
+            UPDATE episodic_memory SET
+                message = json_extract(response, '$.message'),
+                health_score = CASE WHEN json_type(response, '$.health_score') IN ('integer', 'real')
+                                    THEN json_extract(response, '$.health_score') END,
+                health_status = json_extract(response, '$.health_status')
+        """)
+
+def downgrade() -> None:
+    op.drop_column("episodic_memory", "health_status")
+    op.drop_column("episodic_memory", "health_score")
+    op.drop_column("episodic_memory", "message")
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE episodic_memory ALTER COLUMN response TYPE JSON USING response::json")
@@ -0,0 +1,36 @@
+"""Tabla llm_usage (registro de uso del LLM por llamada)
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        "llm_usage",
+        sa.Column("id", sa.BigInteger().with_variant(sa.Integer(), "sqlite"), primary_key=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("endpoint", sa.String(), nullable=True),
+        sa.Column("analyzer", sa.String(), nullable=False),
+        sa.Column("method", sa.String(), nullable=False),
+        sa.Column("model", sa.String(), nullable=False),
+        sa.Column("prompt_tokens", sa.Integer(), nullable=False),
+        sa.Column("completion_tokens", sa.Integer(), nullable=False),
+        sa.Column("cached_tokens", sa.Integer(), nullable=False),
+        sa.Column("latency_ms", sa.Integer(), nullable=False)
+    )
+    op.create_index("idx_llm_usage_created_at", "llm_usage", ["created_at"], postgresql_using="brin")
+    op.create_index("idx_llm_usage_user_created", "llm_usage", ["user_id", "created_at"])
+
+def downgrade() -> None:
+    op.drop_index("idx_llm_usage_user_created", table_name="llm_usage")
+    op.drop_index("idx_llm_usage_created_at", table_name="llm_usage")
+    op.drop_table("llm_usage")
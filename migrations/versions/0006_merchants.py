@@ -0,0 +1,33 @@
+"""Tablas merchants y merchant_aliases (canonicalización de comercios)
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        "merchants",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False)
+    )
+    op.create_table(
+        "merchant_aliases",
+        sa.Column("description", sa.String(), primary_key=True),
+        sa.Column("merchant_id", sa.Integer(), sa.ForeignKey("merchants.id"), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False)
+    )
+    op.create_index("ix_merchant_aliases_merchant_id", "merchant_aliases", ["merchant_id"])
+
+def downgrade() -> None:
+    op.drop_index("ix_merchant_aliases_merchant_id", table_name="merchant_aliases")
+    op.drop_table("merchant_aliases")
+    op.drop_table("merchants")
@@ -0,0 +1,122 @@
+"""
+Control de admisión (load shedding) de los endpoints caros.
+
+Los endpoints de ADMISSION_SHED_PATHS (/budget/*) esperan al LLM; si la
+latencia del LLM sube, se acumulan en el worker hasta que el cliente se
+rinde y todo ese trabajo se pierde. AdmissionMiddleware los rechaza de
+entrada con 503 + Retry-After cuando:
+- hay ADMISSION_MAX_IN_FLIGHT requests caros en curso, o
+- la cola interactiva del gateway LLM llegó a ADMISSION_MAX_LLM_QUEUE.
+
+/analyze no se filtra por ruta: las consultas de dashboard con insight
+precalculado no llaman al LLM y se siguen sirviendo con sobrecarga. El
+handler pasa por admission.admit() solo cuando va a correr los agentes.
+
+Así los requests admitidos terminan a tiempo (el goodput se mantiene) y el
+resto de los endpoints (/health, /ready, /profile, /history, /metrics,
+lecturas de administración) sigue respondiendo.
+"""
+import math
+from contextlib import asynccontextmanager
+from typing import Optional, Tuple
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from src.config import settings
+from src.llm.gateway import gateway
+from src.observability.metrics import ADMISSION_IN_FLIGHT, ADMISSION_SHED
+
+def is_sheddable(path: str) -> bool:
+    """Rutas de ADMISSION_SHED_PATHS: exactas, o prefijos si terminan en '/'"""
+    return any(
+        path.startswith(entry) if entry.endswith("/") else path == entry
+        for entry in settings.ADMISSION_SHED_PATHS
+    )
+
+class AdmissionController:
+
+    def __init__(self):
+        self.in_flight = 0
+
+    def overload(self) -> Tuple[Optional[str], float]:
+        """(motivo, carga relativa) si hay que rechazar; (None, carga) si se admite"""
+        load, reason = 0.0, None
+        limits = (
+            ("in_flight", self.in_flight, settings.ADMISSION_MAX_IN_FLIGHT),
+            ("llm_queue", gateway.interactive_queue_depth, settings.ADMISSION_MAX_LLM_QUEUE)
+        )
+        for name, current, limit in limits:
+            if limit <= 0:
+                continue
+            ratio = current / limit
+            if ratio >= 1 and ratio > load:
+                reason = name
+            load = max(load, ratio)
+        return reason, load
+
+    def retry_after(self, load: float) -> int:
+        """Segundos sugeridos al cliente: ADMISSION_RETRY_AFTER_S escalado por la sobrecarga"""
+        return min(math.ceil(settings.ADMISSION_RETRY_AFTER_S * max(load, 1.0)), settings.ADMISSION_MAX_RETRY_AFTER_S)
+
+    def shed(self, path: str) -> Optional[int]:
+        """Retry-After (segundos) si hay que rechazar el request; None si se admite"""
+        reason, load = self.overload()
+        if reason is None:
+            return None
+        ADMISSION_SHED.labels(reason).inc()
+        retry_after = self.retry_after(load)
+        print(f" Shedding {path} ({reason}, load {load:.2f}), retry after {retry_after}s")
+        return retry_after
+
+    @asynccontextmanager
+    async def track(self):
+        """Cuenta el trabajo caro en curso"""
+        self.in_flight += 1
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            ADMISSION_IN_FLIGHT.set(self.in_flight)
+
+    @asynccontextmanager
+    async def admit(self, path: str):
+        """
+        Admisión dentro del handler, alrededor del trabajo que usa el LLM:
+        HTTPException 503 + Retry-After si hay sobrecarga.
+        """
+        if not settings.ADMISSION_ENABLED:
+            yield
+            return
+        retry_after = self.shed(path)
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=503,
+                detail="Service overloaded, retry later",
+                headers={"Retry-After": str(retry_after)}
+            )
+        async with self.track():
+            yield
+
+admission = AdmissionController()
+
+class AdmissionMiddleware:
+    """Middleware ASGI: cuenta los requests caros en curso y rechaza los que exceden la capacidad"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.ADMISSION_ENABLED or not is_sheddable(scope["path"]):
+            return await self.app(scope, receive, send)
+
+        retry_after = admission.shed(scope["path"])
+        if retry_after is not None:
+            response = JSONResponse(
+                {"detail": "Service overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(retry_after)}
+            )
+            return await response(scope, receive, send)
+
+        async with admission.track():
+            await self.app(scope, receive, send)
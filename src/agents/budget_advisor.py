@@ -1,9 +1,137 @@
-from typing import Dict, List
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
+from typing import Dict, List, Optional
 from src.config import settings
+from src.llm.chain import invoke_json_chain
+from src.llm.provider import create_chat_model
+from src.llm.prompts import prompts
+from src.llm.structured import LLMOutput, Amount, TextList, choice
+from src.observability.metrics import record_fallback
+from src.agents import fallbacks
 from src.agents.financial_analyzer import FinancialAnalyzer
+from src.analytics.budget_forecast import forecast_budget
+
+def filter_category_transactions(transactions: List[Dict], category_id, start_date: str = None, end_date: str = None) -> List[Dict]:
+    """Transacciones de la categoría, opcionalmente limitadas al periodo [start_date, end_date]"""
+    if start_date is None or end_date is None:
+        return [t for t in transactions if t.get("category_id") == category_id]
+    return [
+        t for t in transactions
+        if t.get("category_id") == category_id 
+        and start_date <= t.get("date", "") <= end_date
+    ]
+
+def format_forecast(forecast: Optional[Dict]) -> str:
+    """Texto del pronóstico para el prompt"""
+    if forecast is None:
+        return "(sin pronóstico: fechas del presupuesto inválidas)"
+    return "\n".join([
+        f"- status: {forecast['status']}",
+        f"- Probabilidad de pasarse del presupuesto: {forecast['overrun_probability'] * 100:.0f}%",
+        f"- Gasto proyectado al cierre (p10 / p50 / p90): ${forecast['projected_spend_p10']} / ${forecast['projected_spend_p50']} / ${forecast['projected_spend_p90']}",
+        f"- Días restantes: {forecast['remaining_days']} | gasto diario disponible: ${forecast['daily_allowance']}",
+        f"- Día de la semana con más gasto: {forecast['busiest_weekday'] or 'sin datos'}"
+    ])
+
+def format_category_transactions(cat_tx: List[Dict], limit: int = 20) -> str:
+    """Texto con las últimas `limit` transacciones de la categoría"""
+    return "\n".join([
+        f"- {t.get('description', 'Sin descripción')}: ${t.get('amount', 0)} ({t.get('date', '')})" 
+        for t in cat_tx[-limit:]
+    ])
+
+# --- Esquemas de salida ---
+
+class SuggestBudgetOutput(LLMOutput):
+    suggested_amount: Amount
+    start_date: str = ""
+    end_date: str = ""
+    description: str = ""
+    tip: str = ""
+
+class ReviewBudgetOutput(LLMOutput):
+    status: choice("bien", "regular", "mal")
+    tips: TextList = []
+    analysis: str = ""
+    patterns: TextList = []
+    suggested_changes: TextList = []
+
+SUGGEST_BUDGET_PROMPT = prompts.register("suggest_budget", "2", instructions="""
+    Eres un asesor experto en presupuestos personales.
+    El usuario está creando una nueva categoría de presupuesto.
+
+    SUGIERE:
+    1. Un monto de presupuesto recomendado para la categoría (basado en hábitos y salud financiera)
+    2. Una explicación clara del porqué de ese monto
+    3. Un tip práctico para cumplirlo
+
+    En start_date y end_date devuelve las fechas de la categoría tal como se reciben.
+
+    RESPONDE SOLO EN JSON:
+    {{
+    "suggested_amount": float,
+    "start_date": "YYYY-MM-DD",
+    "end_date": "YYYY-MM-DD",
+    "description": "...",
+    "tip": "..."
+    }}
+""", data="""
+    DATOS DE LA CATEGORÍA:
+    - ID: {category_id}
+    - NOMBRE: {category_name}
+    - Fecha inicio: {start_date}
+    - Fecha fin: {end_date}
+
+    ANÁLISIS FINANCIERO DEL USUARIO:
+    {analysis}
+
+    PERFIL DEL USUARIO:
+    {profile}
+
+    TRANSACCIONES RELEVANTES:
+    {transactions}
+""", output=SuggestBudgetOutput)
+
+REVIEW_BUDGET_PROMPT = prompts.register("review_budget", "3", instructions="""
+    Eres un asesor de presupuestos.
+    El usuario tiene un presupuesto activo para una categoría.
+
+    El PRONÓSTICO ya calcula si va a cumplir el presupuesto ("bien", "regular", "mal")
+    a partir de su ritmo de gasto por día de la semana: devuelve ese status tal cual.
+
+    Analiza:
+    1. Explica el pronóstico en palabras sencillas
+    2. Da tips para cumplirlo (usa el gasto diario disponible y los días de más gasto)
+    3. Analiza si los patrones de gasto son saludables o no
+    4. Sugiere cambios para mejorar
+
+    RESPONDE SOLO EN JSON:
+    {{
+    "status": "bien|regular|mal",
+    "tips": ["..."],
+    "analysis": "...",
+    "patterns": ["..."],
+    "suggested_changes": ["..."]
+    }}
+""", data="""
+    DATOS DEL PRESUPUESTO:
+    - category_id: {category_id}
+    - monto: ${amount}
+    - fecha inicio: {start_date}
+    - fecha fin: {end_date}
+    - gastado hasta ahora: ${spent}
+    - restante: ${remaining}
+
+    PRONÓSTICO:
+    {forecast}
+
+    CONTEXTO FINANCIERO:
+    {financial_context}
+
+    PERFIL DEL USUARIO:
+    {profile}
+
+    TRANSACCIONES DE LA CATEGORÍA:
+    {transactions}
+""", output=ReviewBudgetOutput)
 
 class BudgetAdvisor:
     """
@@ -12,13 +140,10 @@ class BudgetAdvisor:
     Usa el análisis financiero del usuario y su perfil para personalizar recomendaciones.
     """
 
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            api_key=settings.OPENAI_API_KEY,
-            model=settings.OPENAI_MODEL,
-            temperature=settings.OPENAI_TEMPERATURE
-        )
-        self.financial_analyzer = FinancialAnalyzer()
+    def __init__(self, financial_analyzer: Optional[FinancialAnalyzer] = None):
+        self.llm = create_chat_model()
+        # Se reutiliza el FinancialAnalyzer de la app si se recibe
+        self.financial_analyzer = financial_analyzer or FinancialAnalyzer()
 
     async def suggest_budget(self, category_id: int, category_name: str, transactions: List[Dict], financial_context: Dict, semantic_profile: Dict, start_date: str, end_date: str) -> Dict:
         """
@@ -33,50 +158,12 @@ class BudgetAdvisor:
             semantic_profile=semantic_profile
         )
 
-        prompt = ChatPromptTemplate.from_template("""
-            Eres un asesor experto en presupuestos personales.
-            El usuario está creando una nueva categoría de presupuesto.
-
-            DATOS DE LA CATEGORÍA:
-            - ID: {category_id}
-            - NOMBRE: {category_name}
-            - Fecha inicio: {start_date}
-            - Fecha fin: {end_date}
-
-            ANÁLISIS FINANCIERO DEL USUARIO:
-            {analysis}
-
-            TRANSACCIONES RELEVANTES:
-            {transactions}
-
-            PERFIL DEL USUARIO:
-            {profile}
-
-            SUGIERE:
-            1. Un monto de presupuesto recomendado para la categoría (basado en hábitos y salud financiera)
-            2. Una explicación clara del porqué de ese monto
-            3. Un tip práctico para cumplirlo
-
-            RESPONDE SOLO EN JSON:
-            {{
-            "suggested_amount": float,
-            "start_date": "{start_date}",
-            "end_date": "{end_date}",
-            "description": "...",
-            "tip": "..."
-            }}
-        """)
-
         # Filtrar transacciones de la categoría
-        cat_tx = [t for t in transactions if t.get("category_id") == category_id]
-        tx_text = "\n".join([
-            f"- {t.get('description', 'Sin descripción')}: ${t.get('amount', 0)} ({t.get('date', '')})" 
-            for t in cat_tx[-20:]
-        ])
+        cat_tx = filter_category_transactions(transactions, category_id)
+        tx_text = format_category_transactions(cat_tx)
 
         try:
-            chain = prompt | self.llm | JsonOutputParser()
-            result = await chain.ainvoke({
+            result = await invoke_json_chain(SUGGEST_BUDGET_PROMPT, self.llm, {
                 "category_id": category_id,
                 "category_name": category_name,
                 "start_date": start_date,
@@ -84,17 +171,11 @@ class BudgetAdvisor:
                 "analysis": str(analysis),
                 "transactions": tx_text,
                 "profile": str(semantic_profile)
-            })
+            }, "budget_advisor", "suggest_budget")
             return result
         except Exception as e:
-            return {
-                "suggested_amount": 0,
-                "start_date": start_date,
-                "end_date": end_date,
-                "description": "No se pudo sugerir un monto.",
-                "tip": "Revisa tus hábitos de gasto.",
-                "error": str(e)
-            }
+            record_fallback("budget_advisor", "suggest_budget")
+            return fallbacks.suggest_budget_fallback(cat_tx, start_date, end_date, e)
 
     async def review_budget(
         self, 
@@ -113,76 +194,35 @@ class BudgetAdvisor:
         end_date = budget.get("end_date")
 
         # Filtrar transacciones de la categoría y periodo
-        cat_tx = [
-            t for t in transactions
-            if t.get("category_id") == category_id 
-            and start_date <= t.get("date", "") <= end_date
-        ]
+        cat_tx = filter_category_transactions(transactions, category_id, start_date, end_date)
         spent = sum(t.get("amount", 0) for t in cat_tx)
         remaining = amount - spent
 
-        prompt = ChatPromptTemplate.from_template("""
-            Eres un asesor de presupuestos.
-            El usuario tiene un presupuesto activo para una categoría.
-
-            DATOS DEL PRESUPUESTO:
-            - category_id: {category_id}
-            - monto: ${amount}
-            - fecha inicio: {start_date}
-            - fecha fin: {end_date}
-            - gastado hasta ahora: ${spent}
-            - restante: ${remaining}
-
-            TRANSACCIONES DE LA CATEGORÍA:
-            {transactions}
-
-            CONTEXTO FINANCIERO:
-            {financial_context}
-
-            PERFIL DEL USUARIO:
-            {profile}
-
-            Analiza:
-            1. ¿El usuario va a cumplir el presupuesto antes de la fecha de fin? ("bien", "regular", "mal")
-            2. Da tips para cumplirlo
-            3. Analiza si los patrones de gasto son saludables o no
-            4. Sugiere cambios para mejorar
-
-            RESPONDE SOLO EN JSON:
-            {{
-            "status": "bien|regular|mal",
-            "tips": ["..."],
-            "analysis": "...",
-            "patterns": ["..."],
-            "suggested_changes": ["..."]
-            }}
-        """)
-
-        tx_text = "\n".join([
-            f"- {t.get('description', 'Sin descripción')}: ${t.get('amount', 0)} ({t.get('date', '')})" 
-            for t in cat_tx[-20:]
-        ])
+        tx_text = format_category_transactions(cat_tx)
+
+        # El estado sale del pronóstico local; el LLM solo redacta tips y análisis
+        forecast = forecast_budget(
+            filter_category_transactions(transactions, category_id),
+            amount, spent, start_date, end_date
+        )
 
         try:
-            chain = prompt | self.llm | JsonOutputParser()
-            result = await chain.ainvoke({
+            result = await invoke_json_chain(REVIEW_BUDGET_PROMPT, self.llm, {
                 "category_id": category_id,
                 "amount": amount,
                 "start_date": start_date,
                 "end_date": end_date,
                 "spent": spent,
                 "remaining": remaining,
+                "forecast": format_forecast(forecast),
                 "transactions": tx_text,
                 "financial_context": str(financial_context),
                 "profile": str(semantic_profile)
-            })
+            }, "budget_advisor", "review_budget")
+            if forecast is not None:
+                result["status"] = forecast["status"]
+                result["forecast"] = forecast
             return result
         except Exception as e:
-            return {
-                "status": "mal",
-                "tips": ["Revisa tus gastos y ajusta tus hábitos."],
-                "analysis": "No se pudo analizar el presupuesto.",
-                "patterns": [],
-                "suggested_changes": [],
-                "error": str(e)
-            }
\ No newline at end of file
+            record_fallback("budget_advisor", "review_budget")
+            return fallbacks.review_budget_fallback(amount, spent, start_date, end_date, forecast, e)
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+Respuestas de respaldo calculadas localmente.
+
+Se usan cuando la llamada al LLM falla o agota su presupuesto de tiempo:
+en vez de placeholders, devuelven métricas exactas calculadas con los datos
+del usuario (totales por categoría, progreso de metas, gasto del presupuesto)
+y se marcan con `degraded: True`.
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional
+from src.config import settings
+from src.analytics.merchants import group_by_merchant
+
+def _expenses(transactions: List[Dict]) -> List[Dict]:
+    return [t for t in transactions if t.get("type", "EXPENSE") == "EXPENSE"]
+
+def category_totals(transactions: List[Dict], top: int = 5) -> List[Dict]:
+    """Gasto por categoría (monto y porcentaje del total), de mayor a menor"""
+    totals: Dict = defaultdict(float)
+    for t in _expenses(transactions):
+        totals[t.get("category_id")] += float(t.get("amount", 0) or 0)
+    grand_total = sum(totals.values())
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [
+        {
+            "category_id": category_id,
+            "amount": round(amount, 2),
+            "percentage": round(amount / grand_total * 100, 1) if grand_total else 0.0
+        }
+        for category_id, amount in ranked
+    ]
+
+def _degraded(payload: Dict, error: Exception) -> Dict:
+    return {**payload, "degraded": True, "error": str(error)}
+
+def health_score(financial_context: Dict) -> Optional[Dict]:
+    """
+    Puntaje determinista a partir de la tasa de ahorro (excedente / ingreso):
+    0% -> 50, 20% o más -> 90+, déficit del 25% o más -> 0. None sin ingreso.
+    """
+    income = float(financial_context.get("monthly_income", 0) or 0)
+    if income <= 0:
+        return None
+    surplus = float(financial_context.get("month_surplus", 0) or 0)
+    expenses = float(financial_context.get("fixed_expenses", 0) or 0) + float(financial_context.get("variable_expenses", 0) or 0)
+    savings_rate = surplus / income
+    score = int(round(min(max(50 + savings_rate * 200, 0), 100)))
+    status = "excellent" if score >= 85 else "good" if score >= 70 else "fair" if score >= 50 else "poor"
+    return {
+        "health_score": score,
+        "health_status": status,
+        "savings_rate": round(savings_rate, 3),
+        "expense_ratio": round(expenses / income, 3)
+    }
+
+def health_fallback(transactions: List[Dict], financial_context: Dict, error: Exception) -> Dict:
+    metrics = health_score(financial_context)
+    if metrics is None:
+        metrics = {"health_score": None, "health_status": None}
+        message = "No se pudo completar el análisis y no tenemos tu ingreso para calcular un puntaje. Te mostramos un resumen de tus gastos por categoría."
+    else:
+        message = (
+            f"No se pudo completar el análisis con IA. Con tus números, ahorras el {metrics['savings_rate'] * 100:.0f}% "
+            f"de tu ingreso (puntaje {metrics['health_score']}/100). Te mostramos un resumen de tus gastos por categoría."
+        )
+    return _degraded({
+        **metrics,
+        "monthly_surplus": financial_context.get("month_surplus", 0),
+        "top_spending_categories": category_totals(transactions),
+        "message": message
+    }, error)
+
+def ant_expenses_fallback(transactions: List[Dict], error: Exception) -> Dict:
+    small = [
+        t for t in _expenses(transactions)
+        if t.get("amount", 0) < settings.ANT_EXPENSE_THRESHOLD
+    ]
+    total = round(sum(float(t.get("amount", 0) or 0) for t in small), 2)
+    return _degraded({
+        "ant_expenses": [],
+        "total_small_expenses": total,
+        "small_expense_count": len(small),
+        "top_spending_categories": category_totals(small),
+        "message": (
+            f"No se pudo completar el análisis de gastos hormiga; encontramos {len(small)} gasto{'s' if len(small) != 1 else ''} pequeño{'s' if len(small) != 1 else ''} por ${total:,.0f}. "
+            "Te mostramos en qué categorías se concentran."
+            if small else "No se pudo completar el análisis de gastos hormiga, y no encontramos gastos pequeños en tus transacciones."
+        )
+    }, error)
+
+def leaks_fallback(transactions: List[Dict], error: Exception) -> Dict:
+    return _degraded({
+        "money_leaks": [],
+        "top_spending_categories": category_totals(transactions),
+        "message": "No se pudo completar el análisis de fugas de dinero. Te mostramos tus categorías de mayor gasto para que las revises."
+    }, error)
+
+def repetitive_fallback(transactions: List[Dict], error: Exception) -> Dict:
+    """Gastos del mismo comercio (merchant_id, o descripción normalizada) que se repiten"""
+    repeated = []
+    for key, items in group_by_merchant(_expenses(transactions)).items():
+        if not key or len(items) < 2:
+            continue
+        amounts = [float(t.get("amount", 0) or 0) for t in items]
+        repeated.append({
+            "description": items[0].get("merchant") or key,
+            "merchant_id": items[0].get("merchant_id"),
+            "occurrences": len(amounts),
+            "average_amount": round(sum(amounts) / len(amounts), 2)
+        })
+    repeated.sort(key=lambda r: r["occurrences"] * r["average_amount"], reverse=True)
+    return _degraded({
+        "repetitive_expenses": repeated[:10],
+        "message": (
+            f"No se pudo completar el análisis de gastos repetitivos; encontramos compras repetidas en {len(repeated)} comercio{'s' if len(repeated) != 1 else ''}. "
+            "Te mostramos los de mayor impacto."
+            if repeated else "No se pudo completar el análisis de gastos repetitivos, y no encontramos compras repetidas en tus transacciones."
+        )
+    }, error)
+
+def goal_progress(goals: List[Dict]) -> List[Dict]:
+    """Progreso exacto de cada meta"""
+    status = []
+    for goal in goals:
+        saved = goal.get("saved_amount", 0)
+        target = goal.get("target_amount", 0)
+        status.append({
+            "goal_id": goal.get("id"),
+            "name": goal.get("name"),
+            "progress_percentage": round(saved / target * 100, 1) if target > 0 else 0.0,
+            "remaining_amount": round(max(target - saved, 0), 2),
+            "status": "completed" if target > 0 and saved >= target else None
+        })
+    return status
+
+def track_goals_fallback(projection: Dict, error: Exception) -> Dict:
+    """La proyección es local: solo faltan los mensajes del LLM"""
+    return _degraded({
+        **projection,
+        "overall_message": "No se pudo generar el feedback. Esta es la proyección actual de tus metas.",
+        "message": "No se pudo completar el seguimiento."
+    }, error)
+
+def suggest_goals_fallback(goals: List[Dict], financial_context: Dict, error: Exception) -> Dict:
+    return _degraded({
+        "suggested_goals": [],
+        "current_goals": goal_progress(goals),
+        "monthly_surplus": financial_context.get("month_surplus", 0),
+        "message": "No se pudieron generar sugerencias en este momento."
+    }, error)
+
+def evaluate_goal_fallback(goals: List[Dict], financial_context: Dict, viability: Dict, error: Exception) -> Dict:
+    """Si hubo simulación, el veredicto numérico sigue siendo válido sin el LLM"""
+    simulation = viability.get("simulation")
+    payload = {
+        "viable": False,
+        "reason": "No se pudo completar la evaluación.",
+        "income_stability": viability.get("income_stability"),
+        "current_goals": goal_progress(goals),
+        "monthly_surplus": financial_context.get("month_surplus", 0)
+    }
+    if simulation is not None:
+        payload.update({
+            "viable": viability["viable"],
+            "confidence": viability["confidence"],
+            "reason": f"Probabilidad estimada de cumplir la meta a tiempo: {simulation['probability'] * 100:.0f}%.",
+            "suggested_adjustments": simulation["suggested_adjustments"],
+            "simulation": simulation
+        })
+    return _degraded(payload, error)
+
+def _monthly_average(transactions: List[Dict]) -> float:
+    months = {str(t.get("date", ""))[:7] for t in transactions if t.get("date")}
+    total = sum(float(t.get("amount", 0) or 0) for t in transactions)
+    return total / len(months) if months else total
+
+def suggest_budget_fallback(category_transactions: List[Dict], start_date: str, end_date: str, error: Exception) -> Dict:
+    average = _monthly_average(_expenses(category_transactions))
+    return _degraded({
+        "suggested_amount": round(average, 2),
+        "start_date": start_date,
+        "end_date": end_date,
+        "description": "Monto basado en tu gasto mensual promedio en esta categoría." if average else "No se pudo sugerir un monto.",
+        "tip": "Revisa tus hábitos de gasto."
+    }, error)
+
+def _elapsed_fraction(start_date: str, end_date: str, today: Optional[date] = None) -> Optional[float]:
+    try:
+        start = date.fromisoformat(str(start_date)[:10])
+        end = date.fromisoformat(str(end_date)[:10])
+    except ValueError:
+        return None
+    today = today or date.today()
+    total_days = (end - start).days + 1
+    if total_days <= 0:
+        return None
+    return min(max(((today - start).days + 1) / total_days, 0.0), 1.0)
+
+def review_budget_fallback(amount: float, spent: float, start_date: str, end_date: str, forecast: Optional[Dict], error: Exception) -> Dict:
+    """Estado del pronóstico; sin pronóstico (fechas inválidas), por ritmo de gasto"""
+    used = spent / amount if amount else 1.0
+    elapsed = _elapsed_fraction(start_date, end_date)
+    if forecast is not None:
+        status = forecast["status"]
+    elif used > 1:
+        status = "mal"
+    elif elapsed is None or used <= elapsed:
+        status = "bien"
+    else:
+        status = "regular" if used <= min(elapsed * 1.2, 1.0) else "mal"
+    payload = {
+        "status": status,
+        "spent": round(spent, 2),
+        "remaining": round(amount - spent, 2),
+        "used_percentage": round(used * 100, 1),
+        "elapsed_percentage": round(elapsed * 100, 1) if elapsed is not None else None,
+        "tips": ["Revisa tus gastos y ajusta tus hábitos."],
+        "analysis": "No se pudo analizar el presupuesto con IA; el estado se calculó con tu ritmo de gasto.",
+        "patterns": [],
+        "suggested_changes": []
+    }
+    if forecast is not None:
+        payload["forecast"] = forecast
+    return _degraded(payload, error)
@@ -1,8 +1,299 @@
-from typing import Dict, List
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
+from typing import Dict, List, Optional
+from pydantic import model_validator
 from src.config import settings
+from src.llm.chain import invoke_json_chain
+from src.llm.provider import create_chat_model
+from src.llm.prompts import prompts
+from src.llm.structured import LLMOutput, Amount, Number, Count, Score, TextList, Identifier, choice, object_list
+from src.analytics.merchants import summarize_merchants
+from src.memory.merchants import merchant_registry
+from src.observability.metrics import record_route, record_fallback
+from src.agents import fallbacks
+
+def filter_small_expenses(transactions: List[Dict], threshold: float) -> List[Dict]:
+    """Filtra los gastos por debajo del umbral de gasto hormiga"""
+    return [
+        t for t in transactions 
+        if t.get("type") == "EXPENSE" 
+        and t.get("amount", 0) < threshold
+    ]
+
+def summarize_recent_transactions(transactions: List[Dict], limit: int = 15) -> str:
+    """Texto con las últimas `limit` transacciones (descripción, monto, tipo)"""
+    recent_tx = transactions[-limit:] if len(transactions) > limit else transactions
+    return "\n".join([
+        f"- {t.get('description', 'Sin descripción')}: ${t.get('amount', 0)} ({t.get('type', 'EXPENSE')})"
+        for t in recent_tx
+    ])
+
+def format_small_expenses(small_expenses: List[Dict], limit: int = 30) -> str:
+    """Texto con los últimos `limit` gastos pequeños (comercio canónico si lo hay, monto, fecha)"""
+    return "\n".join([
+        f"- {t.get('merchant') or t.get('description')}"
+        + (f" (#{t['merchant_id']})" if t.get("merchant_id") else "")
+        + f": ${t.get('amount')} ({t.get('date')})"
+        for t in small_expenses[-limit:]
+    ])
+
+# --- Esquemas de salida ---
+
+class SpendingCategory(LLMOutput):
+    category_id: Identifier
+    amount: Amount
+    percentage: Number = 0.0
+
+class HealthOutput(LLMOutput):
+    health_score: Score
+    health_status: choice("excellent", "good", "fair", "poor")
+    monthly_surplus: Amount = 0.0
+    income_stability: choice("high", "medium", "low")
+    top_spending_categories: object_list(SpendingCategory) = []
+    risk_flags: TextList = []
+    recommendations: TextList = []
+    message: str
+
+    @model_validator(mode="after")
+    def _status_from_score(self):
+        if self.health_status is None:
+            score = self.health_score
+            self.health_status = "excellent" if score >= 85 else "good" if score >= 70 else "fair" if score >= 50 else "poor"
+        return self
+
+class AntExpense(LLMOutput):
+    pattern_description: str
+    categories: List[Identifier] = []
+    merchant_ids: List[Identifier] = []
+    frequency: choice("daily", "weekly")
+    monthly_estimated_impact: Amount
+    behavioral_signal: choice("habitual", "occasional")
+    transaction_count: Count = 0
+
+class AntExpensesOutput(LLMOutput):
+    ant_expenses: object_list(AntExpense) = []
+    total_monthly_impact: Optional[Amount] = None
+    message: str
+    suggestions: TextList = []
+
+    @model_validator(mode="after")
+    def _total(self):
+        if self.total_monthly_impact is None:
+            self.total_monthly_impact = sum(e.monthly_estimated_impact for e in self.ant_expenses)
+        return self
+
+class MoneyLeak(LLMOutput):
+    category_id: Optional[Identifier] = None
+    detected_pattern: str
+    monthly_impact: Amount
+    severity: choice("high", "medium", "low", default="medium")
+
+class LeaksOutput(LLMOutput):
+    money_leaks: object_list(MoneyLeak) = []
+    total_leak_impact: Optional[Amount] = None
+    message: str
+    action_items: TextList = []
+
+    @model_validator(mode="after")
+    def _total(self):
+        if self.total_leak_impact is None:
+            self.total_leak_impact = sum(l.monthly_impact for l in self.money_leaks)
+        return self
+
+class RepetitiveExpense(LLMOutput):
+    description: str
+    merchant_id: Optional[Identifier] = None
+    frequency: choice("monthly", "weekly")
+    average_amount: Amount
+    annual_cost: Optional[Amount] = None
+    category_id: Optional[Identifier] = None
+    matches_known_pattern: bool = False
+
+    @model_validator(mode="after")
+    def _annual(self):
+        if self.annual_cost is None:
+            self.annual_cost = self.average_amount * (52 if self.frequency == "weekly" else 12)
+        return self
+
+class RepetitiveOutput(LLMOutput):
+    repetitive_expenses: object_list(RepetitiveExpense) = []
+    total_monthly_recurring: Amount = 0.0
+    message: str
+
+HEALTH_PROMPT = prompts.register("analyze_health", "2", instructions="""
+    Eres un asesor financiero experto. Analiza la situación financiera del usuario.
+
+    Analiza:
+    1. Estabilidad de ingresos
+    2. Balance entre gastos fijos y variables
+    3. Capacidad de ahorro
+    4. Señales de estrés financiero
+    5. Categorías con mayor gasto
+
+    REGLAS:
+    - Adapta tu lenguaje al nivel de conocimiento financiero del usuario
+    - Usa el tono especificado
+    - Sé objetivo y basado en datos
+    - Identifica patrones específicos
+    - Proporciona métricas útiles
+
+    RESPONDE SOLO EN JSON:
+    {{
+    "health_score": 0-100,
+    "health_status": "excellent|good|fair|poor",
+    "monthly_surplus": float,
+    "income_stability": "high|medium|low",
+    "top_spending_categories": [
+        {{"category_id": int, "amount": float, "percentage": float}}
+    ],
+    "risk_flags": ["..."],
+    "recommendations": ["..."],
+    "message": "Mensaje personalizado según tono y nivel del usuario"
+    }}
+""", data="""
+    TONO A USAR: {tone}
+    NIVEL DE CONOCIMIENTO FINANCIERO: {literacy_level}
+
+    CONTEXTO FINANCIERO:
+    - Ingreso mensual: ${income}
+    - Gastos variables: ${expenses}
+    - Excedente mensual: ${surplus}
+
+    PERFIL DEL USUARIO:
+    {profile}
+
+    TRANSACCIONES RECIENTES (últimas 15):
+    {transactions}
+""", output=HealthOutput, quantize=("income", "expenses", "surplus"))
+
+ANT_EXPENSES_PROMPT = prompts.register("analyze_ant_expenses", "3", instructions="""
+    Eres un analista financiero especializado en detectar GASTOS HORMIGA.
+
+    Los gastos hormiga son:
+    - Compras pequeñas y frecuentes
+    - Bajo valor individual pero alto impacto acumulado
+    - Generalmente no planificados
+    - Reducen capacidad de ahorro
+
+    Detecta patrones de gastos hormiga:
+    1. Agrupa transacciones similares (las del mismo comercio comparten #id)
+    2. Calcula frecuencia e impacto mensual
+    3. Identifica si es habitual u ocasional
+
+    REGLAS:
+    - Adapta tu mensaje al estilo motivacional del usuario
+    - No moralices el gasto
+    - Sé objetivo y constructivo
+    - Enfócate en el impacto acumulado
+
+    RESPONDE SOLO EN JSON:
+    {{
+    "ant_expenses": [
+        {{
+        "pattern_description": "Ej: Cafés diarios",
+        "categories": [1, 2],
+        "merchant_ids": [12, 40],
+        "frequency": "daily|weekly",
+        "monthly_estimated_impact": float,
+        "behavioral_signal": "habitual|occasional",
+        "transaction_count": int
+        }}
+    ],
+    "total_monthly_impact": float,
+    "message": "Mensaje constructivo adaptado al estilo motivacional",
+    "suggestions": ["Sugerencias prácticas sin presión"]
+    }}
+""", data="""
+    ESTILO MOTIVACIONAL DEL USUARIO: {motivation_style}
+    TOLERANCIA AL RIESGO: {risk_tolerance}
+
+    CONTEXTO:
+    - Ingreso mensual: ${income}
+    - Excedente: ${surplus}
+
+    COMERCIOS (gastos pequeños agrupados):
+    {merchants}
+
+    TRANSACCIONES:
+    {transactions}
+""", output=AntExpensesOutput, quantize=("income", "surplus"))
+
+LEAKS_PROMPT = prompts.register("analyze_leaks", "2", instructions="""
+    Eres un analista experto en detectar FUGAS DE DINERO.
+
+    Adapta tu mensaje al estado emocional del usuario para no causar estrés
+    adicional si ya está preocupado.
+
+    Las fugas son:
+    - Gastos anormalmente altos
+    - Categorías con crecimiento no justificado
+    - Patrones de gasto que no se alinean con ingresos
+
+    Detecta:
+    1. Picos anormales de gasto
+    2. Categorías con tendencia creciente
+    3. Gastos que impactan el excedente
+
+    RESPONDE SOLO EN JSON:
+    {{
+    "money_leaks": [
+        {{
+        "category_id": int,
+        "detected_pattern": "Descripción del patrón",
+        "monthly_impact": float,
+        "severity": "high|medium|low"
+        }}
+    ],
+    "total_leak_impact": float,
+    "message": "Mensaje empático adaptado al estado emocional",
+    "action_items": ["Acciones sugeridas"]
+    }}
+""", data="""
+    ESTADO EMOCIONAL DEL USUARIO: {emotional_state}
+
+    CONTEXTO:
+    - Ingreso: ${income}
+    - Excedente: ${surplus}
+
+    TRANSACCIONES:
+    {transactions}
+""", output=LeaksOutput, quantize=("income", "surplus"))
+
+REPETITIVE_PROMPT = prompts.register("analyze_repetitive", "3", instructions="""
+    Analiza gastos REPETITIVOS y SUSCRIPCIONES.
+
+    Identifica:
+    1. Gastos que se repiten mensualmente
+    2. Frecuencia y monto promedio
+    3. Impacto en el presupuesto mensual
+    4. Alineación con patrones de gasto conocidos
+
+    RESPONDE SOLO EN JSON:
+    {{
+    "repetitive_expenses": [
+        {{
+        "description": "Nombre del gasto",
+        "merchant_id": int,
+        "frequency": "monthly|weekly",
+        "average_amount": float,
+        "annual_cost": float,
+        "category_id": int,
+        "matches_known_pattern": boolean
+        }}
+    ],
+    "total_monthly_recurring": float,
+    "message": "Resumen considerando patrones conocidos"
+    }}
+""", data="""
+    PATRONES DE GASTO CONOCIDOS: {patterns}
+
+    CONTEXTO:
+    - Excedente mensual: ${surplus}
+
+    COMERCIOS (agrupados):
+    {merchants}
+
+    TRANSACCIONES:
+    {transactions}
+""", output=RepetitiveOutput, quantize=("surplus",))
 
 class FinancialAnalyzer:
     """
@@ -12,11 +303,7 @@ class FinancialAnalyzer:
     """
     
     def __init__(self):
-        self.llm = ChatOpenAI(
-            api_key=settings.OPENAI_API_KEY,
-            model=settings.OPENAI_MODEL,
-            temperature=settings.OPENAI_TEMPERATURE
-        )
+        self.llm = create_chat_model()
     
     async def analyze(self,query: str,transactions: List[Dict],financial_context: Dict,semantic_profile: Dict) -> Dict:
         """
@@ -27,18 +314,21 @@ class FinancialAnalyzer:
         
         # Router interno: decide qué tipo de análisis hacer
         if "hormiga" in query_lower or "pequeños" in query_lower:
+            record_route("financial_analyzer", "ant_expenses")
             return await self._analyze_ant_expenses(
                 transactions,
                 financial_context,
                 semantic_profile
             )
         elif "fuga" in query_lower or "leak" in query_lower:
+            record_route("financial_analyzer", "leaks")
             return await self._analyze_leaks(
                 transactions,
                 financial_context,
                 semantic_profile
             )
         elif "repetitiv" in query_lower or "recurrent" in query_lower:
+            record_route("financial_analyzer", "repetitive")
             return await self._analyze_repetitive(
                 transactions,
                 financial_context,
@@ -46,6 +336,7 @@ class FinancialAnalyzer:
             )
         else:
             # Análisis general de salud financiera
+            record_route("financial_analyzer", "health")
             return await self._analyze_health(
                 transactions,
                 financial_context,
@@ -62,63 +353,11 @@ class FinancialAnalyzer:
         tone = semantic_profile.get("preferred_tone", "friendly")
         literacy_level = semantic_profile.get("financial_literacy", "beginner")
         
-        prompt = ChatPromptTemplate.from_template("""
-            Eres un asesor financiero experto. Analiza la situación financiera del usuario.
-
-            TONO A USAR: {tone}
-            NIVEL DE CONOCIMIENTO FINANCIERO: {literacy_level}
-
-            CONTEXTO FINANCIERO:
-            - Ingreso mensual: ${income}
-            - Gastos variables: ${expenses}
-            - Excedente mensual: ${surplus}
-
-            PERFIL DEL USUARIO:
-            {profile}
-
-            TRANSACCIONES RECIENTES (últimas 15):
-            {transactions}
-
-            Analiza:
-            1. Estabilidad de ingresos
-            2. Balance entre gastos fijos y variables
-            3. Capacidad de ahorro
-            4. Señales de estrés financiero
-            5. Categorías con mayor gasto
-
-            REGLAS:
-            - Adapta tu lenguaje al nivel de conocimiento financiero del usuario
-            - Usa el tono especificado
-            - Sé objetivo y basado en datos
-            - Identifica patrones específicos
-            - Proporciona métricas útiles
-
-            RESPONDE SOLO EN JSON:
-            {{
-            "health_score": 0-100,
-            "health_status": "excellent|good|fair|poor",
-            "monthly_surplus": float,
-            "income_stability": "high|medium|low",
-            "top_spending_categories": [
-                {{"category_id": int, "amount": float, "percentage": float}}
-            ],
-            "risk_flags": ["..."],
-            "recommendations": ["..."],
-            "message": "Mensaje personalizado según tono y nivel del usuario"
-            }}
-        """)
-        
         try:
-            chain = prompt | self.llm | JsonOutputParser()
-            
             # Preparar transacciones (últimas 15)
-            recent_tx = transactions[-15:] if len(transactions) > 15 else transactions
-            tx_summary = "\n".join([
-                f"- {t.get('description', 'Sin descripción')}: ${t.get('amount', 0)} ({t.get('type', 'EXPENSE')})"
-                for t in recent_tx
-            ])
+            tx_summary = summarize_recent_transactions(transactions)
             
-            result = await chain.ainvoke({
+            result = await invoke_json_chain(HEALTH_PROMPT, self.llm, {
                 "tone": tone,
                 "literacy_level": literacy_level,
                 "income": financial_context.get("monthly_income", 0),
@@ -126,18 +365,14 @@ class FinancialAnalyzer:
                 "surplus": financial_context.get("month_surplus", 0),
                 "profile": str(semantic_profile),
                 "transactions": tx_summary
-            })
+            }, "financial_analyzer", "analyze_health")
             
             return result
             
         except Exception as e:
             print(f" Error in health analysis: {e}")
-            return {
-                "health_score": 50,
-                "health_status": "unknown",
-                "message": "No se pudo completar el análisis. Intenta de nuevo.",
-                "error": str(e)
-            }
+            record_fallback("financial_analyzer", "analyze_health")
+            return fallbacks.health_fallback(transactions, financial_context, e)
     
     async def _analyze_ant_expenses(self,transactions: List[Dict],financial_context: Dict,semantic_profile: Dict) -> Dict:
         """
@@ -147,87 +382,29 @@ class FinancialAnalyzer:
         
         motivation_style = semantic_profile.get("motivation_style", "balanced")
         risk_tolerance = semantic_profile.get("risk_tolerance", "medium")
-        
-        prompt = ChatPromptTemplate.from_template("""
-            Eres un analista financiero especializado en detectar GASTOS HORMIGA.
-
-            ESTILO MOTIVACIONAL DEL USUARIO: {motivation_style}
-            TOLERANCIA AL RIESGO: {risk_tolerance}
-
-            Los gastos hormiga son:
-            - Compras pequeñas y frecuentes
-            - Bajo valor individual pero alto impacto acumulado
-            - Generalmente no planificados
-            - Reducen capacidad de ahorro
-
-            TRANSACCIONES:
-            {transactions}
-
-            CONTEXTO:
-            - Ingreso mensual: ${income}
-            - Excedente: ${surplus}
-
-            Detecta patrones de gastos hormiga:
-            1. Agrupa transacciones similares
-            2. Calcula frecuencia e impacto mensual
-            3. Identifica si es habitual u ocasional
-
-            REGLAS:
-            - Adapta tu mensaje al estilo motivacional del usuario
-            - No moralices el gasto
-            - Sé objetivo y constructivo
-            - Enfócate en el impacto acumulado
-
-            RESPONDE SOLO EN JSON:
-            {{
-            "ant_expenses": [
-                {{
-                "pattern_description": "Ej: Cafés diarios",
-                "categories": [1, 2],
-                "frequency": "daily|weekly",
-                "monthly_estimated_impact": float,
-                "behavioral_signal": "habitual|occasional",
-                "transaction_count": int
-                }}
-            ],
-            "total_monthly_impact": float,
-            "message": "Mensaje constructivo adaptado al estilo motivacional",
-            "suggestions": ["Sugerencias prácticas sin presión"]
-            }}
-        """)
+        transactions = await merchant_registry.annotate(transactions)
         
         try:
-            chain = prompt | self.llm | JsonOutputParser()
-            
             # Filtrar solo gastos pequeños y frecuentes
-            small_expenses = [
-                t for t in transactions 
-                if t.get("type") == "EXPENSE" 
-                and t.get("amount", 0) < settings.ANT_EXPENSE_THRESHOLD
-            ]
+            small_expenses = filter_small_expenses(transactions, settings.ANT_EXPENSE_THRESHOLD)
             
-            tx_text = "\n".join([
-                f"- {t.get('description')}: ${t.get('amount')} ({t.get('date')})"
-                for t in small_expenses[-30:]  # Últimos 30 gastos pequeños
-            ])
+            tx_text = format_small_expenses(small_expenses)  # Últimos 30 gastos pequeños
             
-            result = await chain.ainvoke({
+            result = await invoke_json_chain(ANT_EXPENSES_PROMPT, self.llm, {
                 "motivation_style": motivation_style,
                 "risk_tolerance": risk_tolerance,
+                "merchants": summarize_merchants(small_expenses),
                 "transactions": tx_text,
                 "income": financial_context.get("monthly_income", 0),
                 "surplus": financial_context.get("month_surplus", 0)
-            })
+            }, "financial_analyzer", "analyze_ant_expenses")
             
             return result
             
         except Exception as e:
             print(f" Error in ant expenses analysis: {e}")
-            return {
-                "ant_expenses": [],
-                "message": "No se detectaron gastos hormiga significativos.",
-                "error": str(e)
-            }
+            record_fallback("financial_analyzer", "analyze_ant_expenses")
+            return fallbacks.ant_expenses_fallback(transactions, e)
     
     async def _analyze_leaks(self,transactions: List[Dict],financial_context: Dict,semantic_profile: Dict) -> Dict:
         """
@@ -236,65 +413,22 @@ class FinancialAnalyzer:
         """
         
         emotional_state = semantic_profile.get("emotional_state", "neutral")
-        
-        prompt = ChatPromptTemplate.from_template("""
-            Eres un analista experto en detectar FUGAS DE DINERO.
-
-            ESTADO EMOCIONAL DEL USUARIO: {emotional_state}
-            (Adapta tu mensaje para no causar estrés adicional si ya está preocupado)
-
-            Las fugas son:
-            - Gastos anormalmente altos
-            - Categorías con crecimiento no justificado
-            - Patrones de gasto que no se alinean con ingresos
-
-            TRANSACCIONES:
-            {transactions}
-
-            CONTEXTO:
-            - Ingreso: ${income}
-            - Excedente: ${surplus}
-
-            Detecta:
-            1. Picos anormales de gasto
-            2. Categorías con tendencia creciente
-            3. Gastos que impactan el excedente
-
-            RESPONDE SOLO EN JSON:
-            {{
-            "money_leaks": [
-                {{
-                "category_id": int,
-                "detected_pattern": "Descripción del patrón",
-                "monthly_impact": float,
-                "severity": "high|medium|low"
-                }}
-            ],
-            "total_leak_impact": float,
-            "message": "Mensaje empático adaptado al estado emocional",
-            "action_items": ["Acciones sugeridas"]
-            }}
-        """)
+        transactions = await merchant_registry.annotate(transactions)
         
         try:
-            chain = prompt | self.llm | JsonOutputParser()
-            
-            result = await chain.ainvoke({
+            result = await invoke_json_chain(LEAKS_PROMPT, self.llm, {
                 "emotional_state": emotional_state,
                 "transactions": str(transactions[-30:]),
                 "income": financial_context.get("monthly_income", 0),
                 "surplus": financial_context.get("month_surplus", 0)
-            })
+            }, "financial_analyzer", "analyze_leaks")
             
             return result
             
         except Exception as e:
             print(f" Error in leaks analysis: {e}")
-            return {
-                "money_leaks": [],
-                "message": "No se detectaron fugas significativas.",
-                "error": str(e)
-            }
+            record_fallback("financial_analyzer", "analyze_leaks")
+            return fallbacks.leaks_fallback(transactions, e)
     
     async def _analyze_repetitive(self,transactions: List[Dict],financial_context: Dict,semantic_profile: Dict) -> Dict:
         """
@@ -303,52 +437,16 @@ class FinancialAnalyzer:
         """
         
         spending_patterns = semantic_profile.get("spending_patterns", [])
-        
-        prompt = ChatPromptTemplate.from_template("""
-            Analiza gastos REPETITIVOS y SUSCRIPCIONES.
-
-            PATRONES DE GASTO CONOCIDOS: {patterns}
-
-            TRANSACCIONES:
-            {transactions}
-
-            CONTEXTO:
-            - Excedente mensual: ${surplus}
-
-            Identifica:
-            1. Gastos que se repiten mensualmente
-            2. Frecuencia y monto promedio
-            3. Impacto en el presupuesto mensual
-            4. Alineación con patrones de gasto conocidos
-
-            RESPONDE SOLO EN JSON:
-            {{
-            "repetitive_expenses": [
-                {{
-                "description": "Nombre del gasto",
-                "frequency": "monthly|weekly",
-                "average_amount": float,
-                "annual_cost": float,
-                "category_id": int,
-                "matches_known_pattern": boolean
-                }}
-            ],
-            "total_monthly_recurring": float,
-            "message": "Resumen considerando patrones conocidos"
-            }}
-        """)
+        transactions = await merchant_registry.annotate(transactions)
         
         try:
-            chain = prompt | self.llm | JsonOutputParser()
-            result = await chain.ainvoke({
+            result = await invoke_json_chain(REPETITIVE_PROMPT, self.llm, {
                 "patterns": str(spending_patterns),
+                "merchants": summarize_merchants([t for t in transactions if t.get("type") == "EXPENSE"]),
                 "transactions": str(transactions[-60:]),
                 "surplus": financial_context.get("month_surplus", 0)
-            })
+            }, "financial_analyzer", "analyze_repetitive")
             return result
         except Exception as e:
-            return {
-                "repetitive_expenses": [],
-                "message": "No se detectaron gastos repetitivos.",
-                "error": str(e)
-            }
\ No newline at end of file
+            record_fallback("financial_analyzer", "analyze_repetitive")
+            return fallbacks.repetitive_fallback(transactions, e)
\ No newline at end of file
@@ -1,8 +1,254 @@
-from typing import Dict, List
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
+from typing import Dict, List, Optional
+from pydantic import model_validator
 from src.config import settings
+from src.llm.chain import invoke_json_chain
+from src.llm.provider import create_chat_model
+from src.llm.prompts import prompts
+from src.llm.structured import LLMOutput, Amount, Count, TextList, Identifier, choice, object_list
+from src.observability.metrics import record_route, record_fallback
+from src.agents import fallbacks
+from src.analytics.goal_projection import project_goals
+from src.analytics.goal_viability import evaluate_goal_viability
+
+# Máximo de metas que se describen en el prompt (primero las más atrasadas)
+MAX_PROMPT_GOALS = 20
+STATUS_ORDER = {"critical": 0, "behind": 1, "on_track": 2, "completed": 3}
+
+def format_goal_projection(goals_status: List[Dict]) -> str:
+    """Una línea compacta por meta con los números ya calculados"""
+    ordered = sorted(goals_status, key=lambda g: STATUS_ORDER.get(g["status"], 4))[:MAX_PROMPT_GOALS]
+    return "\n".join(
+        f"- id={g['goal_id']} | {g['name']} | {g['status']} | progreso {g['progress_percentage']}% | "
+        f"falta ${g['remaining_amount']} | requiere ${g['required_monthly']}/mes | "
+        f"asignado ${g['allocated_monthly']}/mes | brecha ${g['monthly_gap']}/mes | "
+        f"fecha proyectada {g['projected_completion'] or 'sin fecha'}"
+        for g in ordered
+    ) or "(sin metas)"
+
+def format_simulation(viability: Dict) -> str:
+    simulation = viability["simulation"]
+    if simulation is None:
+        return "(sin simulación: la consulta no indica un monto objetivo)"
+    adjustments = simulation["suggested_adjustments"]
+    requested = viability.get("requested_timeframe_months")
+    return "\n".join([
+        f"- Meta: ${viability['target_amount']} en {viability['timeframe_months']} meses"
+        + (f" (pidió {requested} meses; se simula hasta el máximo de {viability['timeframe_months']})" if requested else ""),
+        f"- Probabilidad de cumplirla: {simulation['probability'] * 100:.0f}% ({simulation['paths']} escenarios, {simulation['history_months']} meses de historial)",
+        f"- Acumulado al plazo (pesimista / típico / optimista): ${simulation['accumulated_p10']} / ${simulation['accumulated_p50']} / ${simulation['accumulated_p90']}",
+        f"- viable: {str(viability['viable']).lower()} | confidence: {viability['confidence']}",
+        f"- suggested_adjustments: monto ${adjustments['target_amount']}, plazo {adjustments['timeframe_months']} meses, aporte ${adjustments['monthly_contribution']}/mes"
+    ])
+
+def format_allocations(distribution: Dict) -> str:
+    return "\n".join(
+        f"- id={a['goal_id']}: ${a['amount']}/mes ({a['reason']})"
+        for a in distribution["allocations"]
+    ) or "(sin excedente para repartir)"
+
+# --- Esquemas de salida ---
+
+class SuggestedGoal(LLMOutput):
+    name: str
+    reason: str = ""
+    estimated_target: Amount
+    suggested_timeframe_months: Count
+    monthly_contribution: Optional[Amount] = None
+    category: choice("TRAVEL", "EMERGENCY_FUND", "EDUCATION", "TECHNOLOGY", "HOME", "OTHER", default="OTHER")
+    risk_alignment: str = ""
+
+    @model_validator(mode="after")
+    def _contribution(self):
+        if self.monthly_contribution is None and self.suggested_timeframe_months > 0:
+            self.monthly_contribution = round(self.estimated_target / self.suggested_timeframe_months, 2)
+        return self
+
+class SuggestGoalsOutput(LLMOutput):
+    suggested_goals: object_list(SuggestedGoal) = []
+    message: str
+    next_steps: TextList = []
+
+class GoalAdjustments(LLMOutput):
+    target_amount: Optional[Amount] = None
+    timeframe_months: Optional[Count] = None
+    monthly_contribution: Optional[Amount] = None
+
+class EvaluateGoalOutput(LLMOutput):
+    viable: bool
+    confidence: choice("high", "medium", "low", default="low")
+    reason: str = ""
+    suggested_adjustments: Optional[GoalAdjustments] = None
+    message: str
+    alternative_approach: str = ""
+
+class GoalMessage(LLMOutput):
+    goal_id: Identifier
+    message: str
+    recommended_action: str = ""
+
+class TrackGoalsOutput(LLMOutput):
+    goal_messages: object_list(GoalMessage) = []
+    overall_message: str = ""
+
+SUGGEST_GOALS_PROMPT = prompts.register("suggest_goals", "2", instructions="""
+    Eres un asesor financiero experto en establecimiento de metas.
+
+    Sugiere hasta 3 metas financieras que sean:
+    1. REALISTAS según el excedente y perfil de riesgo
+    2. MOTIVADORAS y alineadas con el estilo motivacional
+    3. ESPECÍFICAS y medibles
+    4. NO DUPLICADAS con las existentes
+
+    Prioriza según el perfil:
+    - risk_tolerance: high → metas ambiciosas | low → metas conservadoras
+    - motivation_style: goal_oriented → metas específicas | stress_averse → metas flexibles
+
+    REGLAS:
+    - No sugieras metas que excedan el excedente mensual
+    - Sé empático y motivador según el estilo
+    - Evita presión o culpa
+
+    RESPONDE SOLO EN JSON:
+    {{
+    "suggested_goals": [
+        {{
+        "name": "Nombre claro de la meta",
+        "reason": "Por qué es relevante para este usuario específico",
+        "estimated_target": float,
+        "suggested_timeframe_months": int,
+        "monthly_contribution": float,
+        "category": "TRAVEL|EMERGENCY_FUND|EDUCATION|TECHNOLOGY|HOME|OTHER",
+        "risk_alignment": "Explicar cómo se alinea con su perfil de riesgo"
+        }}
+    ],
+    "message": "Mensaje motivador personalizado según estilo",
+    "next_steps": ["Pasos concretos considerando su perfil"]
+    }}
+""", data="""
+    PERFIL DEL USUARIO:
+    - Tolerancia al riesgo: {risk_tolerance}
+    - Estilo motivacional: {motivation_style}
+    - Categorías preferidas: {preferred_categories}
+
+    CONTEXTO FINANCIERO:
+    - Ingreso mensual: ${income}
+    - Excedente mensual: ${surplus}
+
+    PERFIL COMPLETO:
+    {profile}
+
+    METAS EXISTENTES:
+    {existing_goals}
+""", output=SuggestGoalsOutput)
+
+EVALUATE_GOAL_PROMPT = prompts.register("evaluate_goal", "3", instructions="""
+    Evalúa la VIABILIDAD de una meta financiera propuesta.
+
+    Si hay SIMULACIÓN, viable, confidence y suggested_adjustments ya están
+    calculados a partir del historial del usuario: úsalos tal cual y explica
+    la probabilidad en palabras sencillas. Si no hay simulación (la consulta no
+    indica un monto), decide con el excedente y las metas existentes.
+
+    Evalúa si la meta es:
+    1. Financieramente viable con el excedente actual
+    2. Temporalmente realista
+    3. Compatible con metas existentes
+    4. Emocionalmente sostenible según el perfil
+
+    Considera:
+    - Si risk_tolerance es low, prioriza estabilidad
+    - Si emotional_state es stressed, sugiere metas menos presionantes
+
+    DECISIONES:
+    - Viable → viable: true + explicación
+    - Viable con ajustes → viable: false + ajustes considerando perfil
+    - No viable → explicar por qué y qué hacer primero
+
+    RESPONDE SOLO EN JSON:
+    {{
+    "viable": true|false,
+    "confidence": "high|medium|low",
+    "reason": "Explicación clara considerando su perfil",
+    "suggested_adjustments": {{
+        "target_amount": float,
+        "timeframe_months": int,
+        "monthly_contribution": float
+    }},
+    "message": "Mensaje empático según estado emocional",
+    "alternative_approach": "Sugerencia alineada con su perfil de riesgo"
+    }}
+""", data="""
+    PERFIL DEL USUARIO:
+    - Tolerancia al riesgo: {risk_tolerance}
+    - Estado emocional: {emotional_state}
+
+    CONTEXTO FINANCIERO:
+    - Excedente mensual: ${surplus}
+    - Estabilidad de ingresos: {income_stability}
+    - Aporte mensual que ya piden las metas existentes: ${committed_monthly}
+
+    SIMULACIÓN:
+    {simulation}
+
+    METAS EXISTENTES:
+    {existing_goals}
+
+    PERFIL COMPLETO:
+    {profile}
+
+    CONSULTA DEL USUARIO:
+    {query}
+""", output=EvaluateGoalOutput)
+
+TRACK_GOALS_PROMPT = prompts.register("track_goals", "3", instructions="""
+    Escribe el FEEDBACK sobre el progreso de las metas financieras del usuario.
+
+    Los números de cada meta (progreso, estado, brecha mensual, fecha proyectada)
+    y el reparto del excedente ya están calculados: NO los recalcules ni los cambies.
+
+    Estados:
+    - on_track: progreso adecuado
+    - behind: necesita más esfuerzo (manejable)
+    - critical: requiere reevaluación
+    - completed: meta cumplida
+
+    Para cada meta escribe:
+    - message: feedback personalizado según estilo y tono
+    - recommended_action: acción concreta según su estado y su brecha mensual
+
+    Adapta el feedback según:
+    - motivation_style: goal_oriented → enfoque en logros | stress_averse → enfoque en calma
+    - preferred_tone: friendly → casual | encouraging → motivador
+
+    REGLAS:
+    - Sé alentador según el estilo preferido
+    - Enfócate en logros, no solo en faltantes
+    - Da feedback constructivo adaptado al tono
+
+    RESPONDE SOLO EN JSON:
+    {{
+    "goal_messages": [
+        {{
+        "goal_id": int,
+        "message": "Feedback personalizado según estilo y tono",
+        "recommended_action": "Acción específica adaptada al perfil"
+        }}
+    ],
+    "overall_message": "Mensaje general según estilo motivacional"
+    }}
+""", data="""
+    PERFIL:
+    - Estilo motivacional: {motivation_style}
+    - Tono preferido: {preferred_tone}
+
+    EXCEDENTE MENSUAL DISPONIBLE: ${surplus}
+
+    METAS (proyección calculada):
+    {goals}
+
+    REPARTO SUGERIDO DEL EXCEDENTE:
+    {allocations}
+""", output=TrackGoalsOutput)
 
 class GoalAnalyzer:
     """
@@ -12,13 +258,9 @@ class GoalAnalyzer:
     """
     
     def __init__(self):
-        self.llm = ChatOpenAI(
-            api_key=settings.OPENAI_API_KEY,
-            model=settings.OPENAI_MODEL,
-            temperature=settings.OPENAI_TEMPERATURE
-        )
+        self.llm = create_chat_model()
     
-    async def analyze(self,query: str,goals: List[Dict],financial_context: Dict,semantic_profile: Dict) -> Dict:
+    async def analyze(self,query: str,goals: List[Dict],financial_context: Dict,semantic_profile: Dict,transactions: Optional[List[Dict]] = None) -> Dict:
         """
         Ejecuta el análisis de metas según el tipo de consulta.
         Usa semantic_profile para personalizar el enfoque y tono.
@@ -26,19 +268,23 @@ class GoalAnalyzer:
         query_lower = query.lower()
         
         if "sugerir" in query_lower or "nueva" in query_lower or "crear" in query_lower:
+            record_route("goal_analyzer", "suggest_goals")
             return await self._suggest_goals(
                 goals,
                 financial_context,
                 semantic_profile
             )
         elif "evaluar" in query_lower or "viable" in query_lower:
+            record_route("goal_analyzer", "evaluate_goal")
             return await self._evaluate_goal(
                 query,
                 goals,
                 financial_context,
-                semantic_profile
+                semantic_profile,
+                transactions or []
             )
         elif "progreso" in query_lower or "track" in query_lower:
+            record_route("goal_analyzer", "track_goals")
             return await self._track_goals(
                 goals,
                 financial_context,
@@ -46,6 +292,7 @@ class GoalAnalyzer:
             )
         else:
             # Análisis general de metas
+            record_route("goal_analyzer", "general")
             return await self._general_analysis(
                 goals,
                 financial_context,
@@ -63,61 +310,8 @@ class GoalAnalyzer:
         motivation_style = semantic_profile.get("motivation_style", "balanced")
         preferred_categories = semantic_profile.get("preferred_categories", [])
         
-        prompt = ChatPromptTemplate.from_template("""
-            Eres un asesor financiero experto en establecimiento de metas.
-
-            PERFIL DEL USUARIO:
-            - Tolerancia al riesgo: {risk_tolerance}
-            - Estilo motivacional: {motivation_style}
-            - Categorías preferidas: {preferred_categories}
-
-            CONTEXTO FINANCIERO:
-            - Ingreso mensual: ${income}
-            - Excedente mensual: ${surplus}
-
-            PERFIL COMPLETO:
-            {profile}
-
-            METAS EXISTENTES:
-            {existing_goals}
-
-            Sugiere hasta 3 metas financieras que sean:
-            1. REALISTAS según el excedente y perfil de riesgo
-            2. MOTIVADORAS y alineadas con el estilo motivacional
-            3. ESPECÍFICAS y medibles
-            4. NO DUPLICADAS con las existentes
-
-            Prioriza según el perfil:
-            - risk_tolerance: high → metas ambiciosas | low → metas conservadoras
-            - motivation_style: goal_oriented → metas específicas | stress_averse → metas flexibles
-
-            REGLAS:
-            - No sugieras metas que excedan el excedente mensual
-            - Sé empático y motivador según el estilo
-            - Evita presión o culpa
-
-            RESPONDE SOLO EN JSON:
-            {{
-            "suggested_goals": [
-                {{
-                "name": "Nombre claro de la meta",
-                "reason": "Por qué es relevante para este usuario específico",
-                "estimated_target": float,
-                "suggested_timeframe_months": int,
-                "monthly_contribution": float,
-                "category": "TRAVEL|EMERGENCY_FUND|EDUCATION|TECHNOLOGY|HOME|OTHER",
-                "risk_alignment": "Explicar cómo se alinea con su perfil de riesgo"
-                }}
-            ],
-            "message": "Mensaje motivador personalizado según estilo",
-            "next_steps": ["Pasos concretos considerando su perfil"]
-            }}
-        """)
-        
         try:
-            chain = prompt | self.llm | JsonOutputParser()
-            
-            result = await chain.ainvoke({
+            result = await invoke_json_chain(SUGGEST_GOALS_PROMPT, self.llm, {
                 "risk_tolerance": risk_tolerance,
                 "motivation_style": motivation_style,
                 "preferred_categories": str(preferred_categories),
@@ -125,99 +319,67 @@ class GoalAnalyzer:
                 "surplus": financial_context.get("month_surplus", 0),
                 "profile": str(semantic_profile),
                 "existing_goals": str(existing_goals)
-            })
+            }, "goal_analyzer", "suggest_goals")
             
             return result
             
         except Exception as e:
             print(f" Error suggesting goals: {e}")
-            return {
-                "suggested_goals": [],
-                "message": "No se pudieron generar sugerencias en este momento.",
-                "error": str(e)
-            }
+            record_fallback("goal_analyzer", "suggest_goals")
+            return fallbacks.suggest_goals_fallback(existing_goals, financial_context, e)
     
-    async def _evaluate_goal(self,query: str,existing_goals: List[Dict],financial_context: Dict,semantic_profile: Dict) -> Dict:
+    async def _evaluate_goal(self,query: str,existing_goals: List[Dict],financial_context: Dict,semantic_profile: Dict,transactions: List[Dict]) -> Dict:
         """
         Evalúa la viabilidad de una meta propuesta.
-        Considera el perfil de riesgo y estado emocional del usuario.
+        La probabilidad de cumplirla sale de una simulación Monte Carlo sobre el
+        historial mensual; el LLM explica el resultado según el perfil de riesgo
+        y el estado emocional del usuario.
         """
         
         risk_tolerance = semantic_profile.get("risk_tolerance", "medium")
         emotional_state = semantic_profile.get("emotional_state", "neutral")
-        
-        prompt = ChatPromptTemplate.from_template("""
-            Evalúa la VIABILIDAD de una meta financiera propuesta.
-
-            PERFIL DEL USUARIO:
-            - Tolerancia al riesgo: {risk_tolerance}
-            - Estado emocional: {emotional_state}
-
-            CONSULTA DEL USUARIO:
-            {query}
-
-            CONTEXTO FINANCIERO:
-            - Excedente mensual: ${surplus}
-            - Estabilidad de ingresos: {income_stability}
-
-            METAS EXISTENTES:
-            {existing_goals}
-
-            PERFIL COMPLETO:
-            {profile}
-
-            Evalúa si la meta es:
-            1. Financieramente viable con el excedente actual
-            2. Temporalmente realista
-            3. Compatible con metas existentes
-            4. Emocionalmente sostenible según el perfil
-
-            Considera:
-            - Si risk_tolerance es low, prioriza estabilidad
-            - Si emotional_state es stressed, sugiere metas menos presionantes
-
-            DECISIONES:
-            - Viable → viable: true + explicación
-            - Viable con ajustes → viable: false + ajustes considerando perfil
-            - No viable → explicar por qué y qué hacer primero
-
-            RESPONDE SOLO EN JSON:
-            {{
-            "viable": true|false,
-            "confidence": "high|medium|low",
-            "reason": "Explicación clara considerando su perfil",
-            "suggested_adjustments": {{
-                "target_amount": float,
-                "timeframe_months": int,
-                "monthly_contribution": float
-            }},
-            "message": "Mensaje empático según estado emocional",
-            "alternative_approach": "Sugerencia alineada con su perfil de riesgo"
-            }}
-        """)
+        try:
+            viability = evaluate_goal_viability(query, transactions, existing_goals, financial_context)
+        except Exception as e:
+            # Sin simulación el LLM evalúa solo con el excedente y las metas
+            print(f" Error simulating goal viability: {e}")
+            record_fallback("goal_analyzer", "goal_viability")
+            viability = {
+                "income_stability": "unknown",
+                "target_amount": None,
+                "timeframe_months": settings.GOAL_DEFAULT_HORIZON_MONTHS,
+                "committed_monthly": 0.0,
+                "simulation": None
+            }
         
         try:
-            chain = prompt | self.llm | JsonOutputParser()
-            
-            result = await chain.ainvoke({
+            result = await invoke_json_chain(EVALUATE_GOAL_PROMPT, self.llm, {
                 "risk_tolerance": risk_tolerance,
                 "emotional_state": emotional_state,
                 "query": query,
                 "surplus": financial_context.get("month_surplus", 0),
-                "income_stability": "medium",
+                "income_stability": viability["income_stability"],
+                "committed_monthly": viability["committed_monthly"],
+                "simulation": format_simulation(viability),
                 "existing_goals": str(existing_goals),
                 "profile": str(semantic_profile)
-            })
+            }, "goal_analyzer", "evaluate_goal")
             
+            if viability["simulation"] is not None:
+                # Los números mandan sobre lo que diga el LLM
+                result.update({
+                    "viable": viability["viable"],
+                    "confidence": viability["confidence"],
+                    "suggested_adjustments": viability["simulation"]["suggested_adjustments"],
+                    "simulation": viability["simulation"]
+                })
+            result["income_stability"] = viability["income_stability"]
             return result
             
         except Exception as e:
             print(f" Error evaluating goal: {e}")
-            return {
-                "viable": False,
-                "reason": "No se pudo completar la evaluación.",
-                "error": str(e)
-            }
+            record_fallback("goal_analyzer", "evaluate_goal")
+            return fallbacks.evaluate_goal_fallback(existing_goals, financial_context, viability, e)
     
     async def _track_goals(self,goals: List[Dict],financial_context: Dict,semantic_profile: Dict) -> Dict:
         """
@@ -234,95 +396,34 @@ class GoalAnalyzer:
         motivation_style = semantic_profile.get("motivation_style", "balanced")
         preferred_tone = semantic_profile.get("preferred_tone", "friendly")
         
-        prompt = ChatPromptTemplate.from_template("""
-            Analiza el PROGRESO de las metas financieras del usuario.
-
-            PERFIL:
-            - Estilo motivacional: {motivation_style}
-            - Tono preferido: {preferred_tone}
-
-            METAS:
-            {goals}
-
-            CONTEXTO:
-            - Excedente mensual disponible: ${surplus}
-
-            Para cada meta, evalúa:
-            1. Progreso actual (% completado)
-            2. Tiempo transcurrido vs tiempo total
-            3. Ritmo de ahorro (adelantado, en tiempo, atrasado)
-            4. Proyección a la fecha límite
-
-            Clasifica cada meta:
-            - on_track: progreso adecuado
-            - behind: necesita más esfuerzo (manejable)
-            - critical: requiere reevaluación
-
-            Adapta el feedback según:
-            - motivation_style: goal_oriented → enfoque en logros | stress_averse → enfoque en calma
-            - preferred_tone: friendly → casual | encouraging → motivador
-
-            REGLAS:
-            - Sé alentador según el estilo preferido
-            - Enfócate en logros, no solo en faltantes
-            - Da feedback constructivo adaptado al tono
-
-            RESPONDE SOLO EN JSON:
-            {{
-            "goals_status": [
-                {{
-                "goal_id": int,
-                "name": "...",
-                "progress_percentage": float,
-                "status": "on_track|behind|critical|completed",
-                "time_elapsed_percentage": float,
-                "projected_completion": "YYYY-MM-DD",
-                "monthly_gap": float,
-                "message": "Feedback personalizado según estilo y tono",
-                "recommended_action": "Acción específica adaptada al perfil"
-                }}
-            ],
-            "overall_message": "Mensaje general según estilo motivacional",
-            "distribution_suggestion": {{
-                "total_available": float,
-                "allocations": [
-                {{"goal_id": int, "amount": float, "reason": "..."}}
-                ]
-            }}
-            }}
-        """)
+        # Números exactos con el motor local; el LLM solo redacta los mensajes
+        projection = project_goals(goals, financial_context.get("month_surplus", 0))
         
         try:
-            chain = prompt | self.llm | JsonOutputParser()
-            
-            # Enriquecer metas con cálculos
-            enriched_goals = []
-            for goal in goals:
-                saved = goal.get("saved_amount", 0)
-                target = goal.get("target_amount", 1)
-                progress = (saved / target) * 100 if target > 0 else 0
-                
-                enriched_goals.append({
-                    **goal,
-                    "progress_percentage": progress
-                })
-            
-            result = await chain.ainvoke({
+            result = await invoke_json_chain(TRACK_GOALS_PROMPT, self.llm, {
                 "motivation_style": motivation_style,
                 "preferred_tone": preferred_tone,
-                "goals": str(enriched_goals),
+                "goals": format_goal_projection(projection["goals_status"]),
+                "allocations": format_allocations(projection["distribution_suggestion"]),
                 "surplus": financial_context.get("month_surplus", 0)
-            })
+            }, "goal_analyzer", "track_goals")
             
-            return result
+            messages = {
+                str(m.get("goal_id")): m
+                for m in result.get("goal_messages", [])
+                if isinstance(m, dict)
+            }
+            for status in projection["goals_status"]:
+                message = messages.get(str(status["goal_id"]), {})
+                status["message"] = message.get("message")
+                status["recommended_action"] = message.get("recommended_action")
+            
+            return {**projection, "overall_message": result.get("overall_message", "")}
             
         except Exception as e:
             print(f" Error tracking goals: {e}")
-            return {
-                "goals_status": [],
-                "message": "No se pudo completar el seguimiento.",
-                "error": str(e)
-            }
+            record_fallback("goal_analyzer", "track_goals")
+            return fallbacks.track_goals_fallback(projection, e)
     
     async def _general_analysis(self,goals: List[Dict],financial_context: Dict,semantic_profile: Dict) -> Dict:
         """Análisis general del estado de las metas"""
@@ -0,0 +1,161 @@
+"""
+Motor determinista de proyección de metas y reparto del excedente.
+
+Calcula, vectorizado sobre todas las metas del usuario:
+- progreso, tiempo transcurrido, aporte mensual requerido por la fecha límite;
+- reparto del excedente mensual entre metas;
+- brecha mensual, fecha proyectada de cumplimiento y estado.
+
+El reparto resuelve el problema cuadrático ponderado
+
+    min  Σ w_i (d_i - x_i)²
+    s.a. Σ x_i ≤ S,   0 ≤ x_i ≤ c_i
+
+donde d_i es el aporte mensual requerido, c_i lo que falta para completar la
+meta, S el excedente y w_i un peso por urgencia (fecha límite) y prioridad
+(categoría). Por las condiciones KKT, x_i = clip(d_i - λ / (2 w_i), 0, c_i),
+y el multiplicador λ ≥ 0 se encuentra por bisección sobre Σ x_i(λ) = S.
+"""
+from datetime import date
+from typing import Dict, List, Optional
+import numpy as np
+from src.config import settings
+
+DAYS_PER_MONTH = 30.4375
+
+# Prioridad relativa por categoría de meta (el resto vale 1.0)
+CATEGORY_PRIORITY: Dict[str, float] = {
+    "EMERGENCY_FUND": 2.0,
+    "EDUCATION": 1.5,
+    "HOME": 1.25
+}
+
+def _to_days(values: List[Optional[str]]) -> np.ndarray:
+    """Fechas ISO (se ignora la hora) -> días desde epoch; NaN si falta o es inválida"""
+    days = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        if value:
+            try:
+                days[i] = date.fromisoformat(str(value)[:10]).toordinal()
+            except ValueError:
+                pass
+    return days
+
+def allocate_surplus(demand: np.ndarray, capacity: np.ndarray, weights: np.ndarray, surplus: float, iterations: int = 100) -> np.ndarray:
+    """
+    Reparte `surplus` minimizando Σ w (demand - x)² con 0 ≤ x ≤ capacity y Σ x ≤ surplus.
+    Devuelve x (mismo orden que las entradas).
+    """
+    upper = np.minimum(np.maximum(demand, 0.0), capacity)
+    if surplus <= 0 or len(demand) == 0:
+        return np.zeros_like(demand)
+    if upper.sum() <= surplus:
+        return upper  # λ = 0: alcanza para cubrir todos los aportes requeridos
+
+    def allocation(lam: float) -> np.ndarray:
+        return np.clip(demand - lam / (2 * weights), 0.0, capacity)
+
+    low, high = 0.0, float(np.max(2 * weights * demand))
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        if allocation(middle).sum() > surplus:
+            low = middle
+        else:
+            high = middle
+    return allocation(high)
+
+def project_goals(goals: List[Dict], month_surplus: float, today: Optional[date] = None) -> Dict:
+    """
+    Proyección de las metas con el excedente mensual.
+    Devuelve `goals_status` y `distribution_suggestion` con la estructura de _track_goals.
+    """
+    today_days = (today or date.today()).toordinal()
+    if not goals:
+        return {"goals_status": [], "distribution_suggestion": {"total_available": max(month_surplus, 0.0), "allocations": []}}
+
+    target = np.array([float(g.get("target_amount", 0) or 0) for g in goals])
+    saved = np.array([float(g.get("saved_amount", 0) or 0) for g in goals])
+    due = _to_days([g.get("due_date") for g in goals])
+    created = _to_days([g.get("created_at") for g in goals])
+    priority = np.array([CATEGORY_PRIORITY.get(g.get("category"), 1.0) for g in goals])
+
+    remaining = np.maximum(target - saved, 0.0)
+    completed = remaining <= 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        progress = np.where(target > 0, np.minimum(saved / target, 1.0) * 100, 0.0)
+
+        has_due = ~np.isnan(due)
+        months_left = np.where(has_due, (due - today_days) / DAYS_PER_MONTH, settings.GOAL_DEFAULT_HORIZON_MONTHS)
+        overdue = has_due & (months_left <= 0) & ~completed
+        # Sin tiempo restante se pide todo lo que falta en el mes
+        demand = remaining / np.maximum(months_left, 1.0)
+
+        span = due - created
+        elapsed = np.where(
+            has_due & ~np.isnan(created) & (span > 0),
+            np.clip((today_days - created) / span, 0.0, 1.0) * 100,
+            np.nan
+        )
+
+        # Más peso a lo urgente (y a las metas sin fecha, menos)
+        urgency = np.where(has_due, 1.0 / np.maximum(months_left, 1.0), 0.5 / settings.GOAL_DEFAULT_HORIZON_MONTHS)
+        weights = priority * urgency
+
+        surplus = max(float(month_surplus or 0), 0.0)
+        allocation = allocate_surplus(demand, remaining, weights, surplus)
+        gap = np.maximum(demand - allocation, 0.0)
+        months_to_complete = np.where(allocation > 0, remaining / allocation, np.inf)
+        gap_ratio = np.where(demand > 0, gap / demand, 0.0)
+
+    status = np.where(
+        completed, "completed",
+        np.where(
+            # Sin fecha límite una meta puede ir atrasada, pero no ser crítica
+            overdue | (has_due & (gap_ratio > settings.GOAL_CRITICAL_GAP_RATIO)), "critical",
+            np.where(gap_ratio > 0.01, "behind", "on_track")
+        )
+    )
+
+    goals_status = []
+    allocations = []
+    for i, goal in enumerate(goals):
+        projected = None
+        if completed[i]:
+            projected = date.fromordinal(today_days).isoformat()
+        elif np.isfinite(months_to_complete[i]):
+            projected = date.fromordinal(today_days + int(np.ceil(months_to_complete[i] * DAYS_PER_MONTH))).isoformat()
+        goals_status.append({
+            "goal_id": goal.get("id"),
+            "name": goal.get("name"),
+            "progress_percentage": round(float(progress[i]), 1),
+            "status": str(status[i]),
+            "time_elapsed_percentage": None if np.isnan(elapsed[i]) else round(float(elapsed[i]), 1),
+            "remaining_amount": round(float(remaining[i]), 2),
+            "required_monthly": round(float(demand[i]), 2),
+            "allocated_monthly": round(float(allocation[i]), 2),
+            "monthly_gap": round(float(gap[i]), 2),
+            "projected_completion": projected
+        })
+        if allocation[i] > 0:
+            allocations.append({
+                "goal_id": goal.get("id"),
+                "amount": round(float(allocation[i]), 2),
+                "reason": _allocation_reason(has_due[i], months_left[i], demand[i], allocation[i])
+            })
+
+    return {
+        "goals_status": goals_status,
+        "distribution_suggestion": {
+            "total_available": round(surplus, 2),
+            "allocations": allocations
+        }
+    }
+
+def _allocation_reason(has_due: bool, months_left: float, demand: float, allocated: float) -> str:
+    if not has_due:
+        return "Meta sin fecha límite: recibe lo que queda después de las metas con fecha."
+    if months_left <= 0:
+        return "La fecha límite ya pasó: se prioriza cerrar lo que falta."
+    if allocated + 0.005 >= demand:
+        return f"Cubre el aporte requerido para llegar a tiempo ({months_left:.1f} meses restantes)."
+    return f"Cubre {allocated / demand * 100:.0f}% del aporte requerido; el excedente no alcanza para todas las metas."
@@ -0,0 +1,210 @@
+"""
+Simulación Monte Carlo de la viabilidad de una meta nueva.
+
+A partir del historial mensual de ingresos y gastos del usuario se simulan
+GOAL_SIMULATION_PATHS trayectorias del excedente mensual:
+
+    excedente_t ~ N(μ, σ)   (media y desviación de ingreso - gasto por mes;
+                             σ incluye la varianza de ambos y su covarianza)
+    aporte_t    = max(excedente_t - aportes de las metas existentes, 0)
+
+La probabilidad de cumplir la meta es la fracción de trayectorias cuyo aporte
+acumulado alcanza el monto objetivo en el plazo. Todo se calcula vectorizado
+(una matriz trayectorias × meses), sin bucles por trayectoria. El plazo sale
+del texto de la consulta, así que se acota a GOAL_SIMULATION_MAX_MONTHS: la
+matriz nunca pasa de trayectorias × ese horizonte.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from src.config import settings
+from src.analytics.goal_projection import project_goals
+
+# Desviación supuesta (fracción de la media) cuando hay menos de 2 meses de historial
+DEFAULT_VARIATION = 0.15
+
+TIMEFRAME_PATTERN = re.compile(r"(\d+(?:[.,]\d+)?)\s*(meses|mes|años|año|anos|ano)\b")
+AMOUNT_PATTERN = re.compile(r"\$?\s*(\d+(?:[.,]\d+)*)\s*(millones|millón|millon|mil|k|m)?\b")
+MULTIPLIERS = {"millones": 1e6, "millón": 1e6, "millon": 1e6, "m": 1e6, "mil": 1e3, "k": 1e3}
+
+def _parse_number(text: str) -> float:
+    """
+    '5.000.000' y '5,000,000' son miles; '2,5', '2.5' y '0.125' son decimales;
+    '1.000.000,50' y '1,000,000.50' mezclan ambos (el último separador es el
+    decimal). ValueError si no es un número bien formado ('1.5.0').
+    """
+    separators = [char for char in text if char in ".,"]
+    if len(set(separators)) == 2:
+        # Mixto: el último separador es el decimal y debe aparecer una sola vez
+        decimal = separators[-1]
+        if separators.count(decimal) > 1:
+            raise ValueError(f"Invalid number: {text}")
+        whole, _, fraction = text.rpartition(decimal)
+        thousands = whole.replace(separators[0], "|").split("|")
+    elif separators and (len(separators) > 1 or re.fullmatch(r"[1-9]\d{0,2}[.,]\d{3}", text)):
+        whole, fraction = text, ""
+        thousands = re.split(r"[.,]", text)
+    else:
+        return float(text.replace(",", "."))
+    if not re.fullmatch(r"\d{1,3}", thousands[0]) or any(not re.fullmatch(r"\d{3}", group) for group in thousands[1:]):
+        raise ValueError(f"Invalid number: {text}")
+    return float("".join(thousands) + (f".{fraction}" if fraction else ""))
+
+def parse_goal_query(query: str) -> Tuple[Optional[float], Optional[int]]:
+    """
+    Extrae (monto objetivo, plazo en meses) de la consulta, p. ej.
+    "¿es viable ahorrar 5 millones en 10 meses?" -> (5000000.0, 10).
+    Devuelve None en lo que no encuentre.
+    """
+    query = query.lower()
+    months = None
+    timeframe = TIMEFRAME_PATTERN.search(query)
+    if timeframe:
+        try:
+            value = _parse_number(timeframe.group(1))
+            months = max(int(round(value * 12 if timeframe.group(2).startswith("a") else value)), 1)
+        except ValueError:
+            pass  # Plazo ilegible: se usa el horizonte por defecto
+        query = query[:timeframe.start()] + query[timeframe.end():]
+
+    amounts = []
+    for match in AMOUNT_PATTERN.finditer(query):
+        try:
+            amounts.append(_parse_number(match.group(1)) * MULTIPLIERS.get(match.group(2), 1.0))
+        except ValueError:
+            continue  # Número mal formado: se descarta ese candidato
+    target = max(amounts) if amounts else None
+    return (target if target and target > 0 else None), months
+
+def monthly_history(transactions: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """Ingreso y gasto total por mes (YYYY-MM), en orden cronológico"""
+    dated = [t for t in transactions if t.get("date")]
+    if not dated:
+        return np.zeros(0), np.zeros(0)
+    months, index = np.unique([str(t["date"])[:7] for t in dated], return_inverse=True)
+    amounts = np.array([float(t.get("amount", 0) or 0) for t in dated])
+    is_income = np.array([t.get("type") == "INCOME" for t in dated])
+    income = np.bincount(index, weights=np.where(is_income, amounts, 0.0), minlength=len(months))
+    expense = np.bincount(index, weights=np.where(is_income, 0.0, amounts), minlength=len(months))
+    return income, expense
+
+def income_stability(income: np.ndarray) -> str:
+    """high | medium | low según el coeficiente de variación del ingreso mensual; unknown sin historial"""
+    if len(income) < 2 or income.mean() <= 0:
+        return "unknown"
+    variation = income.std(ddof=1) / income.mean()
+    if variation < 0.15:
+        return "high"
+    if variation < 0.35:
+        return "medium"
+    return "low"
+
+def _surplus_moments(income: np.ndarray, expense: np.ndarray, fallback_mean: float) -> Tuple[float, float]:
+    """Media y desviación del excedente mensual (ingreso - gasto)"""
+    net = income - expense
+    if len(net) >= 2:
+        return float(net.mean()), float(net.std(ddof=1))
+    mean = float(net.mean()) if len(net) else fallback_mean
+    return mean, abs(mean) * DEFAULT_VARIATION
+
+def simulate_goal(
+    income: np.ndarray,
+    expense: np.ndarray,
+    committed_monthly: float,
+    target_amount: float,
+    timeframe_months: int,
+    month_surplus: float = 0.0,
+    paths: Optional[int] = None,
+    seed: int = 0
+) -> Dict:
+    """
+    Probabilidad de reunir `target_amount` en `timeframe_months` y los ajustes
+    que la llevarían a GOAL_VIABILITY_PROBABILITY.
+    Sin historial se usa `month_surplus` como excedente medio.
+    """
+    paths = paths or settings.GOAL_SIMULATION_PATHS
+    horizon = settings.GOAL_SIMULATION_MAX_MONTHS
+    timeframe_months = min(max(timeframe_months, 1), horizon)
+    mean, std = _surplus_moments(income, expense, month_surplus)
+
+    # float32: la mitad de memoria y de tiempo, precisión de sobra para montos en pesos
+    rng = np.random.default_rng(seed)
+    contribution = rng.standard_normal((paths, horizon), dtype=np.float32)
+    contribution *= std
+    contribution += mean - committed_monthly
+    np.maximum(contribution, 0.0, out=contribution)
+    accumulated = np.cumsum(contribution, axis=1)
+
+    at_deadline = accumulated[:, timeframe_months - 1]
+    probability = float(np.mean(at_deadline >= target_amount))
+
+    reached = accumulated >= target_amount
+    months_to_target = np.where(reached.any(axis=1), reached.argmax(axis=1) + 1, np.inf)
+
+    required = settings.GOAL_VIABILITY_PROBABILITY
+    # Plazo con el que el required% de las trayectorias llega (None si ni en el horizonte)
+    # (method="higher": sin interpolar, para que inf no produzca NaN)
+    suggested_months = float(np.quantile(months_to_target, required, method="higher"))
+    median_months = float(np.quantile(months_to_target, 0.5, method="higher"))
+    # Monto que el required% de las trayectorias reúne en el plazo pedido
+    suggested_target = float(np.quantile(at_deadline, 1 - required))
+
+    return {
+        "probability": round(probability, 3),
+        "paths": paths,
+        "history_months": int(len(income)),
+        "expected_monthly_contribution": round(float(contribution[:, :timeframe_months].mean()), 2),
+        "accumulated_p10": round(float(np.quantile(at_deadline, 0.10)), 2),
+        "accumulated_p50": round(float(np.quantile(at_deadline, 0.50)), 2),
+        "accumulated_p90": round(float(np.quantile(at_deadline, 0.90)), 2),
+        "median_months_to_target": int(median_months) if np.isfinite(median_months) else None,
+        "suggested_adjustments": {
+            "target_amount": round(suggested_target, 2),
+            "timeframe_months": int(suggested_months) if np.isfinite(suggested_months) else None,
+            "monthly_contribution": round(target_amount / timeframe_months, 2)
+        }
+    }
+
+def _confidence(probability: float, history_months: int) -> str:
+    """Qué tan firme es el veredicto: baja con poco historial o cerca del umbral"""
+    if history_months < settings.GOAL_MIN_HISTORY_MONTHS:
+        return "low"
+    if round(abs(probability - settings.GOAL_VIABILITY_PROBABILITY), 3) >= 0.2:
+        return "high"
+    return "medium"
+
+def evaluate_goal_viability(query: str, transactions: List[Dict], existing_goals: List[Dict], financial_context: Dict) -> Dict:
+    """
+    Evaluación numérica de la meta de la consulta.
+    `simulation` es None si la consulta no indica un monto objetivo.
+    """
+    income, expense = monthly_history(transactions)
+    target_amount, timeframe_months = parse_goal_query(query)
+    timeframe_months = timeframe_months or settings.GOAL_DEFAULT_HORIZON_MONTHS
+    evaluation = {
+        "income_stability": income_stability(income),
+        "target_amount": target_amount,
+        "timeframe_months": min(timeframe_months, settings.GOAL_SIMULATION_MAX_MONTHS),
+        "committed_monthly": 0.0,
+        "simulation": None
+    }
+    if timeframe_months > settings.GOAL_SIMULATION_MAX_MONTHS:
+        # Plazos más largos no se simulan: se evalúa el máximo y se informa el pedido
+        evaluation["requested_timeframe_months"] = timeframe_months
+    if target_amount is None:
+        return evaluation
+
+    # Lo que ya piden las metas existentes sale primero del excedente
+    projection = project_goals(existing_goals, financial_context.get("month_surplus", 0))
+    committed = sum(g["required_monthly"] for g in projection["goals_status"])
+    simulation = simulate_goal(
+        income, expense, committed, target_amount, evaluation["timeframe_months"],
+        month_surplus=financial_context.get("month_surplus", 0)
+    )
+    evaluation.update({
+        "committed_monthly": round(committed, 2),
+        "simulation": simulation,
+        "viable": simulation["probability"] >= settings.GOAL_VIABILITY_PROBABILITY,
+        "confidence": _confidence(simulation["probability"], simulation["history_months"])
+    })
+    return evaluation
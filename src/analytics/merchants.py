@@ -0,0 +1,153 @@
+"""
+Canonicalización de comercios a partir de la descripción de la transacción.
+
+Las descripciones del banco traen ruido ("UBER *TRIP 1234", "COMPRA POS
+RAPPI*RESTAURANTE BOGOTA"): códigos, ciudades, prefijos del medio de pago.
+Dos pasos:
+1. normalize_description: reglas deterministas (minúsculas, sin tildes ni
+   signos, sin números ni códigos, sin palabras de ruido).
+2. MerchantIndex: agrupa las descripciones normalizadas casi iguales
+   ("rappi restaurante" / "rappi restaurantes") con MinHash sobre 3-gramas de
+   caracteres y LSH por bandas: solo se comparan las firmas que comparten
+   alguna banda, así que asignar una descripción nueva no recorre todo el índice.
+
+El índice es solo memoria; src.memory.merchants lo persiste para que cada
+descripción se resuelva una vez por despliegue.
+"""
+import re
+import unicodedata
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from src.config import settings
+
+# Primo de Mersenne 2^31 - 1: (a * x + b) cabe en uint64 sin desbordar
+_PRIME = (1 << 31) - 1
+# Semilla fija: las firmas deben ser las mismas en todos los procesos del despliegue
+_SEED = 20240601
+SHINGLE_SIZE = 3
+
+# Palabras que no identifican al comercio: medio de pago, sufijos legales,
+# dominios y ciudades
+NOISE_TOKENS = {
+    "compra", "compras", "pago", "pagos", "pos", "trx", "ref", "tarjeta", "debito", "credito",
+    "pse", "cmp", "datafono", "internet", "web", "online",
+    "sa", "sas", "ltda", "inc", "llc", "cia",
+    "www", "com", "co", "net",
+    "bogota", "medellin", "cali", "barranquilla", "cartagena", "bucaramanga", "col", "colombia"
+}
+
+def _is_code(token: str) -> bool:
+    """Números y referencias ('1234', 'ab3456'); 'd1' o '7eleven' se conservan"""
+    return token.isdigit() or sum(char.isdigit() for char in token) >= 3
+
+def normalize_description(description: Optional[str]) -> str:
+    """'UBER *TRIP 1234' -> 'uber trip'. Vacío si no queda nada que identifique al comercio"""
+    text = unicodedata.normalize("NFKD", description or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    tokens = re.split(r"[^a-z0-9ñ]+", text)
+    return " ".join(
+        token for token in tokens
+        if len(token) > 1 and not _is_code(token) and token not in NOISE_TOKENS
+    )
+
+def _shingles(text: str) -> np.ndarray:
+    padded = f" {text} "
+    grams = {padded[i:i + SHINGLE_SIZE] for i in range(max(len(padded) - SHINGLE_SIZE + 1, 1))}
+    return np.array([zlib.crc32(gram.encode("utf-8")) % _PRIME for gram in grams], dtype=np.uint64)
+
+class MinHasher:
+
+    def __init__(self, permutations: int):
+        rng = np.random.default_rng(_SEED)
+        self.a = rng.integers(1, _PRIME, size=permutations, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, size=permutations, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """Firma MinHash (permutations enteros) de los 3-gramas de `text`"""
+        shingles = _shingles(text)
+        return ((self.a[:, None] * shingles[None, :] + self.b[:, None]) % _PRIME).min(axis=1)
+
+class MerchantIndex:
+    """
+    Descripciones normalizadas -> id de comercio, con LSH para encontrar el
+    comercio de una descripción nueva. La similitud de Jaccard estimada con
+    las firmas debe llegar a MERCHANT_SIMILARITY_THRESHOLD.
+    """
+
+    def __init__(self, permutations: Optional[int] = None, bands: Optional[int] = None, threshold: Optional[float] = None):
+        permutations = permutations or settings.MERCHANT_MINHASH_PERMUTATIONS
+        self.bands = bands or settings.MERCHANT_LSH_BANDS
+        if permutations % self.bands:
+            raise ValueError("MERCHANT_MINHASH_PERMUTATIONS debe ser múltiplo de MERCHANT_LSH_BANDS")
+        self.rows = permutations // self.bands
+        self.threshold = threshold if threshold is not None else settings.MERCHANT_SIMILARITY_THRESHOLD
+        self.hasher = MinHasher(permutations)
+        self.aliases: Dict[str, int] = {}
+        self.names: Dict[int, str] = {}
+        self._signatures: List[np.ndarray] = []
+        self._owners: List[int] = []
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, normalized: str, merchant_id: int, name: Optional[str] = None) -> None:
+        """Registra `normalized` como alias del comercio (el primer alias es su nombre)"""
+        if normalized in self.aliases:
+            return
+        self.aliases[normalized] = merchant_id
+        self.names.setdefault(merchant_id, name or normalized)
+        signature = self.hasher.signature(normalized)
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        self._owners.append(merchant_id)
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(position)
+
+    def match(self, normalized: str) -> Optional[int]:
+        """Comercio del alias más parecido a `normalized` (None si ninguno alcanza el umbral)"""
+        if normalized in self.aliases:
+            return self.aliases[normalized]
+        signature = self.hasher.signature(normalized)
+        candidates = {position for key in self._band_keys(signature) for position in self._buckets.get(key, ())}
+        best, best_similarity = None, self.threshold
+        for position in candidates:
+            similarity = float(np.mean(self._signatures[position] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = self._owners[position], similarity
+        return best
+
+    def assign(self, normalized: str) -> int:
+        """Comercio de `normalized`; si no se parece a ninguno, uno nuevo (ids locales, sin persistir)"""
+        merchant_id = self.match(normalized)
+        if merchant_id is None:
+            merchant_id = len(self.names) + 1
+        self.add(normalized, merchant_id)
+        return merchant_id
+
+def group_by_merchant(transactions: List[Dict]) -> Dict:
+    """
+    Transacciones agrupadas por merchant_id (o por descripción normalizada si
+    no fueron canonicalizadas). Una pasada: O(n) sobre las asignaciones ya hechas.
+    """
+    groups: Dict = {}
+    for t in transactions:
+        key = t.get("merchant_id") or normalize_description(t.get("description"))
+        groups.setdefault(key, []).append(t)
+    return groups
+
+def summarize_merchants(transactions: List[Dict], limit: int = 15) -> str:
+    """Texto con los comercios de más gasto: nombre, id, número de compras y total"""
+    totals = [
+        (sum(float(t.get("amount", 0) or 0) for t in items), key, items)
+        for key, items in group_by_merchant(transactions).items()
+        if key
+    ]
+    totals.sort(key=lambda entry: entry[0], reverse=True)
+    return "\n".join(
+        f"- {items[0].get('merchant') or key}" + (f" (#{key})" if items[0].get("merchant_id") else "")
+        + f": {len(items)} compras, total ${round(total, 2)}"
+        for total, key, items in totals[:limit]
+    )
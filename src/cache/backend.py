@@ -0,0 +1,259 @@
+"""
+Backend de caché compartido entre workers y réplicas.
+
+Dos niveles:
+- L1 en proceso (LRU con TTL), por worker.
+- L2 en finzen_ai_db: tabla UNLOGGED `cache_entries` (no escribe WAL; se
+  vacía si Postgres se reinicia de forma abrupta, lo cual es aceptable para
+  una caché). La comparten todos los workers y réplicas.
+
+CACHE_BACKEND=memory usa solo L1. CACHE_BACKEND=postgres usa L1 + L2, y las
+invalidaciones se publican con NOTIFY para que el listener de cada worker
+saque la entrada de su L1. Los valores deben ser serializables a JSON.
+"""
+import asyncio
+import json
+import select
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+from sqlalchemy import Column, Float, Index, String, Table, Text, text
+from src.config import settings
+from src.memory.database import Base, engine
+from src.observability.metrics import record_cache
+
+NOTIFY_CHANNEL = "finzen_cache"
+
+# Tabla del nivel L2 (la migración 0002 la crea como UNLOGGED en Postgres)
+cache_entries = Table(
+    "cache_entries",
+    Base.metadata,
+    Column("namespace", String, primary_key=True),
+    Column("key", String, primary_key=True),
+    Column("value", Text, nullable=False),
+    Column("expires_at", Float, nullable=False),
+    Index("idx_cache_entries_expires_at", "expires_at")
+)
+
+class MemoryCache:
+    """
+    LRU en proceso con TTL por entrada. Guarda el JSON serializado para que
+    quien lee pueda modificar el valor devuelto sin alterar la caché.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[(namespace, key)]
+                return None
+            self._entries.move_to_end((namespace, key))
+        return json.loads(value)
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        encoded = json.dumps(value, ensure_ascii=False, default=str)
+        with self._lock:
+            self._entries[(namespace, key)] = (time.time() + ttl, encoded)
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+class PostgresCache:
+    """Nivel L2 sobre la tabla cache_entries (usa el pool de la app)"""
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[float, Any]]:
+        """Devuelve (expires_at, valor) o None"""
+        with engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT value, expires_at FROM cache_entries WHERE namespace = :ns AND key = :key AND expires_at > :now"),
+                {"ns": namespace, "key": key, "now": time.time()}
+            ).first()
+        if row is None:
+            return None
+        return row.expires_at, json.loads(row.value)
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    "INSERT INTO cache_entries (namespace, key, value, expires_at) VALUES (:ns, :key, :value, :expires_at) "
+                    "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+                ),
+                {"ns": namespace, "key": key, "value": json.dumps(value, ensure_ascii=False, default=str), "expires_at": time.time() + ttl}
+            )
+
+    def delete(self, namespace: str, key: str) -> None:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM cache_entries WHERE namespace = :ns AND key = :key"), {"ns": namespace, "key": key})
+            if engine.dialect.name == "postgresql":
+                # Se entrega al hacer commit, junto con el DELETE
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"), {
+                    "channel": NOTIFY_CHANNEL,
+                    "payload": json.dumps([namespace, key], ensure_ascii=False)
+                })
+
+    def purge_expired(self) -> int:
+        with engine.begin() as conn:
+            return conn.execute(text("DELETE FROM cache_entries WHERE expires_at <= :now"), {"now": time.time()}).rowcount
+
+class TieredCache:
+    """
+    Caché L1 (+ L2 opcional). Las lecturas de L2 repueblan L1 con un TTL
+    limitado a CACHE_L1_MAX_TTL_S, que acota la desactualización si se pierde
+    una notificación. Los errores de L2 se registran y se tratan como miss.
+    """
+
+    def __init__(self, l1: MemoryCache, l2: Optional[PostgresCache] = None):
+        self.l1 = l1
+        self.l2 = l2
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        value = self.l1.get(namespace, key)
+        if value is None and self.l2 is not None:
+            try:
+                entry = self.l2.get(namespace, key)
+            except Exception as e:
+                print(f" Cache read error ({namespace}): {e}")
+                entry = None
+            if entry is not None:
+                expires_at, value = entry
+                self.l1.set(namespace, key, value, min(expires_at - time.time(), settings.CACHE_L1_MAX_TTL_S))
+        record_cache(namespace, value is not None)
+        return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        self.l1.set(namespace, key, value, min(ttl, settings.CACHE_L1_MAX_TTL_S) if self.l2 else ttl)
+        if self.l2 is not None:
+            try:
+                self.l2.set(namespace, key, value, ttl)
+            except Exception as e:
+                print(f" Cache write error ({namespace}): {e}")
+
+    def invalidate(self, namespace: str, key: str) -> None:
+        """Borra la entrada en L1, en L2 y (Postgres) en el L1 de los demás workers"""
+        self.l1.delete(namespace, key)
+        if self.l2 is not None:
+            try:
+                self.l2.delete(namespace, key)
+            except Exception as e:
+                print(f" Cache invalidation error ({namespace}): {e}")
+
+    # Variantes async: L1 se resuelve en el event loop, L2 en un thread
+    async def aget(self, namespace: str, key: str) -> Optional[Any]:
+        if self.l2 is None:
+            return self.get(namespace, key)
+        value = self.l1.get(namespace, key)
+        if value is not None:
+            record_cache(namespace, True)
+            return value
+        return await asyncio.to_thread(self.get, namespace, key)
+
+    async def aset(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        if self.l2 is None:
+            self.set(namespace, key, value, ttl)
+        else:
+            await asyncio.to_thread(self.set, namespace, key, value, ttl)
+
+class InvalidationListener:
+    """
+    Thread que escucha NOTIFY finzen_cache y saca las entradas del L1 local.
+    Usa una conexión propia (fuera del pool). Al reconectar vacía el L1, porque
+    pudo perder notificaciones. También purga periódicamente las filas vencidas.
+    """
+
+    def __init__(self, cache: TieredCache):
+        self.cache = cache
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def _connect(self):
+        import psycopg2
+        conn = psycopg2.connect(engine.url.set(drivername="postgresql").render_as_string(hide_password=False))
+        conn.set_isolation_level(0)  # autocommit: LISTEN activo de inmediato
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        return conn
+
+    def _run(self) -> None:
+        conn = None
+        next_purge = time.monotonic() + settings.CACHE_PURGE_INTERVAL_S
+        while not self._stop.is_set():
+            try:
+                if conn is None:
+                    conn = self._connect()
+                    self.cache.l1.clear()
+                if select.select([conn], [], [], 1.0) != ([], [], []):
+                    conn.poll()
+                    while conn.notifies:
+                        namespace, key = json.loads(conn.notifies.pop(0).payload)
+                        self.cache.l1.delete(namespace, key)
+                if time.monotonic() >= next_purge:
+                    next_purge = time.monotonic() + settings.CACHE_PURGE_INTERVAL_S
+                    self.cache.l2.purge_expired()
+            except Exception as e:
+                print(f" Cache listener error: {e}")
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+                self._stop.wait(5.0)
+        if conn is not None:
+            conn.close()
+
+@lru_cache()
+def get_cache() -> TieredCache:
+    """Caché de la app según CACHE_BACKEND (memory | postgres)"""
+    l1 = MemoryCache(settings.CACHE_MEMORY_MAX_ENTRIES)
+    if settings.CACHE_BACKEND == "postgres":
+        return TieredCache(l1, PostgresCache())
+    if settings.CACHE_BACKEND != "memory":
+        raise ValueError(f"CACHE_BACKEND inválido: {settings.CACHE_BACKEND}. Opciones: memory, postgres")
+    return TieredCache(l1)
+
+_listener: Optional[InvalidationListener] = None
+
+def start_invalidation_listener() -> None:
+    """Arranca el listener (solo con L2 sobre Postgres)"""
+    global _listener
+    cache = get_cache()
+    if cache.l2 is None or engine.dialect.name != "postgresql" or _listener is not None:
+        return
+    _listener = InvalidationListener(cache)
+    _listener.start()
+
+def stop_invalidation_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,59 @@
+"""
+Circuit breaker por microservicio.
+
+closed: las llamadas pasan; UPSTREAM_BREAKER_FAILURES fallos seguidos lo abren.
+open: las llamadas fallan de inmediato (sin esperar el timeout) durante
+UPSTREAM_BREAKER_RESET_S segundos.
+half_open: pasado ese tiempo se deja pasar una llamada de prueba; si funciona
+se cierra, si falla vuelve a abrirse. Mientras la prueba está en curso el
+resto sigue fallando rápido.
+"""
+import time
+from typing import Dict
+from src.config import settings
+from src.observability.metrics import UPSTREAM_BREAKER_STATE
+
+STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+class CircuitBreaker:
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._set_state("closed")
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            print(f" Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        UPSTREAM_BREAKER_STATE.labels(self.name).set(STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """¿Se puede llamar al servicio ahora?"""
+        if self.state == "closed":
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Llamada de prueba; la siguiente prueba no antes de otro reset_timeout
+            self.opened_at = time.monotonic()
+            self._set_state("half_open")
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._set_state("closed")
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state("open")
+
+breakers: Dict[str, CircuitBreaker] = {
+    name: CircuitBreaker(name, settings.UPSTREAM_BREAKER_FAILURES, settings.UPSTREAM_BREAKER_RESET_S)
+    for name in ("transactions", "goals")
+}
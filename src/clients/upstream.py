@@ -0,0 +1,228 @@
+"""
+Clientes de los microservicios Transactions y Goals (token propagation).
+
+Todas las llamadas comparten un httpx.AsyncClient (pool de conexiones
+keep-alive) que se crea al arrancar la app y se cierra al apagarla.
+Las respuestas exitosas se guardan UPSTREAM_CACHE_TTL_S en la caché
+compartida, con clave por recurso y hash del token.
+
+Cada servicio tiene un circuit breaker (src.clients.breaker). Si el servicio
+falla o su breaker está abierto se sirve el último dato bueno del mismo token
+(snapshot, UPSTREAM_SNAPSHOT_TTL_S) y el recurso queda marcado como "stale";
+sin snapshot se devuelve vacío y queda como "unavailable". track_upstream()
+recoge esas marcas y mark_upstream() las agrega a la respuesta.
+
+El timeout de cada llamada se acota al tiempo que le queda al request
+(src.deadline) y se propaga al servicio en la misma cabecera; un timeout
+causado por el deadline no cuenta como fallo del servicio, pero se responde
+igual con el snapshot (o vacío) para que el análisis alcance a degradarse.
+
+Las respuestas se validan (parse_*) antes de darlas por buenas: un 200 con
+un cuerpo que no se puede convertir cuenta como fallo del servicio y no se
+guarda en caché ni como snapshot.
+"""
+import hashlib
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+import httpx
+from src.cache.backend import get_cache
+from src.clients.breaker import breakers
+from src import deadline
+from src.models.schemas import TransactionInput, GoalInput
+from src.config import settings
+from src.observability.metrics import UPSTREAM_FETCH_SECONDS, UPSTREAM_DEGRADED, timer, record_error
+from src.observability.tracing import span
+
+# Errores de parse_* con un cuerpo mal formado (ValidationError es un ValueError)
+PARSE_ERRORS = (ValueError, TypeError, AttributeError, KeyError)
+
+_client: Optional[httpx.AsyncClient] = None
+_upstream_status: ContextVar[Optional[Dict[str, str]]] = ContextVar("upstream_status", default=None)
+
+def get_http_client() -> httpx.AsyncClient:
+    """Cliente HTTP compartido (se crea en el primer uso si el lifespan no lo creó)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=settings.UPSTREAM_TIMEOUT_S,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS
+            )
+        )
+    return _client
+
+async def warm_http_client() -> None:
+    """Abre las conexiones hacia los microservicios (DNS + TCP/TLS) antes del primer request"""
+    client = get_http_client()
+    for url in {settings.TRANSACTIONS_SERVICE_URL, settings.GOALS_SERVICE_URL}:
+        try:
+            await client.head(url, timeout=2.0)
+        except httpx.HTTPError as e:
+            print(f" Could not warm connection to {url}: {e}")
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _cache_key(resource: str, token: str) -> str:
+    return f"{resource}:{hashlib.sha256(token.encode('utf-8')).hexdigest()}"
+
+async def _cached(resource: str, token: str):
+    if settings.UPSTREAM_CACHE_TTL_S <= 0:
+        return None
+    return await get_cache().aget("upstream", _cache_key(resource, token))
+
+async def _store(resource: str, token: str, data) -> None:
+    cache = get_cache()
+    await cache.aset("upstream", _cache_key(resource, token), data, settings.UPSTREAM_CACHE_TTL_S)
+    await cache.aset("snapshot", _cache_key(resource, token), data, settings.UPSTREAM_SNAPSHOT_TTL_S)
+
+def track_upstream() -> Dict[str, str]:
+    """
+    Empieza a recoger {recurso: stale | unavailable} de los fetch siguientes
+    del contexto actual (el request, o el item en curso de un worker del batch).
+    """
+    status: Dict[str, str] = {}
+    _upstream_status.set(status)
+    return status
+
+def mark_upstream(result: Dict, status: Dict[str, str]) -> Dict:
+    """Agrega a la respuesta qué datos vinieron de un snapshot o faltaron"""
+    if status:
+        result["upstream_status"] = dict(status)
+        result["stale"] = "stale" in status.values()
+    return result
+
+def _parse_cached(resource: str, data, parse: Callable):
+    """Convierte un dato de la caché; None si no es válido (se trata como ausente)"""
+    if data is None:
+        return None
+    try:
+        return parse(data)
+    except PARSE_ERRORS as e:
+        print(f" Discarding cached {resource}: {type(e).__name__} {e}")
+        return None
+
+async def _degraded(resource: str, token: str, empty, parse: Callable):
+    """Servicio caído o breaker abierto: último dato bueno del token, o vacío"""
+    snapshot = _parse_cached(resource, await get_cache().aget("snapshot", _cache_key(resource, token)), parse)
+    result = "stale" if snapshot is not None else "unavailable"
+    UPSTREAM_DEGRADED.labels(resource, result).inc()
+    status = _upstream_status.get()
+    if status is not None:
+        status[resource] = result
+    return snapshot if snapshot is not None else empty
+
+async def _fetch(resource: str, service: str, url: str, token: str, empty, parse: Callable):
+    """
+    GET con caché, circuit breaker y snapshot. Devuelve `parse(json)` de la
+    respuesta (o el snapshot / `empty` si el servicio no responde bien o su
+    respuesta no pasa `parse`).
+    """
+    cached = _parse_cached(resource, await _cached(resource, token), parse)
+    if cached is not None:
+        return cached
+    breaker = breakers[service]
+    if not breaker.allow():
+        return await _degraded(resource, token, empty, parse)
+
+    try:
+        timeout = deadline.budget(settings.UPSTREAM_TIMEOUT_S)
+    except deadline.DeadlineExceeded:
+        return await _degraded(resource, token, empty, parse)
+    headers = {"Authorization": token}
+    if timeout < settings.UPSTREAM_TIMEOUT_S:
+        headers[settings.REQUEST_DEADLINE_HEADER] = f"{timeout:.3f}"
+    print(f" Fetching {resource} from: {url}")
+    try:
+        client = get_http_client()
+        with timer(UPSTREAM_FETCH_SECONDS.labels(resource)), span(f"fetch.{resource}"):
+            response = await client.get(url, headers=headers, timeout=timeout)
+    except httpx.HTTPError as e:
+        if isinstance(e, httpx.TimeoutException) and timeout < settings.UPSTREAM_TIMEOUT_S:
+            # Se agotó el request, no el servicio: sin contar el fallo en el breaker
+            print(f" {resource} fetch exceeded the request deadline")
+            record_error("upstream_deadline")
+            return await _degraded(resource, token, empty, parse)
+        print(f" Error fetching {resource}: {type(e).__name__} {e}")
+        record_error("upstream_fetch")
+        breaker.record_failure()
+        return await _degraded(resource, token, empty, parse)
+
+    if response.status_code == 200:
+        try:
+            data = response.json()
+            parsed = parse(data)
+        except PARSE_ERRORS as e:
+            print(f" Invalid {resource} response: {type(e).__name__} {e}")
+            record_error("upstream_fetch")
+            breaker.record_failure()
+            return await _degraded(resource, token, empty, parse)
+        breaker.record_success()
+        print(f" Fetched {resource}" + (f": {len(data)} items" if isinstance(data, list) else ""))
+        await _store(resource, token, data)
+        return parsed
+
+    print(f" Error response ({response.status_code}): {response.text[:200]}")
+    record_error("upstream_fetch")
+    if response.status_code >= 500:
+        breaker.record_failure()
+        return await _degraded(resource, token, empty, parse)
+    # 4xx: el servicio responde (token inválido, etc.); no se sirve snapshot
+    breaker.record_success()
+    return empty
+
+def parse_transactions(data: List[Dict]) -> List[TransactionInput]:
+    """Convierte la respuesta de /transactions al formato esperado por los agentes"""
+    if not isinstance(data, list):
+        raise TypeError(f"expected a list of transactions, got {type(data).__name__}")
+    return [
+        TransactionInput(
+            id=t.get("id"),
+            amount=float(t.get("amount", 0)),
+            description=t.get("description", ""),
+            date=t.get("date", ""),
+            type=t.get("type", "EXPENSE"),
+            category_id=t.get("categoryId", 0)
+        )
+        for t in data
+    ]
+
+def parse_goals(data: List[Dict]) -> List[GoalInput]:
+    """Convierte la respuesta de /goals al formato esperado por los agentes"""
+    if not isinstance(data, list):
+        raise TypeError(f"expected a list of goals, got {type(data).__name__}")
+    return [
+        GoalInput(
+            id=g.get("id"),
+            name=g.get("name", ""),
+            target_amount=float(g.get("targetAmount", 0)),
+            saved_amount=float(g.get("savedAmount", 0)),
+            category=g.get("category", "OTHER"),
+            due_date=g.get("dueDate"),
+            status=g.get("status", "ACTIVE"),
+            created_at=g.get("createdAt")
+        )
+        for g in data
+    ]
+
+def parse_financial_summary(data: Dict) -> Dict:
+    """El resumen de /transactions/reports se usa tal cual; solo se valida que sea un objeto"""
+    if not isinstance(data, dict):
+        raise TypeError(f"expected a report object, got {type(data).__name__}")
+    return data
+
+async def fetch_transactions(token: str):
+    """Obtiene transacciones del microservicio de Transactions con token propagation"""
+    return await _fetch("transactions", "transactions", f"{settings.TRANSACTIONS_SERVICE_URL}/transactions", token, [], parse_transactions)
+
+async def fetch_financial_summary(token: str):
+    """Obtiene resumen financiero del microservicio de Transactions con token propagation"""
+    return await _fetch("reports", "transactions", f"{settings.TRANSACTIONS_SERVICE_URL}/transactions/reports", token, {}, parse_financial_summary)
+
+async def fetch_goals(token: str):
+    """Obtiene metas del microservicio de Goals con token propagation"""
+    return await _fetch("goals", "goals", f"{settings.GOALS_SERVICE_URL}/goals", token, [], parse_goals)
@@ -1,4 +1,5 @@
 import os
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 
@@ -7,18 +8,122 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str
     OPENAI_MODEL: str = "gpt-4o-mini"
     OPENAI_TEMPERATURE: float = 0.3
+    # Proveedor LLM: live | record | replay | synthetic
+    LLM_MODE: str = "live"
+    LLM_STORE_PATH: str = ".llm_store"  # Respuestas grabadas (record/replay)
+    LLM_SIMULATED_LATENCY_MS: float = 0.0  # Latencia simulada en replay/synthetic
+    LLM_REPLAY_SYNTHETIC_ON_MISS: bool = False  # En replay, responder sintético si no hay grabación
+    # Gateway LLM compartido (límites de la cuenta de OpenAI)
+    LLM_RPM_LIMIT: int = 500
+    LLM_TPM_LIMIT: int = 200000
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_EXPECTED_OUTPUT_TOKENS: int = 600  # Para estimar tokens antes de la llamada
+    LLM_MAX_QUEUE_WAIT_S: float = 10.0  # Espera máxima de llamadas interactivas
+    LLM_BACKGROUND_MAX_QUEUE_WAIT_S: float = 120.0  # Espera máxima de llamadas en background
+    OPENAI_MAX_RETRIES: int = 1  # Los reintentos los absorbe el gateway
+    # Presupuesto de tiempo y hedging de llamadas interactivas
+    LLM_CALL_BUDGET_S: float = 20.0  # Tiempo máximo por llamada (incluye la cola del gateway)
+    LLM_METHOD_BUDGETS_S: Dict[str, float] = {}  # Presupuesto por método, p.ej. {"review_budget": 8}
+    LLM_STRUCTURED_OUTPUT: str = "json_schema"  # json_schema (strict) | json_object | off: modo de salida pedido al proveedor
+    LLM_OUTPUT_RETRIES: int = 1  # Reintentos si la respuesta no se puede reparar ni validar con su esquema
+    LLM_HEDGE_ENABLED: bool = False  # Lanzar una segunda llamada si la primera tarda demasiado
+    LLM_HEDGE_PERCENTILE: float = 95.0  # Percentil de latencia reciente que dispara el hedge
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # Muestras mínimas antes de usar el percentil
+    LLM_HEDGE_DEFAULT_DELAY_S: float = 6.0  # Retardo del hedge mientras no hay suficientes muestras
     DATABASE_URL: str  # Base de datos PostgreSQL (finzen_ai_db)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_WARM_CONNECTIONS: int = 2  # Conexiones abiertas al arrancar (lifespan)
+    # Cliente HTTP compartido hacia los microservicios
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
     # URLs de microservicios
     # En local usa http://host.docker.internal:808X
     # En Azure usa las URLs https://...
     TRANSACTIONS_SERVICE_URL: str
     GOALS_SERVICE_URL: str
+    UPSTREAM_TIMEOUT_S: float = 5.0  # Timeout de cada llamada a Transactions / Goals
+    UPSTREAM_BREAKER_FAILURES: int = 3  # Fallos seguidos que abren el circuit breaker del servicio
+    UPSTREAM_BREAKER_RESET_S: float = 30.0  # Tiempo abierto antes de dejar pasar una llamada de prueba
+    UPSTREAM_SNAPSHOT_TTL_S: float = 86400.0  # Últimos datos buenos por token, servidos (stale) si el servicio cae
+    # Caché compartida: memory (solo en proceso) | postgres (en proceso + tabla UNLOGGED + LISTEN/NOTIFY)
+    CACHE_BACKEND: str = "memory"
+    CACHE_MEMORY_MAX_ENTRIES: int = 10000
+    CACHE_L1_MAX_TTL_S: float = 30.0  # TTL máximo en proceso cuando hay nivel compartido
+    CACHE_PURGE_INTERVAL_S: float = 300.0  # Limpieza de entradas vencidas en Postgres
+    PROFILE_CACHE_TTL_S: float = 300.0  # Perfil semántico (se invalida al actualizarse)
+    UPSTREAM_CACHE_TTL_S: float = 30.0  # Datos de Transactions / Goals por token (0 = deshabilitado)
+    LLM_CACHE_TTL_S: float = 3600.0  # Respuestas del LLM por hash del prompt (0 = deshabilitado)
+    # Caché semántica: tolerancia relativa por método al comparar los montos del contexto (sin entrada = caché exacta)
+    SEMANTIC_CACHE_TOLERANCE: Dict[str, float] = {
+        "analyze_health": 0.05,
+        "analyze_ant_expenses": 0.1,
+        "analyze_leaks": 0.1,
+        "analyze_repetitive": 0.1
+    }
+    SEMANTIC_CACHE_MIN_AMOUNT: float = 1000.0  # Montos menores (en valor absoluto) se tratan como 0
     # Configuración de memoria
     SEMANTIC_UPDATE_THRESHOLD: int = 5  # Actualizar cada 5 interacciones
     EPISODIC_RETENTION_DAYS: int = 60   # Mantener historial 60 días
+    HISTORY_PAGE_SIZE: int = 20  # Interacciones por página en /history
+    HISTORY_MAX_PAGE_SIZE: int = 100
+    SEMANTIC_UPDATE_MODE: str = "inline"  # inline (después de cada /analyze) | batch (job programado)
+    SEMANTIC_BATCH_CONCURRENCY: int = 8  # Llamadas LLM simultáneas del job de perfiles
+    SEMANTIC_BATCH_CHUNK: int = 200  # Usuarios por lote leídos de la BD
+    SEMANTIC_PACK_SIZE: int = 1  # Usuarios por prompt multi-perfil (1 = deshabilitado)
+    SEMANTIC_PACK_MAX_CHARS: int = 6000  # Historial máximo para empaquetar a un usuario
+    # Insights precalculados del dashboard
+    INSIGHTS_ENABLED: bool = True  # Servir /analyze genérico desde precomputed_insights si los datos no cambiaron
+    INSIGHTS_ACTIVE_DAYS: int = 14  # Usuarios con interacciones en estos días se recalculan en el job
+    # Registro de uso del LLM (tabla llm_usage, escrita por lotes)
+    USAGE_LEDGER_ENABLED: bool = True
+    USAGE_FLUSH_ROWS: int = 200  # Filas en memoria que disparan una escritura
+    USAGE_FLUSH_INTERVAL_S: float = 5.0  # Escritura periódica de lo pendiente
+    USAGE_MAX_BUFFER: int = 20000  # Si la BD no responde se descartan las filas más viejas por encima de esto
+    # Análisis por lotes (/analyze/batch)
+    BATCH_MAX_CONCURRENCY: int = 16  # Usuarios analizándose a la vez
+    BATCH_UPSTREAM_CONCURRENCY: int = 16  # Usuarios consultando Transactions / Goals a la vez
+    BATCH_DB_CONCURRENCY: int = 4  # Operaciones de BD simultáneas (deja conexiones del pool a los requests)
+    BATCH_LLM_CONCURRENCY: int = 8  # Análisis con llamadas al LLM en curso a la vez
+    BATCH_INPUT_DIR: Optional[str] = None  # Directorio de los archivos NDJSON de entrada (None = solo items en el body)
     # Configuración de análisis
     MAX_TRANSACTIONS_FOR_ANALYSIS: int = 100
     ANT_EXPENSE_THRESHOLD: float = 5000.0  # COP - gastos hormiga
+    # Canonicalización de comercios (descripción -> merchant_id)
+    MERCHANT_CANONICALIZATION_ENABLED: bool = True
+    MERCHANT_MINHASH_PERMUTATIONS: int = 64  # Largo de la firma MinHash
+    MERCHANT_LSH_BANDS: int = 16  # Bandas del LSH (debe dividir a las permutaciones)
+    MERCHANT_SIMILARITY_THRESHOLD: float = 0.5  # Jaccard estimado mínimo para asignar un comercio existente
+    GOAL_DEFAULT_HORIZON_MONTHS: int = 12  # Plazo supuesto para metas sin fecha límite
+    GOAL_CRITICAL_GAP_RATIO: float = 0.5  # Brecha mensual / aporte requerido a partir de la cual la meta es crítica
+    GOAL_SIMULATION_PATHS: int = 10000  # Trayectorias Monte Carlo para evaluar una meta nueva
+    GOAL_SIMULATION_MAX_MONTHS: int = 120  # Horizonte simulado para sugerir un plazo alternativo
+    GOAL_VIABILITY_PROBABILITY: float = 0.8  # Probabilidad mínima de cumplir la meta para considerarla viable
+    GOAL_MIN_HISTORY_MONTHS: int = 3  # Con menos meses de historial la confianza es baja
+    BUDGET_SIMULATION_PATHS: int = 5000  # Trayectorias del pronóstico de gasto de un presupuesto
+    BUDGET_HISTORY_DAYS: int = 180  # Ventana de historial de la categoría para el pronóstico
+    BUDGET_FORECAST_MAX_DAYS: int = 93  # Días simulados como máximo; el resto del periodo se extrapola
+    BUDGET_MIN_HISTORY_DAYS: int = 10  # Días con gasto mínimos en la ventana; si no, se usa el periodo en curso
+    BUDGET_OVERRUN_WARN_PROBABILITY: float = 0.25  # Probabilidad de pasarse desde la que el estado es "regular"
+    BUDGET_OVERRUN_BAD_PROBABILITY: float = 0.6  # Probabilidad de pasarse desde la que el estado es "mal"
+    # Deadline por request (se reparte entre microservicios, BD y LLM)
+    REQUEST_DEADLINE_HEADER: str = "X-Request-Timeout"  # Segundos que el cliente está dispuesto a esperar
+    REQUEST_DEFAULT_DEADLINE_S: float = 30.0  # Deadline de los endpoints sin uno propio
+    REQUEST_DEADLINES_S: Dict[str, float] = {"/analyze/batch": 0}  # Por ruta, p.ej. {"/chat": 15}; 0 = sin deadline
+    REQUEST_MAX_DEADLINE_S: float = 120.0  # Tope para el valor de la cabecera
+    REQUEST_DEADLINE_FALLBACK_MARGIN_S: float = 0.3  # Microservicios y LLM se cortan antes, para responder con el respaldo local
+    # Control de admisión (503 + Retry-After en los endpoints caros bajo sobrecarga)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_SHED_PATHS: List[str] = ["/budget/"]  # Exactas, o prefijos si terminan en "/" (/analyze se admite en el handler)
+    ADMISSION_MAX_IN_FLIGHT: int = 64  # Requests caros en curso; 0 = sin límite
+    ADMISSION_MAX_LLM_QUEUE: int = 32  # Llamadas interactivas esperando en el gateway LLM; 0 = sin límite
+    ADMISSION_RETRY_AFTER_S: float = 2.0  # Retry-After con carga justo en el límite (crece con la sobrecarga)
+    ADMISSION_MAX_RETRY_AFTER_S: int = 30
+    # Observabilidad
+    TRACING_ENABLED: bool = False  # Trazas por request (cabecera Server-Timing)
+    TRACE_EXPORT_PATH: Optional[str] = None  # Archivo OTLP/JSON (una traza por línea)
+    PROFILER_INTERVAL_MS: float = 5.0  # Intervalo de muestreo del profiler
+    ADMIN_TOKEN: Optional[str] = None  # Token para cabeceras y endpoints de administración
     class Config:
         env_file = ".env"
         case_sensitive = True
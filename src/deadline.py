@@ -0,0 +1,133 @@
+"""
+Deadline de extremo a extremo por request.
+
+DeadlineMiddleware fija el instante límite del request (cabecera
+REQUEST_DEADLINE_HEADER del cliente, en segundos, o el default del endpoint)
+en un ContextVar. Cada etapa toma de ahí el tiempo que le queda:
+- las llamadas a Transactions / Goals, como timeout de httpx;
+- las consultas a la BD, como statement_timeout (Postgres);
+- las llamadas al LLM, como tope de su presupuesto.
+Las llamadas a microservicios y al LLM se cortan REQUEST_DEADLINE_FALLBACK_MARGIN_S
+antes del deadline: ese margen queda para que el agente arme su respuesta
+de respaldo (degraded) en vez de que el request termine en 504.
+
+Al vencer el deadline se cancela el handler (y con él las llamadas en curso
+al LLM y a los microservicios) y se responde 504, así un request abandonado
+no sigue gastando tokens ni conexiones del pool. El deadline cubre hasta que
+se envía la respuesta: las background tasks posteriores no se cancelan y
+corren sin deadline (detached).
+"""
+import asyncio
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+from starlette.responses import JSONResponse
+from src.config import settings
+from src.observability.metrics import record_error
+
+_deadline: ContextVar[Optional[float]] = ContextVar("finzen_deadline", default=None)
+
+class DeadlineExceeded(TimeoutError):
+    """El request agotó su deadline"""
+
+def remaining() -> Optional[float]:
+    """Segundos que le quedan al request (None si no tiene deadline)"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def budget(limit: Optional[float] = None, reserve: Optional[float] = None) -> Optional[float]:
+    """
+    Tiempo disponible para una etapa: el menor entre su propio límite y lo que
+    le queda al request menos `reserve` (por defecto el margen para la
+    respuesta de respaldo). Lanza DeadlineExceeded si ya no queda tiempo.
+    """
+    left = remaining()
+    if left is None:
+        return limit
+    left -= settings.REQUEST_DEADLINE_FALLBACK_MARGIN_S if reserve is None else reserve
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return left if limit is None else min(limit, left)
+
+def detached(fn):
+    """Envuelve la función async `fn` para que corra sin el deadline del request (background tasks)"""
+    @wraps(fn)
+    async def run(*args, **kwargs):
+        _deadline.set(None)
+        return await fn(*args, **kwargs)
+    return run
+
+def request_timeout(path: str, header: Optional[str]) -> Optional[float]:
+    """Deadline en segundos: el de la cabecera (acotado) o el del endpoint; None = sin deadline"""
+    default = settings.REQUEST_DEADLINES_S.get(path, settings.REQUEST_DEFAULT_DEADLINE_S)
+    if header:
+        try:
+            requested = float(header)
+        except ValueError:
+            requested = 0.0
+        if requested > 0:
+            return min(requested, settings.REQUEST_MAX_DEADLINE_S)
+    return default if default > 0 else None
+
+class DeadlineMiddleware:
+    """Middleware ASGI: fija el deadline y cancela el request cuando vence"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        header = dict(scope["headers"]).get(settings.REQUEST_DEADLINE_HEADER.lower().encode("latin-1"))
+        timeout = request_timeout(scope["path"], header.decode("latin-1") if header else None)
+        if timeout is None:
+            return await self.app(scope, receive, send)
+
+        started = False
+        completed = asyncio.Event()
+
+        async def send_tracking(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                completed.set()
+
+        _deadline.set(time.monotonic() + timeout)
+        handler = asyncio.ensure_future(self.app(scope, receive, send_tracking))
+        response_sent = asyncio.ensure_future(completed.wait())
+        try:
+            await asyncio.wait({handler, response_sent}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            handler.cancel()
+            raise
+        finally:
+            response_sent.cancel()
+
+        if handler.done() or completed.is_set():
+            # Respuesta enviada: lo que siga (background tasks) ya no tiene deadline
+            try:
+                return await handler
+            except DeadlineExceeded:
+                if completed.is_set():
+                    return
+                await self._timed_out(scope, receive, send, timeout, started)
+                return
+
+        handler.cancel()
+        try:
+            await handler
+        except (asyncio.CancelledError, DeadlineExceeded):
+            pass
+        await self._timed_out(scope, receive, send, timeout, started)
+
+    async def _timed_out(self, scope, receive, send, timeout: float, started: bool) -> None:
+        record_error("request_deadline")
+        print(f" Request deadline exceeded ({timeout:.1f}s): {scope['path']}")
+        if started:
+            # La respuesta quedó a medias: se corta la conexión
+            raise DeadlineExceeded("request deadline exceeded after the response started")
+        response = JSONResponse({"detail": "Request deadline exceeded"}, status_code=504)
+        await response(scope, receive, send)
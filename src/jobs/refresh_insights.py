@@ -0,0 +1,65 @@
+"""
+Job programado: recalcula los insights del dashboard de los usuarios activos.
+
+Los tokens de servicio vienen de un archivo NDJSON ({"user_id": ..., "token": ...}
+por línea). Solo se procesan los usuarios con interacciones en los últimos
+INSIGHTS_ACTIVE_DAYS días; los que no cambiaron de datos salen de
+precomputed_insights sin llamar al LLM. El job no deja interacciones en la
+memoria episódica: no aparece en /history ni mantiene "activo" al usuario.
+    python -m src.jobs.refresh_insights --tokens /data/service_tokens.ndjson --max-concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import time
+from src.config import settings
+
+def _user_id(line: str):
+    try:
+        return json.loads(line).get("user_id")
+    except ValueError:
+        return None
+
+async def refresh(tokens_path: str, active_days: int, offset: int, max_concurrency):
+    # Importa la app para reutilizar los agentes y el análisis por lotes
+    from src.main import BatchAnalyzeInput, get_memory_manager, stream_batch_analysis
+    from src.clients.upstream import close_http_client
+    from src.memory.usage import usage_ledger
+
+    active = set(get_memory_manager().get_active_user_ids(active_days))
+    print(f" {len(active)} active users in the last {active_days} days")
+
+    def source():
+        with open(tokens_path, encoding="utf-8") as tokens:
+            lines = (line for line in tokens if line.strip() and _user_id(line) in active)
+            for index, line in enumerate(lines):
+                if index >= offset:
+                    yield index, line
+
+    summary = {}
+    try:
+        async for raw in stream_batch_analysis(BatchAnalyzeInput(items=[], offset=offset, max_concurrency=max_concurrency), source(), "job:refresh_insights", record_interaction=False):
+            line = json.loads(raw)
+            if line.get("summary"):
+                summary = line
+            elif line["status"] == "error":
+                print(f" User {line['user_id']} failed: {line['error']} (resume with --offset {line['next_offset']})")
+    finally:
+        await close_http_client()
+        usage_ledger.flush()
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula los insights del dashboard de los usuarios activos")
+    parser.add_argument("--tokens", required=True, help="NDJSON con user_id y token de servicio por línea")
+    parser.add_argument("--active-days", type=int, default=settings.INSIGHTS_ACTIVE_DAYS, help="Ventana de actividad")
+    parser.add_argument("--offset", type=int, default=0, help="Reanudar desde este usuario activo")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="Usuarios procesándose a la vez")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = asyncio.run(refresh(args.tokens, args.active_days, args.offset, args.max_concurrency))
+    print(f" Insights refresh finished: {summary.get('processed', 0)} users, {summary.get('failed', 0)} failed, next offset {summary.get('next_offset')} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Job programado: regenera por lotes los perfiles semánticos pendientes.
+
+Pensado para correr desde cron / Container Apps Job con SEMANTIC_UPDATE_MODE=batch:
+    python -m src.jobs.regenerate_profiles --max-concurrency 8 --pack-size 4
+"""
+import argparse
+import asyncio
+import time
+from src.memory.manager import MemoryManager
+from src.memory.usage import usage_ledger, set_usage_context
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenera los perfiles semánticos pendientes")
+    parser.add_argument("--limit", type=int, default=None, help="Máximo de usuarios a procesar")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="Llamadas LLM simultáneas")
+    parser.add_argument("--pack-size", type=int, default=None, help="Usuarios por prompt multi-perfil")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    set_usage_context("job:regenerate_profiles")
+    try:
+        updated = asyncio.run(MemoryManager().regenerate_pending_profiles(
+            limit=args.limit,
+            max_concurrency=args.max_concurrency,
+            pack_size=args.pack_size
+        ))
+    finally:
+        usage_ledger.flush()
+    print(f" Profile regeneration finished: {updated} profiles in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+import openai
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from src.config import settings
+from src.observability.metrics import (
+    PROMPT_BUILD_SECONDS,
+    LLM_CALL_SECONDS,
+    OUTPUT_PARSE_SECONDS,
+    LLM_HEDGES,
+    LLM_OUTPUT_REPAIRS,
+    timer,
+    record_error,
+    record_tokens
+)
+from src.observability.tracing import span
+from src.llm.gateway import gateway, estimate_tokens
+from src.llm.prompts import prompts
+from src.llm.provider import prompt_hash
+from src.llm.semantic_cache import semantic_key
+from src.llm.structured import OutputRepairError, parse_output, response_format
+from src.cache.backend import get_cache
+from src.memory.usage import usage_ledger
+from src import deadline
+
+# Prioridad de las llamadas que no indican una (el batch de /analyze/batch la baja a background)
+default_priority: ContextVar[str] = ContextVar("llm_default_priority", default="interactive")
+
+class LLMDeadlineExceeded(TimeoutError):
+    """La llamada al LLM no terminó dentro de su presupuesto de tiempo"""
+
+class LatencyWindow:
+    """Latencias recientes (exitosas) por método, para calcular el retardo del hedge"""
+
+    def __init__(self, size: int = 200):
+        self.size = size
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, method: str, seconds: float) -> None:
+        self._samples.setdefault(method, deque(maxlen=self.size)).append(seconds)
+
+    def percentile(self, method: str, pct: float, min_samples: int = 1) -> Optional[float]:
+        samples = self._samples.get(method)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+latencies = LatencyWindow()
+
+def call_budget(method: str) -> float:
+    """Presupuesto de tiempo de la llamada (por método o el general)"""
+    return settings.LLM_METHOD_BUDGETS_S.get(method, settings.LLM_CALL_BUDGET_S)
+
+def hedge_delay(method: str) -> float:
+    """Segundos de espera antes de lanzar el hedge: percentil de la latencia reciente del método"""
+    delay = latencies.percentile(method, settings.LLM_HEDGE_PERCENTILE, settings.LLM_HEDGE_MIN_SAMPLES)
+    return delay if delay is not None else settings.LLM_HEDGE_DEFAULT_DELAY_S
+
+async def invoke_json_chain(prompt: ChatPromptTemplate, llm, variables: Dict[str, Any], analyzer: str, method: str, priority: Optional[str] = None) -> Dict:
+    """
+    Equivalente a `(prompt | llm | JsonOutputParser()).ainvoke(variables)`,
+    pero separando las etapas (prompt, LLM, parseo) para medir cada una.
+    La llamada al LLM pasa por el gateway compartido con la prioridad indicada.
+
+    Si el prompt registró un esquema de salida, se pide en modo JSON-schema y
+    la respuesta se repara y valida localmente (src.llm.structured); solo si
+    no es reparable se repite la llamada (LLM_OUTPUT_RETRIES).
+
+    Las llamadas interactivas tienen un presupuesto de tiempo (LLMDeadlineExceeded
+    al agotarse, para que el agente responda con su respaldo local) y, si
+    LLM_HEDGE_ENABLED, una segunda llamada cuando la primera supera el percentil
+    de latencia reciente del método. Dentro de un request con deadline el
+    presupuesto se acota a lo que le queda al request (también en background).
+    Sin `priority` se usa la del contexto (default_priority).
+    """
+    priority = priority or default_priority.get()
+    with timer(PROMPT_BUILD_SECONDS.labels(analyzer, method)), span(f"prompt.{method}"):
+        messages = prompt.format_messages(**variables)
+
+    # Mismo prompt completo (modelo, temperatura, mensajes) -> misma respuesta.
+    # Los métodos con tolerancia usan la clave semántica (src.llm.semantic_cache)
+    cache_key = None
+    if settings.LLM_CACHE_TTL_S > 0:
+        model, temperature = getattr(llm, "model_name", type(llm).__name__), getattr(llm, "temperature", None)
+        cache_key = semantic_key(model, temperature, method, variables)
+        namespace = "llm" if cache_key is None else "semantic"
+        cache_key = cache_key or prompt_hash(model, temperature, messages)
+        cached = await get_cache().aget(namespace, cache_key)
+        if cached is not None:
+            return cached
+
+    interactive = priority == "interactive"
+    budget = deadline.budget(call_budget(method) if interactive else None)
+    if budget is None:
+        result = await _complete(llm, messages, analyzer, method, priority)
+    else:
+        try:
+            result = await asyncio.wait_for(_complete(llm, messages, analyzer, method, priority), timeout=budget)
+        except asyncio.TimeoutError:
+            record_error("llm_deadline")
+            raise LLMDeadlineExceeded(f"{method} exceeded its {budget:.1f}s budget")
+
+    if cache_key is not None:
+        await get_cache().aset(namespace, cache_key, result, settings.LLM_CACHE_TTL_S)
+    return result
+
+async def _complete(llm, messages, analyzer: str, method: str, priority: str) -> Dict:
+    """Llamada al LLM + parseo, repitiendo la llamada si la respuesta no es reparable"""
+    call = _hedged_call if priority == "interactive" else _call_llm
+    for attempt in range(settings.LLM_OUTPUT_RETRIES + 1):
+        message = await call(llm, messages, analyzer, method, priority)
+        record_tokens(analyzer, message.usage_metadata)
+        try:
+            return _parse(message, analyzer, method)
+        except OutputRepairError as e:
+            last = attempt == settings.LLM_OUTPUT_RETRIES
+            LLM_OUTPUT_REPAIRS.labels(method, "failed" if last else "retried").inc()
+            print(f" Invalid {method} output (attempt {attempt + 1}): {e}")
+            if last:
+                raise
+
+async def _call_llm(llm, messages, analyzer: str, method: str, priority: str):
+    kwargs = {}
+    output_format = response_format(prompts.output(method))
+    if output_format is not None:
+        kwargs["response_format"] = output_format
+    try:
+        async with gateway.reserve(estimate_tokens(messages), priority) as lease:
+            start = time.perf_counter()
+            with timer(LLM_CALL_SECONDS.labels(analyzer, method)), span(f"llm.{method}", analyzer=analyzer, prompt_version=prompts.version(method)):
+                message = await llm.ainvoke(messages, config=_run_config(analyzer, method), **kwargs)
+            elapsed = time.perf_counter() - start
+            latencies.observe(method, elapsed)
+            usage_ledger.record(analyzer, method, getattr(llm, "model_name", type(llm).__name__), message.usage_metadata, elapsed)
+            if message.usage_metadata:
+                lease.actual_tokens = message.usage_metadata.get("total_tokens")
+    except openai.RateLimitError:
+        gateway.on_rate_limited()
+        record_error("llm_rate_limited")
+        raise
+    except Exception:
+        record_error("llm_call")
+        raise
+    return message
+
+async def _hedged_call(llm, messages, analyzer: str, method: str, priority: str):
+    """Devuelve la primera respuesta exitosa entre la llamada original y su hedge"""
+    if not settings.LLM_HEDGE_ENABLED:
+        return await _call_llm(llm, messages, analyzer, method, priority)
+
+    primary = asyncio.create_task(_call_llm(llm, messages, analyzer, method, priority))
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay(method))
+        if done:
+            return primary.result()
+        if gateway.queue_depth > 0:
+            # Con cola en el gateway el hedge solo agregaría carga
+            return await primary
+
+        hedge = asyncio.create_task(_call_llm(llm, messages, analyzer, method, priority))
+        tasks.add(hedge)
+        error: Optional[BaseException] = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    LLM_HEDGES.labels(analyzer, method, "primary" if task is primary else "hedge").inc()
+                    return task.result()
+                error = task.exception()
+        LLM_HEDGES.labels(analyzer, method, "none").inc()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def invoke_json_chain_batch(prompt: ChatPromptTemplate, llm, variables_list: List[Dict[str, Any]], analyzer: str, method: str, priority: str = "background", max_concurrency: int = 4) -> List:
+    """
+    Versión por lotes de `invoke_json_chain` (`abatch` con concurrencia acotada).
+    Devuelve, por cada entrada, el dict resultante o la excepción.
+    """
+    if not variables_list:
+        return []
+
+    async def run_one(variables: Dict[str, Any]) -> Dict:
+        return await invoke_json_chain(prompt, llm, variables, analyzer, method, priority)
+
+    return await RunnableLambda(run_one).abatch(
+        variables_list,
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True
+    )
+
+def _run_config(analyzer: str, method: str) -> Dict:
+    # El proveedor (modo synthetic/record) usa la metadata para identificar el método
+    return {"metadata": {"analyzer": analyzer, "method": method, "prompt_version": prompts.version(method)}}
+
+def _parse(message, analyzer: str, method: str) -> Dict:
+    try:
+        with timer(OUTPUT_PARSE_SECONDS.labels(analyzer, method)), span(f"parse.{method}"):
+            result, repaired = parse_output(message.content, prompts.output(method))
+    except OutputRepairError:
+        record_error("output_parse")
+        raise
+    if repaired:
+        LLM_OUTPUT_REPAIRS.labels(method, "repaired").inc()
+    return result
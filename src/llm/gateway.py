@@ -0,0 +1,203 @@
+"""
+Gateway compartido para todas las llamadas al LLM.
+
+Aplica dos token buckets (requests/min y tokens estimados/min) y un límite
+de concurrencia. Las llamadas esperan en una cola con prioridad: las
+interactivas (requests de usuario) pasan antes que las de background
+(regeneración de perfiles semánticos). Si la espera estimada supera el
+máximo configurado se rechaza la llamada con LLMOverloadedError, para que
+el agente devuelva su respuesta de respaldo en vez de reintentar.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from src.config import settings
+from src.observability.metrics import LLM_QUEUE_WAIT_SECONDS, LLM_QUEUE_DEPTH, LLM_REJECTIONS
+
+PRIORITIES: Dict[str, int] = {"interactive": 0, "background": 1}
+
+class LLMOverloadedError(Exception):
+    """El gateway no puede atender la llamada dentro del tiempo máximo de espera"""
+
+class TokenBucket:
+
+    def __init__(self, capacity: float, per_second: float):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.available = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.per_second)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos hasta que `amount` esté disponible (0 si ya lo está)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.per_second
+
+    def projected_wait(self, amount: float) -> float:
+        """Como wait_time, pero sin limitar `amount` a la capacidad (para acumulados de la cola)"""
+        self._refill()
+        return max(0.0, (amount - self.available) / self.per_second)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        self._refill()
+        self.available = min(self.capacity, self.available + amount)
+
+    def drain(self) -> None:
+        self._refill()
+        self.available = min(self.available, 0.0)
+
+class _Waiter:
+    __slots__ = ("priority", "tokens", "future", "enqueued")
+
+    def __init__(self, priority: int, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.tokens = tokens
+        self.future = future
+        self.enqueued = time.monotonic()
+
+class Lease:
+    """Reserva concedida por el gateway; `actual_tokens` ajusta el bucket al terminar"""
+    __slots__ = ("estimated_tokens", "actual_tokens")
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens: Optional[int] = None
+
+class LLMGateway:
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_concurrency: int):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self._queue: List = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_deadline = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def interactive_queue_depth(self) -> int:
+        """Llamadas interactivas esperando (las de background no demoran a las interactivas)"""
+        return sum(1 for entry in self._queue if entry[0] == PRIORITIES["interactive"] and not entry[2].future.done())
+
+    @asynccontextmanager
+    async def reserve(self, estimated_tokens: int, priority: str = "interactive"):
+        """Espera turno en la cola; libera el cupo de concurrencia al salir"""
+        lease = await self._acquire(estimated_tokens, priority)
+        try:
+            yield lease
+        finally:
+            self._release(lease)
+
+    async def _acquire(self, estimated_tokens: int, priority: str) -> Lease:
+        max_wait = settings.LLM_BACKGROUND_MAX_QUEUE_WAIT_S if priority == "background" else settings.LLM_MAX_QUEUE_WAIT_S
+        # Rechazo inmediato si el bucket de tokens no alcanzaría a cubrir lo ya encolado
+        queued_tokens = sum(entry[2].tokens for entry in self._queue) + estimated_tokens
+        if self.tokens.projected_wait(queued_tokens) > max_wait:
+            LLM_REJECTIONS.labels(priority).inc()
+            raise LLMOverloadedError(f"LLM over capacity ({self.queue_depth} queued)")
+
+        waiter = _Waiter(PRIORITIES[priority], estimated_tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, (waiter.priority, next(self._seq), waiter))
+        LLM_QUEUE_DEPTH.set(len(self._queue))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max_wait)
+        except asyncio.TimeoutError:
+            if not waiter.future.done():
+                waiter.future.cancel()
+                self._remove(waiter)
+                LLM_REJECTIONS.labels(priority).inc()
+                raise LLMOverloadedError(f"LLM queue wait exceeded {max_wait}s")
+        except asyncio.CancelledError:
+            # El request fue cancelado mientras esperaba turno
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(waiter.future.result())
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+            raise
+        LLM_QUEUE_WAIT_SECONDS.labels(priority).observe(time.monotonic() - waiter.enqueued)
+        return waiter.future.result()
+
+    def _remove(self, waiter: _Waiter) -> None:
+        self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+        heapq.heapify(self._queue)
+        LLM_QUEUE_DEPTH.set(len(self._queue))
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Concede turnos en orden de prioridad mientras haya capacidad"""
+        while self._queue:
+            waiter = self._queue[0][2]
+            if waiter.future.done():
+                heapq.heappop(self._queue)
+                continue
+            if self.in_flight >= self.max_concurrency:
+                break  # _release vuelve a despachar
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(waiter.tokens))
+            if wait > 0:
+                self._schedule(wait)
+                break
+            heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            self.in_flight += 1
+            waiter.future.set_result(Lease(waiter.tokens))
+        LLM_QUEUE_DEPTH.set(len(self._queue))
+
+    def _schedule(self, delay: float) -> None:
+        deadline = time.monotonic() + delay
+        if self._timer is not None:
+            if self._timer_deadline <= deadline:
+                return
+            self._timer.cancel()
+        def fire():
+            self._timer = None
+            self._dispatch()
+        self._timer_deadline = deadline
+        self._timer = asyncio.get_running_loop().call_later(delay, fire)
+
+    def _release(self, lease: Lease) -> None:
+        self.in_flight -= 1
+        if lease.actual_tokens is not None:
+            # Ajustar el bucket al consumo real
+            difference = lease.estimated_tokens - lease.actual_tokens
+            if difference > 0:
+                self.tokens.give_back(difference)
+            else:
+                self.tokens.take(-difference)
+        self._dispatch()
+
+    def on_rate_limited(self) -> None:
+        """El proveedor devolvió 429: vaciar los buckets en vez de reintentar en ráfaga"""
+        self.requests.drain()
+        self.tokens.drain()
+
+def estimate_tokens(messages) -> int:
+    """Tokens estimados de la llamada (~4 caracteres por token + salida esperada)"""
+    return sum(len(str(m.content)) for m in messages) // 4 + settings.LLM_EXPECTED_OUTPUT_TOKENS
+
+gateway = LLMGateway(
+    requests_per_minute=settings.LLM_RPM_LIMIT,
+    tokens_per_minute=settings.LLM_TPM_LIMIT,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY
+)
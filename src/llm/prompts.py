@@ -0,0 +1,79 @@
+"""
+Registro de prompts versionados.
+
+Cada prompt se compila una sola vez al importar el módulo del agente que lo
+define. Se separa en dos mensajes:
+- system: instrucciones y esquema de salida, 100% estáticos. Es el prefijo
+  común a todos los usuarios, el que puede reutilizar la caché de prefijos
+  del proveedor.
+- human: los datos del usuario (perfil, contexto, transacciones), siempre al final.
+
+Al cambiar el texto de un prompt se debe subir su versión; la versión viaja
+en la metadata de la llamada y se expone en /metrics (finzen_prompt_info).
+El esquema de salida (`output`) se pide al proveedor y valida la respuesta
+(src.llm.structured). Las variables de `quantize` (montos del contexto) se
+comparan por rangos en la caché semántica (src.llm.semantic_cache).
+"""
+import textwrap
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Type
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from pydantic import BaseModel
+from src.observability.metrics import PROMPT_INFO
+
+@dataclass(frozen=True)
+class RegisteredPrompt:
+    method: str
+    version: str
+    template: ChatPromptTemplate
+    output: Optional[Type[BaseModel]] = None
+    quantize: Tuple[str, ...] = ()
+
+class PromptRegistry:
+
+    def __init__(self):
+        self._prompts: Dict[str, RegisteredPrompt] = {}
+
+    def register(self, method: str, version: str, instructions: str, data: str, output: Optional[Type[BaseModel]] = None, quantize: Tuple[str, ...] = ()) -> ChatPromptTemplate:
+        """
+        Compila y registra el prompt de `method`.
+        `instructions` no puede tener variables: cualquier dato del usuario va en `data`.
+        """
+        if method in self._prompts:
+            raise ValueError(f"Prompt ya registrado: {method}")
+        instructions = textwrap.dedent(instructions).strip()
+        data = textwrap.dedent(data).strip()
+        variables = PromptTemplate.from_template(instructions).input_variables
+        if variables:
+            raise ValueError(f"Las instrucciones de {method} deben ser estáticas (variables: {variables})")
+        unknown = set(quantize) - set(PromptTemplate.from_template(data).input_variables)
+        if unknown:
+            raise ValueError(f"Variables a cuantizar que no están en los datos de {method}: {sorted(unknown)}")
+
+        template = ChatPromptTemplate.from_messages([("system", instructions), ("human", data)])
+        self._prompts[method] = RegisteredPrompt(method, version, template, output, tuple(quantize))
+        PROMPT_INFO.labels(method, version).set(1)
+        return template
+
+    def get(self, method: str) -> RegisteredPrompt:
+        return self._prompts[method]
+
+    def version(self, method: str) -> str:
+        """Versión del prompt del método ('unregistered' si no está en el registro)"""
+        registered = self._prompts.get(method)
+        return registered.version if registered else "unregistered"
+
+    def output(self, method: str) -> Optional[Type[BaseModel]]:
+        """Esquema de salida del método (None si no tiene o no está registrado)"""
+        registered = self._prompts.get(method)
+        return registered.output if registered else None
+
+    def quantized(self, method: str) -> Tuple[str, ...]:
+        """Variables numéricas del contexto que la caché semántica compara por rangos"""
+        registered = self._prompts.get(method)
+        return registered.quantize if registered else ()
+
+    def versions(self) -> Dict[str, str]:
+        return {method: registered.version for method, registered in self._prompts.items()}
+
+prompts = PromptRegistry()
@@ -0,0 +1,202 @@
+"""
+Proveedor de modelos de chat.
+
+LLM_MODE controla qué modelo reciben los agentes:
+- live: ChatOpenAI directo.
+- record: ChatOpenAI y cada respuesta se guarda en LLM_STORE_PATH (hash del prompt -> respuesta).
+- replay: sirve las respuestas grabadas, con latencia simulada opcional. Sin red.
+- synthetic: genera JSON válido para el método de análisis que llama. Sin red.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from langchain_openai import ChatOpenAI
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from src.config import settings
+from src.llm.synthetic import synthetic_response
+
+LLM_MODES = ("live", "record", "replay", "synthetic")
+
+class LLMReplayMissError(KeyError):
+    """No hay respuesta grabada para el prompt en modo replay"""
+
+def prompt_hash(model: str, temperature: float, messages: List[BaseMessage]) -> str:
+    """Hash estable del prompt completo (modelo, temperatura y mensajes)"""
+    payload = json.dumps({
+        "model": model,
+        "temperature": temperature,
+        "messages": [[m.type, m.content] for m in messages]
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseStore:
+    """Almacén en disco: un archivo JSON por hash de prompt"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._file(key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, record: Dict) -> None:
+        file = self._file(key)
+        with self._lock:
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            tmp = f"{file}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, file)
+
+def _result(content: str, usage: Optional[Dict]) -> ChatResult:
+    return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+def _estimate_usage(messages: List[BaseMessage], content: str) -> Dict:
+    # ~4 caracteres por token
+    input_tokens = sum(len(str(m.content)) for m in messages) // 4
+    output_tokens = len(content) // 4
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+class RecordingChatModel(BaseChatModel):
+    """Llama al modelo real y graba cada respuesta"""
+    inner: Any
+    store: Any
+    model_name: str
+    temperature: float
+
+    @property
+    def _llm_type(self) -> str:
+        return "finzen-record"
+
+    def _record(self, messages: List[BaseMessage], message: AIMessage, run_manager) -> None:
+        self.store.put(prompt_hash(self.model_name, self.temperature, messages), {
+            "content": message.content,
+            "usage_metadata": message.usage_metadata,
+            "method": (run_manager.metadata or {}).get("method") if run_manager else None
+        })
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self.inner.invoke(messages, stop=stop, **kwargs)
+        self._record(messages, message, run_manager)
+        return _result(message.content, message.usage_metadata)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = await self.inner.ainvoke(messages, stop=stop, **kwargs)
+        self._record(messages, message, run_manager)
+        return _result(message.content, message.usage_metadata)
+
+class ReplayChatModel(BaseChatModel):
+    """Devuelve respuestas grabadas; opcionalmente sintéticas cuando no existen"""
+    store: Any
+    model_name: str
+    temperature: float
+    latency_ms: float = 0.0
+    synthetic_on_miss: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "finzen-replay"
+
+    def _lookup(self, messages, run_manager) -> ChatResult:
+        key = prompt_hash(self.model_name, self.temperature, messages)
+        record = self.store.get(key)
+        if record is None:
+            if not self.synthetic_on_miss:
+                raise LLMReplayMissError(key)
+            return _synthetic(messages, run_manager, key)
+        return _result(record["content"], record.get("usage_metadata"))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._lookup(messages, run_manager)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._lookup(messages, run_manager)
+
+class SyntheticChatModel(BaseChatModel):
+    """Genera JSON válido para el método que llama (metadata 'method')"""
+    model_name: str
+    temperature: float
+    latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "finzen-synthetic"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return _synthetic(messages, run_manager, prompt_hash(self.model_name, self.temperature, messages))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return _synthetic(messages, run_manager, prompt_hash(self.model_name, self.temperature, messages))
+
+def _synthetic(messages, run_manager, key: str) -> ChatResult:
+    method = (run_manager.metadata or {}).get("method") if run_manager else None
+    prompt = "\n".join(m.content for m in messages if isinstance(m.content, str))
+    content = json.dumps(synthetic_response(method, int(key[:16], 16), prompt), ensure_ascii=False)
+    return _result(content, _estimate_usage(messages, content))
+
+_store: Optional[ResponseStore] = None
+
+def get_response_store() -> ResponseStore:
+    global _store
+    if _store is None:
+        _store = ResponseStore(settings.LLM_STORE_PATH)
+    return _store
+
+def create_chat_model(temperature: Optional[float] = None) -> BaseChatModel:
+    """Crea el modelo de chat según LLM_MODE"""
+    mode = settings.LLM_MODE
+    if mode not in LLM_MODES:
+        raise ValueError(f"LLM_MODE inválido: {mode}. Opciones: {', '.join(LLM_MODES)}")
+    if temperature is None:
+        temperature = settings.OPENAI_TEMPERATURE
+
+    if mode == "synthetic":
+        return SyntheticChatModel(
+            model_name=settings.OPENAI_MODEL,
+            temperature=temperature,
+            latency_ms=settings.LLM_SIMULATED_LATENCY_MS
+        )
+    if mode == "replay":
+        return ReplayChatModel(
+            store=get_response_store(),
+            model_name=settings.OPENAI_MODEL,
+            temperature=temperature,
+            latency_ms=settings.LLM_SIMULATED_LATENCY_MS,
+            synthetic_on_miss=settings.LLM_REPLAY_SYNTHETIC_ON_MISS
+        )
+
+    llm = ChatOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        model=settings.OPENAI_MODEL,
+        temperature=temperature,
+        max_retries=settings.OPENAI_MAX_RETRIES
+    )
+    if mode == "record":
+        return RecordingChatModel(
+            inner=llm,
+            store=get_response_store(),
+            model_name=settings.OPENAI_MODEL,
+            temperature=temperature
+        )
+    return llm
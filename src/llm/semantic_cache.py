@@ -0,0 +1,59 @@
+"""
+Caché semántica de los análisis.
+
+La caché exacta (hash del prompt completo) falla con cambios mínimos del
+contexto: un excedente de 1.203.500 en vez de 1.200.000 cambia el prompt y
+obliga a llamar de nuevo al LLM con un resultado prácticamente igual.
+Para los métodos con tolerancia en SEMANTIC_CACHE_TOLERANCE la clave es:
+- la ruta: el método del analizador elegido (y la versión de su prompt), sin
+  importar cómo se formuló la consulta;
+- la huella de los datos que entran al prompt (ventana de transacciones,
+  perfil, etc.), tal cual: una transacción nueva dentro de la ventana cambia
+  la huella, así que la entrada anterior deja de servirse;
+- las variables numéricas del contexto que el prompt declara en `quantize`
+  (ingreso, excedente...), cuantizadas en rangos de ancho relativo igual a la
+  tolerancia del método.
+"""
+import hashlib
+import json
+import math
+from typing import Any, Dict, Iterable, Optional
+from src.config import settings
+from src.llm.prompts import prompts
+
+def quantize(value: Any, tolerance: float) -> Any:
+    """
+    Rango logarítmico de `value`, de ancho relativo `tolerance`: los montos de
+    un mismo rango difieren a lo sumo en esa proporción. Los menores a
+    SEMANTIC_CACHE_MIN_AMOUNT en valor absoluto cuentan como 0. Lo que no es
+    numérico queda igual.
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    if not math.isfinite(number) or abs(number) < settings.SEMANTIC_CACHE_MIN_AMOUNT:
+        return 0
+    bucket = math.floor(math.log(abs(number) / settings.SEMANTIC_CACHE_MIN_AMOUNT) / math.log1p(tolerance))
+    return bucket + 1 if number > 0 else -bucket - 1
+
+def data_window_hash(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def semantic_key(model: str, temperature: Optional[float], method: str, variables: Dict[str, Any]) -> Optional[str]:
+    """Clave semántica de la llamada, o None si el método no tiene tolerancia (caché exacta)"""
+    tolerance = settings.SEMANTIC_CACHE_TOLERANCE.get(method)
+    if tolerance is None or tolerance <= 0:
+        return None
+    quantized: Iterable[str] = prompts.quantized(method)
+    context = {name: quantize(variables.get(name), tolerance) for name in quantized}
+    data = {name: value for name, value in variables.items() if name not in context}
+    return data_window_hash({
+        "model": model,
+        "temperature": temperature,
+        "route": method,
+        "version": prompts.version(method),
+        "tolerance": tolerance,
+        "data": data_window_hash(data),
+        "context": context
+    })
@@ -0,0 +1,221 @@
+"""
+Salidas estructuradas del LLM.
+
+Cada prompt registra su esquema de salida (modelo Pydantic, ver
+PromptRegistry.register). Con él:
+- se pide al proveedor el modo JSON-schema (response_format), según
+  LLM_STRUCTURED_OUTPUT;
+- la respuesta se repara localmente si hace falta (bloque ```json, texto
+  alrededor, comas finales, JSON truncado) y se valida con el esquema, que
+  además normaliza tipos: montos como "$1.200.000", enteros como 3.0,
+  enums con otra capitalización, un string donde se esperaba una lista.
+
+Solo si nada de eso alcanza la salida se da por inválida (OutputRepairError)
+y la cadena reintenta la llamada.
+"""
+import json
+import re
+from functools import lru_cache
+from typing import Annotated, Any, Dict, List, Literal, Optional, Tuple, Type
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, ValidationError
+from src.config import settings
+
+# Cuántos cortes (elementos incompletos al final) se prueban al reparar JSON truncado
+MAX_TRUNCATION_CUTS = 8
+
+class OutputRepairError(ValueError):
+    """La respuesta del LLM no es JSON reparable o no cumple el esquema"""
+
+class LLMOutput(BaseModel):
+    """Base de los esquemas de salida: los campos que el LLM agregue de más se ignoran"""
+    model_config = ConfigDict(extra="ignore")
+
+# --- Normalización de tipos ---
+
+def _to_number(value: Any, currency: bool = False) -> Any:
+    """
+    '$1.200.000', '1,200.50', '1.200,50', '15%' -> float; el resto lo valida Pydantic.
+    Un solo grupo de miles ('1.200') es ambiguo: solo en montos (currency) y
+    si no empieza en 0 se lee como miles; si no, es decimal ('0.125', '2,5').
+    """
+    if not isinstance(value, str):
+        return value
+    text = re.sub(r"[^\d.,\-]", "", value)
+    if "," in text and "." in text:
+        # El último separador es el decimal: 1,200.50 / 1.200,50
+        decimal = max(",", ".", key=text.rfind)
+        text = text.replace("," if decimal == "." else ".", "").replace(decimal, ".")
+    elif re.fullmatch(r"-?[1-9]\d{0,2}([.,]\d{3}){2,}", text) or (currency and re.fullmatch(r"-?[1-9]\d{0,2}[.,]\d{3}", text)):
+        text = re.sub(r"[.,]", "", text)
+    else:
+        text = text.replace(",", ".")
+    return float(text) if re.fullmatch(r"-?\d+(\.\d+)?", text) else value
+
+def _to_int(value: Any) -> Any:
+    value = _to_number(value)
+    return int(round(value)) if isinstance(value, float) else value
+
+def _to_score(value: Any) -> Any:
+    value = _to_int(value)
+    return min(max(value, 0), 100) if isinstance(value, int) else value
+
+def _to_text_list(value: Any) -> Any:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    if isinstance(value, list):
+        return [item if isinstance(item, str) else json.dumps(item, ensure_ascii=False) for item in value]
+    return value
+
+def _valid_items(value: Any, model: Type[BaseModel]) -> Any:
+    """
+    Lista de objetos: un objeto suelto se envuelve y se descartan los elementos
+    que no cumplen el esquema (p. ej. el último, cortado por truncamiento)
+    """
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        value = [value]
+    if not isinstance(value, list):
+        return value
+    items = []
+    for item in value:
+        try:
+            items.append(model.model_validate(item))
+        except ValidationError:
+            continue
+    return items
+
+Amount = Annotated[float, BeforeValidator(lambda v: _to_number(v, currency=True))]  # Montos en pesos
+Number = Annotated[float, BeforeValidator(_to_number)]  # Porcentajes, tasas y otros decimales
+Count = Annotated[int, BeforeValidator(_to_int)]
+Score = Annotated[int, BeforeValidator(_to_score)]
+TextList = Annotated[List[str], BeforeValidator(_to_text_list)]
+Identifier = Annotated[int | str, BeforeValidator(lambda v: _to_int(v) if isinstance(v, float) else v)]
+
+def choice(*values: str, default: Optional[str] = None):
+    """
+    Enum tolerante: compara sin mayúsculas ni espacios ('High', 'emergency fund').
+    Si falta o es desconocido vale `default` (None = el campo se omite).
+    """
+    canonical = {v.lower(): v for v in values}
+
+    def normalize(value: Any) -> Any:
+        if isinstance(value, str):
+            value = canonical.get(value.strip().lower().replace(" ", "_"), default)
+        return value if value in values else default
+
+    return Annotated[Optional[Literal[values]], BeforeValidator(normalize), Field(default=default)]
+
+def object_list(model: Type[BaseModel]):
+    return Annotated[List[model], BeforeValidator(lambda value: _valid_items(value, model))]
+
+# --- Reparación de JSON ---
+
+def _closers(stack) -> str:
+    return "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+
+def repair_json(text: str) -> Any:
+    """
+    Extrae y repara el primer valor JSON de `text`: ignora lo que haya antes y
+    después, quita comas finales y, si está truncado, cierra el string abierto
+    y los objetos/listas pendientes (descartando el último elemento incompleto
+    si hace falta). OutputRepairError si no lo logra.
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise OutputRepairError("no JSON value in response")
+
+    out: List[str] = []
+    stack: List[str] = []
+    cuts: List[Tuple[int, Tuple[str, ...]]] = []  # (largo antes de cada coma, contenedores abiertos)
+    in_string = escape = False
+    for char in text[min(starts):]:
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            out.append(char)
+            if stack:
+                stack.pop()
+            if not stack:
+                break  # Fin del valor: se ignora el texto que siga
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char == ",":
+            cuts.append((len(out), tuple(stack)))
+        out.append(char)
+
+    if not stack:
+        candidates = ["".join(out)]
+    else:
+        candidates = ["".join(out) + ('"' if in_string else "") + _closers(stack)]
+        candidates += ["".join(out[:length]) + _closers(opened) for length, opened in reversed(cuts[-MAX_TRUNCATION_CUTS:])]
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    raise OutputRepairError("response is not repairable JSON")
+
+def parse_output(content: str, output: Optional[Type[BaseModel]]) -> Tuple[Any, bool]:
+    """
+    JSON de la respuesta validado con el esquema (si hay).
+    Devuelve (resultado, si hubo que reparar el JSON).
+    """
+    try:
+        data, repaired = json.loads(content), False
+    except ValueError:
+        data, repaired = repair_json(content), True
+    if output is None:
+        return data, repaired
+    try:
+        return output.model_validate(data).model_dump(exclude_none=True), repaired
+    except ValidationError as e:
+        raise OutputRepairError(f"response does not match {output.__name__}: {e.error_count()} errors") from e
+
+# --- response_format ---
+
+def _strict(schema: Any) -> bool:
+    """
+    Adapta el JSON schema al modo strict del proveedor (todo requerido, sin
+    propiedades extra ni defaults). False si no es expresable en ese modo
+    (p. ej. objetos con claves dinámicas).
+    """
+    if isinstance(schema, list):
+        return all(_strict(item) for item in schema)
+    if not isinstance(schema, dict):
+        return True
+    schema.pop("default", None)
+    if schema.get("type") == "object":
+        if isinstance(schema.get("additionalProperties"), dict) or "properties" not in schema:
+            return False
+        schema["additionalProperties"] = False
+        schema["required"] = list(schema["properties"])
+    return all(_strict(value) for value in schema.values())
+
+@lru_cache()
+def response_format(output: Optional[Type[BaseModel]]) -> Optional[Dict]:
+    """response_format de la llamada según LLM_STRUCTURED_OUTPUT (json_schema | json_object | off)"""
+    mode = settings.LLM_STRUCTURED_OUTPUT
+    if output is None or mode == "off":
+        return None
+    if mode == "json_schema":
+        schema = output.model_json_schema()
+        if _strict(schema):
+            return {"type": "json_schema", "json_schema": {"name": output.__name__, "schema": schema, "strict": True}}
+    return {"type": "json_object"}
@@ -0,0 +1,177 @@
+"""
+Respuestas sintéticas con la estructura JSON que espera cada método de análisis.
+
+Los valores son deterministas: dependen solo de la semilla (hash del prompt),
+por lo que dos corridas con los mismos datos producen la misma salida.
+"""
+import random
+import re
+from typing import Callable, Dict
+
+# Encabezado de cada usuario en el prompt semantic_profile_pack (ver _format_pack en src.memory.manager)
+PACK_USER_HEADER = re.compile(r"### USUARIO (\d+)")
+
+def _health(rng: random.Random) -> Dict:
+    score = rng.randint(30, 95)
+    return {
+        "health_score": score,
+        "health_status": "excellent" if score >= 85 else "good" if score >= 70 else "fair" if score >= 50 else "poor",
+        "monthly_surplus": float(rng.randint(0, 2_000_000)),
+        "income_stability": rng.choice(["high", "medium", "low"]),
+        "top_spending_categories": [
+            {"category_id": rng.randint(1, 10), "amount": float(rng.randint(50_000, 900_000)), "percentage": round(rng.uniform(5, 40), 1)}
+            for _ in range(3)
+        ],
+        "risk_flags": ["Respuesta sintética"],
+        "recommendations": ["Revisa tus gastos variables"],
+        "message": "Análisis sintético de salud financiera."
+    }
+
+def _ant_expenses(rng: random.Random) -> Dict:
+    impact = float(rng.randint(20_000, 300_000))
+    return {
+        "ant_expenses": [{
+            "pattern_description": "Cafés diarios",
+            "categories": [rng.randint(1, 10)],
+            "frequency": rng.choice(["daily", "weekly"]),
+            "monthly_estimated_impact": impact,
+            "behavioral_signal": rng.choice(["habitual", "occasional"]),
+            "transaction_count": rng.randint(3, 30)
+        }],
+        "total_monthly_impact": impact,
+        "message": "Análisis sintético de gastos hormiga.",
+        "suggestions": ["Define un tope semanal para gastos pequeños"]
+    }
+
+def _leaks(rng: random.Random) -> Dict:
+    impact = float(rng.randint(50_000, 500_000))
+    return {
+        "money_leaks": [{
+            "category_id": rng.randint(1, 10),
+            "detected_pattern": "Gasto creciente en la categoría",
+            "monthly_impact": impact,
+            "severity": rng.choice(["high", "medium", "low"])
+        }],
+        "total_leak_impact": impact,
+        "message": "Análisis sintético de fugas.",
+        "action_items": ["Revisa los cargos de esta categoría"]
+    }
+
+def _repetitive(rng: random.Random) -> Dict:
+    amount = float(rng.randint(10_000, 100_000))
+    return {
+        "repetitive_expenses": [{
+            "description": "Suscripción",
+            "frequency": "monthly",
+            "average_amount": amount,
+            "annual_cost": amount * 12,
+            "category_id": rng.randint(1, 10),
+            "matches_known_pattern": rng.random() < 0.5
+        }],
+        "total_monthly_recurring": amount,
+        "message": "Análisis sintético de gastos repetitivos."
+    }
+
+def _suggest_goals(rng: random.Random) -> Dict:
+    target = float(rng.randint(2, 20) * 500_000)
+    months = rng.randint(6, 24)
+    return {
+        "suggested_goals": [{
+            "name": "Fondo de emergencia",
+            "reason": "Respuesta sintética",
+            "estimated_target": target,
+            "suggested_timeframe_months": months,
+            "monthly_contribution": round(target / months, 2),
+            "category": "EMERGENCY_FUND",
+            "risk_alignment": "Conservadora"
+        }],
+        "message": "Sugerencias sintéticas de metas.",
+        "next_steps": ["Define un aporte mensual automático"]
+    }
+
+def _evaluate_goal(rng: random.Random) -> Dict:
+    target = float(rng.randint(2, 20) * 500_000)
+    months = rng.randint(6, 24)
+    return {
+        "viable": rng.random() < 0.6,
+        "confidence": rng.choice(["high", "medium", "low"]),
+        "reason": "Evaluación sintética",
+        "suggested_adjustments": {
+            "target_amount": target,
+            "timeframe_months": months,
+            "monthly_contribution": round(target / months, 2)
+        },
+        "message": "Evaluación sintética de la meta.",
+        "alternative_approach": "Aumenta el plazo"
+    }
+
+def _track_goals(rng: random.Random) -> Dict:
+    return {
+        "goal_messages": [
+            {"goal_id": i, "message": "Feedback sintético", "recommended_action": "Mantén el aporte mensual"}
+            for i in range(1, rng.randint(1, 4) + 1)
+        ],
+        "overall_message": "Seguimiento sintético de metas."
+    }
+
+def _suggest_budget(rng: random.Random) -> Dict:
+    return {
+        "suggested_amount": float(rng.randint(1, 20) * 50_000),
+        "start_date": "",
+        "end_date": "",
+        "description": "Presupuesto sintético",
+        "tip": "Registra cada gasto de la categoría"
+    }
+
+def _review_budget(rng: random.Random) -> Dict:
+    return {
+        "status": rng.choice(["bien", "regular", "mal"]),
+        "tips": ["Respuesta sintética"],
+        "analysis": "Revisión sintética del presupuesto.",
+        "patterns": [],
+        "suggested_changes": []
+    }
+
+def _semantic_profile(rng: random.Random) -> Dict:
+    return {
+        "risk_tolerance": rng.choice(["low", "medium", "high"]),
+        "motivation_style": rng.choice(["goal_oriented", "balance_focused", "stress_averse"]),
+        "financial_literacy": rng.choice(["beginner", "intermediate", "advanced"]),
+        "spending_patterns": [],
+        "preferred_categories": [],
+        "emotional_state": rng.choice(["positive", "neutral", "concerned", "stressed"]),
+        "preferred_tone": rng.choice(["friendly", "formal", "encouraging", "direct"])
+    }
+
+def _semantic_profile_pack(rng: random.Random, prompt: str) -> Dict:
+    """Un perfil por cada usuario listado en el prompt, con la clave que espera el manager"""
+    return {
+        "profiles": {user_id: _semantic_profile(rng) for user_id in dict.fromkeys(PACK_USER_HEADER.findall(prompt))}
+    }
+
+GENERATORS: Dict[str, Callable[[random.Random], Dict]] = {
+    "analyze_health": _health,
+    "analyze_ant_expenses": _ant_expenses,
+    "analyze_leaks": _leaks,
+    "analyze_repetitive": _repetitive,
+    "suggest_goals": _suggest_goals,
+    "evaluate_goal": _evaluate_goal,
+    "track_goals": _track_goals,
+    "suggest_budget": _suggest_budget,
+    "review_budget": _review_budget,
+    "semantic_profile": _semantic_profile
+}
+
+# Métodos cuya salida depende del contenido del prompt (reciben también su texto)
+PROMPT_GENERATORS: Dict[str, Callable[[random.Random, str], Dict]] = {
+    "semantic_profile_pack": _semantic_profile_pack
+}
+
+def synthetic_response(method: str, seed: int, prompt: str = "") -> Dict:
+    """Genera la salida del método indicado (dict con 'message' si el método es desconocido)"""
+    if method in PROMPT_GENERATORS:
+        return PROMPT_GENERATORS[method](random.Random(seed), prompt)
+    generator = GENERATORS.get(method)
+    if generator is None:
+        return {"message": "Respuesta sintética."}
+    return generator(random.Random(seed))
@@ -1,33 +1,153 @@
-from fastapi import FastAPI, Header, HTTPException
-from typing import Dict, Optional, Any
-import httpx
-from datetime import datetime, timezone
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import Dict, Iterator, List, Optional, Any, Tuple
+import asyncio
+import itertools
+import json
+import secrets
+import threading
+import time
+from contextlib import asynccontextmanager, nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from functools import lru_cache
+from datetime import date, datetime, timedelta, timezone, time as dt_time
 from src.models.schemas import (
     AgentInput, 
     AgentOutput, 
-    FinancialContext,
-    TransactionInput,
-    GoalInput
+    FinancialContext
 )
 from src.agents.financial_analyzer import FinancialAnalyzer
 from src.agents.goal_analyzer import GoalAnalyzer
 from src.agents.budget_advisor import BudgetAdvisor
 from src.memory.manager import MemoryManager
+from src.clients.upstream import (
+    fetch_transactions,
+    fetch_financial_summary,
+    fetch_goals,
+    get_http_client,
+    track_upstream,
+    mark_upstream,
+    warm_http_client,
+    close_http_client
+)
+from src.memory.database import engine, warm_pool, ping, schema_revision, head_revision
+from src.cache.backend import get_cache, start_invalidation_listener, stop_invalidation_listener
 from src.config import settings
-# Crear tablas al inicio
-from src.memory.database import create_tables
-create_tables()
+from src.admission import AdmissionMiddleware, admission
+from src.deadline import DeadlineExceeded, DeadlineMiddleware, detached
+from src.llm.chain import default_priority
+from src.memory.insights import insights_store, is_dashboard_query, data_fingerprint
+from src.memory.usage import usage_ledger, set_usage_context
+from src.observability.metrics import BATCH_ITEMS, STARTUP_SECONDS, record_cache, record_route, record_error, render_latest
+from src.observability.tracing import start_trace, finish_trace, export_trace
+from src.observability.profiler import SamplingProfiler, profile_store
+# Agentes: se construyen una sola vez, en el lifespan (o en el primer uso)
+@lru_cache()
+def get_memory_manager() -> MemoryManager:
+    return MemoryManager()
+
+@lru_cache()
+def get_financial_analyzer() -> FinancialAnalyzer:
+    return FinancialAnalyzer()
+
+@lru_cache()
+def get_goal_analyzer() -> GoalAnalyzer:
+    return GoalAnalyzer()
+
+@lru_cache()
+def get_budget_advisor() -> BudgetAdvisor:
+    return BudgetAdvisor(financial_analyzer=get_financial_analyzer())
+
+# Estado de arranque consultado por /ready
+readiness: Dict[str, Any] = {"started": False, "schema_revision": None, "expected_revision": None}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranque: construye agentes, abre el pool de BD y las conexiones HTTP,
+    y verifica que el esquema esté migrado (las migraciones corren aparte:
+    alembic upgrade head). Los fallos no detienen el proceso, pero /ready
+    responde 503 hasta que se resuelvan.
+    """
+    start = time.perf_counter()
+    get_memory_manager()
+    get_goal_analyzer()
+    get_budget_advisor()
+    get_http_client()
+    get_cache()
+
+    try:
+        warmed = await asyncio.to_thread(warm_pool, settings.DB_WARM_CONNECTIONS)
+        readiness["schema_revision"] = await asyncio.to_thread(schema_revision)
+        readiness["expected_revision"] = head_revision()
+        print(f" Database pool warmed ({warmed} connections), schema at {readiness['schema_revision']}")
+        if readiness["schema_revision"] != readiness["expected_revision"]:
+            print(f" Database schema is not migrated: expected {readiness['expected_revision']}. Run 'alembic upgrade head'")
+    except Exception as e:
+        print(f" Error warming database pool: {e}")
+    await warm_http_client()
+    start_invalidation_listener()
+    usage_ledger.start()
+
+    readiness["started"] = True
+    STARTUP_SECONDS.set(time.perf_counter() - start)
+    print(f" Startup completed in {time.perf_counter() - start:.2f}s")
+    yield
+
+    readiness["started"] = False
+    await usage_ledger.stop()
+    stop_invalidation_listener()
+    await close_http_client()
+    engine.dispose()
 
 app = FastAPI(
     title="FinZen AI Service",
     description="Servicio de IA para análisis financiero y recomendaciones",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-memory_manager = MemoryManager()
-financial_analyzer = FinancialAnalyzer()
-goal_analyzer = GoalAnalyzer()
-budget_advisor = BudgetAdvisor()
+def is_admin(token: Optional[str]) -> bool:
+    """Valida el token de administración (deshabilitado si ADMIN_TOKEN no está configurado)"""
+    if not settings.ADMIN_TOKEN or not token:
+        return False
+    return secrets.compare_digest(token, settings.ADMIN_TOKEN)
+
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    """
+    Traza el request si TRACING_ENABLED está activo o si un administrador
+    lo pide con `X-Profile: 1` + `X-Admin-Token`, en cuyo caso también
+    corre el profiler por muestreo y devuelve `X-Profile-Id`.
+    """
+    profile = request.headers.get("x-profile") == "1" and is_admin(request.headers.get("x-admin-token"))
+    if not settings.TRACING_ENABLED and not profile:
+        return await call_next(request)
+
+    trace = start_trace(f"{request.method} {request.url.path}")
+    profiler = None
+    if profile:
+        profiler = SamplingProfiler(threading.get_ident(), settings.PROFILER_INTERVAL_MS / 1000)
+        profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        folded = profiler.stop() if profiler else None
+
+    finish_trace(trace, path=request.url.path, status_code=response.status_code)
+    response.headers["Server-Timing"] = trace.server_timing()
+    if folded is not None:
+        response.headers["X-Profile-Id"] = profile_store.put(folded)
+    if settings.TRACE_EXPORT_PATH:
+        await asyncio.to_thread(export_trace, trace, settings.TRACE_EXPORT_PATH)
+    return response
+
+# Más externo que el tracing: el deadline cubre todo el request
+app.add_middleware(DeadlineMiddleware)
+# El más externo: un request rechazado no consume deadline ni traza
+app.add_middleware(AdmissionMiddleware)
+
 from fastapi import Body
 from pydantic import BaseModel
 
@@ -60,7 +180,7 @@ async def create_profile(input_data: ProfileInput, authorization: Optional[str]
         raise HTTPException(status_code=401, detail="Authorization header required")
     
     # Guardar en BD
-    memory_manager.create_initial_profile(
+    get_memory_manager().create_initial_profile(
         user_id=input_data.user_id,
         profile_data=input_data.attributes
     )
@@ -74,7 +194,9 @@ async def suggest_budget(input_data: BudgetSuggestInput, authorization: Optional
     """
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header required")
+    set_usage_context("/budget/suggest", input_data.user_id)
     # Obtener datos si faltan
+    upstream_status = track_upstream()
     if not input_data.transactions:
         input_data.transactions = [t.model_dump() for t in await fetch_transactions(authorization)]
     if not input_data.financial_context:
@@ -89,9 +211,9 @@ async def suggest_budget(input_data: BudgetSuggestInput, authorization: Optional
             "month_surplus": income - expense
         }
     if not input_data.semantic_profile:
-        input_data.semantic_profile = memory_manager.get_semantic_profile(input_data.user_id)
+        input_data.semantic_profile = get_memory_manager().get_semantic_profile(input_data.user_id)
     # Llamar agente
-    result = await budget_advisor.suggest_budget(
+    result = await get_budget_advisor().suggest_budget(
         category_id=input_data.category_id,
         category_name=input_data.category_name,
         transactions=input_data.transactions,
@@ -100,7 +222,7 @@ async def suggest_budget(input_data: BudgetSuggestInput, authorization: Optional
         start_date=input_data.start_date,
         end_date=input_data.end_date
     )
-    return result
+    return mark_upstream(result, upstream_status)
 
 @app.post("/budget/review")
 async def review_budget(input_data: BudgetReviewInput, authorization: Optional[str] = Header(None)):
@@ -109,6 +231,8 @@ async def review_budget(input_data: BudgetReviewInput, authorization: Optional[s
     """
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header required")
+    set_usage_context("/budget/review", input_data.user_id)
+    upstream_status = track_upstream()
     if not input_data.transactions:
         input_data.transactions = [t.model_dump() for t in await fetch_transactions(authorization)]
     if not input_data.financial_context:
@@ -123,14 +247,30 @@ async def review_budget(input_data: BudgetReviewInput, authorization: Optional[s
             "month_surplus": income - expense
         }
     if not input_data.semantic_profile:
-        input_data.semantic_profile = memory_manager.get_semantic_profile(input_data.user_id)
-    result = await budget_advisor.review_budget(
+        input_data.semantic_profile = get_memory_manager().get_semantic_profile(input_data.user_id)
+    result = await get_budget_advisor().review_budget(
         budget=input_data.budget,
         transactions=input_data.transactions,
         financial_context=input_data.financial_context,
         semantic_profile=input_data.semantic_profile
     )
-    return result
+    return mark_upstream(result, upstream_status)
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato Prometheus"""
+    payload, content_type = render_latest()
+    return Response(content=payload, media_type=content_type)
+
+@app.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile_dump(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Devuelve un perfil en formato folded (flamegraph.pl / speedscope)"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    folded = profile_store.get(profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return folded
 
 @app.get("/health")
 async def health_check():
@@ -141,126 +281,88 @@ async def health_check():
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
 
-async def fetch_transactions(token: str):
-    """Obtiene transacciones del microservicio de Transactions con token propagation"""
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness: el arranque terminó, la base responde y el esquema está en la
+    última migración. /health solo indica que el proceso está vivo.
+    """
+    checks = {"startup": readiness["started"]}
     try:
-        url = f"{settings.TRANSACTIONS_SERVICE_URL}/transactions"
-        print(f" Fetching transactions from: {url}")
-        print(f" Using token: {token[:50]}...")
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                url,
-                headers={"Authorization": token}
-            )
-            
-            print(f" Response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                print(f" Fetched {len(data)} transactions")
-                
-                # Convertir a formato esperado
-                transactions = [
-                    TransactionInput(
-                        id=t.get("id"),
-                        amount=float(t.get("amount", 0)),
-                        description=t.get("description", ""),
-                        date=t.get("date", ""),
-                        type=t.get("type", "EXPENSE"),
-                        category_id=t.get("categoryId", 0)
-                    )
-                    for t in data
-                ]
-                return transactions
-            else:
-                print(f" Error response: {response.text}")
-                return []
-    except Exception as e:
-        print(f" Error fetching transactions: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+        await asyncio.wait_for(asyncio.to_thread(ping), timeout=2.0)
+        checks["database"] = True
+    except Exception:
+        checks["database"] = False
+    if checks["database"] and readiness["schema_revision"] != readiness["expected_revision"]:
+        # Las migraciones pudieron correr después del arranque
+        readiness["schema_revision"] = await asyncio.to_thread(schema_revision)
+    checks["schema"] = readiness["expected_revision"] is not None and readiness["schema_revision"] == readiness["expected_revision"]
 
-async def fetch_financial_summary(token: str):
-    """Obtiene resumen financiero del microservicio de Transactions con token propagation"""
-    try:
-        url = f"{settings.TRANSACTIONS_SERVICE_URL}/transactions/reports"
-        print(f" Fetching reports from: {url}")
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                url,
-                headers={"Authorization": token}
-            )
-            
-            print(f" Reports response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                print(f" Fetched reports: {data}")
-                return data
-            else:
-                print(f" Error response: {response.text}")
-                return {}
-    except Exception as e:
-        print(f" Error fetching financial summary: {e}")
-        return {}
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "checks": checks}
+    )
 
-async def fetch_goals(token: str):
-    """Obtiene metas del microservicio de Goals con token propagation"""
-    try:
-        url = f"{settings.GOALS_SERVICE_URL}/goals"
-        print(f" Fetching goals from: {url}")
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                url,
-                headers={"Authorization": token}
+async def _run_db(limits: Optional["AnalysisLimits"], fn, *args, **kwargs):
+    """Llamada a la BD: directa en /analyze; en batch, en un thread y acotada por limits.db"""
+    if limits is None:
+        return fn(*args, **kwargs)
+    async with limits.db:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+@dataclass
+class AnalysisLimits:
+    """Concurrencia máxima por recurso cuando se corren muchos análisis a la vez (/analyze/batch)"""
+    upstream: asyncio.Semaphore
+    db: asyncio.Semaphore
+    llm: asyncio.Semaphore
+    record_interaction: bool = True  # False en jobs: el usuario no pidió el análisis
+
+async def _run_agents(user_query: Optional[str], transactions: List[Dict], goals: List[Dict], financial_context: Dict, semantic_profile: Dict, llm) -> Tuple[str, Dict]:
+    """Elige el agente según la consulta y corre el análisis (llm: límite de concurrencia)"""
+    query = (user_query or "").lower()
+    
+    async with llm:
+        if any(word in query for word in ["meta", "objetivo", "ahorro", "viaje", "casa"]):
+            # Análisis de metas
+            print(" Running Goal Analysis")
+            record_route("main", "goal_analysis")
+            result = await get_goal_analyzer().analyze(
+                query=query,
+                goals=goals,
+                financial_context=financial_context,
+                semantic_profile=semantic_profile,
+                transactions=transactions
             )
-            
-            print(f" Goals response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                print(f" Fetched {len(data)} goals")
-                
-                goals = [
-                    GoalInput(
-                        id=g.get("id"),
-                        name=g.get("name", ""),
-                        target_amount=float(g.get("targetAmount", 0)),
-                        saved_amount=float(g.get("savedAmount", 0)),
-                        category=g.get("category", "OTHER"),
-                        due_date=g.get("dueDate"),
-                        status=g.get("status", "ACTIVE")
-                    )
-                    for g in data
-                ]
-                return goals
-            else:
-                print(f" Error response: {response.text}")
-                return []
-    except Exception as e:
-        print(f" Error fetching goals: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+            return "goal_analysis", result
+        # Análisis financiero
+        print(" Running Financial Analysis")
+        record_route("main", "financial_analysis")
+        result = await get_financial_analyzer().analyze(
+            query=query,
+            transactions=transactions,
+            financial_context=financial_context,
+            semantic_profile=semantic_profile
+        )
+        return "financial_analysis", result
 
-@app.post("/analyze", response_model=AgentOutput)
-async def analyze(input_data: AgentInput,authorization: Optional[str] = Header(None)):
+async def run_analysis(input_data: AgentInput, authorization: str, limits: Optional[AnalysisLimits] = None) -> Tuple[str, Dict]:
     """
-    Endpoint principal de análisis financiero con IA.
-    Propaga el token JWT a los microservicios para obtener datos
-    y genera recomendaciones personalizadas.
+    Núcleo de /analyze (compartido con /analyze/batch): completa los datos
+    desde los microservicios, elige el agente según la consulta, corre el
+    análisis y lo guarda en la memoria episódica.
+    Devuelve (analysis_type, result).
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header required")
-    try:
-        # 1. Enriquecer datos desde microservicios (API Composition + Token Propagation)
-        print(f" Fetching data for user {input_data.user_id}")
-        print(f" Authorization header: {authorization[:50]}...")
-        
+    upstream = limits.upstream if limits else nullcontext()
+    llm = limits.llm if limits else nullcontext()
+
+    # 1. Enriquecer datos desde microservicios (API Composition + Token Propagation)
+    print(f" Fetching data for user {input_data.user_id}")
+    print(f" Authorization header: {authorization[:50]}...")
+    
+    upstream_status = track_upstream()
+    async with upstream:
         if not input_data.transactions:
             input_data.transactions = await fetch_transactions(authorization)
             print(f" Loaded {len(input_data.transactions)} transactions")
@@ -281,44 +383,63 @@ async def analyze(input_data: AgentInput,authorization: Optional[str] = Header(N
                 savings=0,
                 month_surplus=income - expense
             )
-        
-        # 2. Obtener memoria semántica del usuario
-        semantic_profile = memory_manager.get_semantic_profile(input_data.user_id)
-        
-        # 3. Determinar tipo de análisis según query
-        query = (input_data.user_query or "").lower()
-        
-        if any(word in query for word in ["meta", "objetivo", "ahorro", "viaje", "casa"]):
-            # Análisis de metas
-            print(" Running Goal Analysis")
-            result = await goal_analyzer.analyze(
-                query=query,
-                goals=[g.model_dump() for g in input_data.goals],
-                financial_context=input_data.financial_context.model_dump(),
-                semantic_profile=semantic_profile
-            )
-            analysis_type = "goal_analysis"
-        else:
-            # Análisis financiero
-            print(" Running Financial Analysis")
-            result = await financial_analyzer.analyze(
-                query=query,
-                transactions=[t.model_dump() for t in input_data.transactions],
-                financial_context=input_data.financial_context.model_dump(),
-                semantic_profile=semantic_profile
-            )
-            analysis_type = "financial_analysis"
-        
-        # 4. Guardar interacción en memoria episódica
-        memory_manager.log_interaction(
+    
+    # 2. Obtener memoria semántica del usuario
+    semantic_profile = await _run_db(limits, get_memory_manager().get_semantic_profile, input_data.user_id)
+    
+    transactions = [t.model_dump() for t in input_data.transactions]
+    goals = [g.model_dump() for g in input_data.goals]
+    financial_context = input_data.financial_context.model_dump()
+    
+    # 3. Dashboard (consulta genérica): insight precalculado si los datos no cambiaron
+    stored = None
+    data_version = None
+    if settings.INSIGHTS_ENABLED and is_dashboard_query(input_data.user_query):
+        data_version = data_fingerprint(transactions, goals, financial_context, semantic_profile)
+        stored = await _run_db(limits, insights_store.get_insights, input_data.user_id, data_version)
+        record_cache("insights", stored is not None)
+    
+    if stored is not None:
+        print(" Serving precomputed insights")
+        record_route("main", "precomputed_insights")
+        analysis_type, result = stored["analysis_type"], stored["result"]
+    else:
+        # Admisión solo en el camino que llama al LLM (el batch ya va acotado por limits)
+        async with admission.admit("/analyze") if limits is None else nullcontext():
+            analysis_type, result = await _run_agents(input_data.user_query, transactions, goals, financial_context, semantic_profile, llm)
+        if data_version is not None and not result.get("degraded"):
+            await _run_db(limits, insights_store.save_insights, input_data.user_id, data_version, analysis_type, result)
+    
+    # 4. Guardar interacción en memoria episódica (solo si la pidió el usuario)
+    if limits is None or limits.record_interaction:
+        await _run_db(
+            limits,
+            get_memory_manager().log_interaction,
             user_id=input_data.user_id,
             query=input_data.user_query or "análisis general",
             agent_type=analysis_type,
             response=result
         )
+    return analysis_type, mark_upstream(result, upstream_status)
+
+@app.post("/analyze", response_model=AgentOutput)
+async def analyze(input_data: AgentInput, background_tasks: BackgroundTasks, authorization: Optional[str] = Header(None)):
+    """
+    Endpoint principal de análisis financiero con IA.
+    Propaga el token JWT a los microservicios para obtener datos
+    y genera recomendaciones personalizadas.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header required")
+    set_usage_context("/analyze", input_data.user_id)
+    try:
+        analysis_type, result = await run_analysis(input_data, authorization)
         
-        # 5. Actualizar memoria semántica cada 5 interacciones
-        memory_manager.update_semantic_profile_if_needed(input_data.user_id)
+        # 5. Actualizar memoria semántica cada 5 interacciones (después de responder).
+        # En modo batch la actualiza el job src.jobs.regenerate_profiles
+        if settings.SEMANTIC_UPDATE_MODE == "inline":
+            # detached: corre después de responder, fuera del deadline del request
+            background_tasks.add_task(detached(get_memory_manager().update_semantic_profile_if_needed), input_data.user_id)
         
         # 6. Formatear respuesta
         return AgentOutput(
@@ -327,8 +448,11 @@ async def analyze(input_data: AgentInput,authorization: Optional[str] = Header(N
             data=result
         )
         
+    except (DeadlineExceeded, HTTPException):
+        raise  # DeadlineMiddleware responde 504; 503 de admisión
     except Exception as e:
         print(f" Error in analysis: {e}")
+        record_error("analyze")
         import traceback
         traceback.print_exc()
         raise HTTPException(
@@ -336,6 +460,212 @@ async def analyze(input_data: AgentInput,authorization: Optional[str] = Header(N
             detail=f"Error processing analysis: {str(e)}"
         )
 
+class BatchAnalyzeItem(BaseModel):
+    user_id: int
+    token: str  # Token de servicio del usuario (se propaga como Authorization)
+    user_query: Optional[str] = None
+
+class BatchAnalyzeInput(BaseModel):
+    items: Optional[List[BatchAnalyzeItem]] = None
+    source_file: Optional[str] = None  # NDJSON con un BatchAnalyzeItem por línea, dentro de BATCH_INPUT_DIR
+    user_query: Optional[str] = None  # Consulta por defecto de los items que no traen una
+    offset: int = 0  # Reanudar desde este item (el next_offset de la última línea recibida)
+    max_concurrency: Optional[int] = None
+
+def _batch_source(input_data: BatchAnalyzeInput) -> Iterator[Tuple[int, Any]]:
+    """
+    (offset, item) desde input_data.offset. Del archivo se lee de a una línea y
+    el item queda como texto: lo valida el worker, para reportar la línea inválida.
+    """
+    if input_data.items is not None:
+        yield from itertools.islice(enumerate(input_data.items), input_data.offset, None)
+        return
+    path = _batch_source_path(input_data.source_file)
+    with open(path, encoding="utf-8") as source:
+        lines = (line for line in source if line.strip())
+        yield from itertools.islice(enumerate(lines), input_data.offset, None)
+
+def _batch_source_path(source_file: str) -> Path:
+    """Ruta del archivo de entrada; solo se aceptan archivos dentro de BATCH_INPUT_DIR"""
+    if not settings.BATCH_INPUT_DIR:
+        raise HTTPException(status_code=400, detail="BATCH_INPUT_DIR is not configured")
+    base = Path(settings.BATCH_INPUT_DIR).resolve()
+    path = (base / source_file).resolve()
+    if not path.is_relative_to(base) or not path.is_file():
+        raise HTTPException(status_code=400, detail=f"Invalid source_file: {source_file}")
+    return path
+
+async def stream_batch_analysis(
+    input_data: BatchAnalyzeInput,
+    source: Iterator[Tuple[int, Any]],
+    usage_endpoint: str = "/analyze/batch",
+    record_interaction: bool = True
+):
+    """
+    Corre los análisis con `max_concurrency` workers y emite una línea NDJSON
+    por usuario en cuanto termina (en orden de llegada, no de offset).
+    Cada línea lleva next_offset: todos los items anteriores ya se emitieron,
+    así que se puede reanudar desde ahí (a lo sumo se repiten los que estaban
+    en curso). El uso del LLM se registra a nombre de `usage_endpoint`.
+    Con record_interaction=False (jobs programados) no se guarda la interacción
+    en memoria episódica ni se actualiza el perfil semántico.
+    """
+    concurrency = max(1, min(input_data.max_concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY))
+    limits = AnalysisLimits(
+        upstream=asyncio.Semaphore(settings.BATCH_UPSTREAM_CONCURRENCY),
+        db=asyncio.Semaphore(settings.BATCH_DB_CONCURRENCY),
+        llm=asyncio.Semaphore(settings.BATCH_LLM_CONCURRENCY),
+        record_interaction=record_interaction
+    )
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    done = object()
+
+    async def worker():
+        # Las llamadas al LLM del batch ceden el turno a los requests interactivos
+        default_priority.set("background")
+        for offset, item in source:
+            line = {"offset": offset, "user_id": getattr(item, "user_id", None)}
+            try:
+                if not isinstance(item, BatchAnalyzeItem):
+                    item = BatchAnalyzeItem.model_validate_json(item)
+                    line["user_id"] = item.user_id
+                analysis_input = AgentInput(user_id=item.user_id, user_query=item.user_query or input_data.user_query)
+                set_usage_context(usage_endpoint, item.user_id)
+                analysis_type, result = await run_analysis(analysis_input, item.token, limits)
+                if record_interaction and settings.SEMANTIC_UPDATE_MODE == "inline":
+                    await get_memory_manager().update_semantic_profile_if_needed(item.user_id)
+                line.update({"status": "ok", "analysis_type": analysis_type, "data": result})
+            except Exception as e:
+                print(f" Error in batch analysis for item {offset}: {e}")
+                record_error("analyze_batch")
+                line.update({"status": "error", "error": str(e)})
+            await results.put(line)
+
+    async def close():
+        for outcome in await asyncio.gather(*workers, return_exceptions=True):
+            if isinstance(outcome, Exception):
+                print(f" Batch worker failed: {outcome}")
+        await results.put(done)
+
+    start = time.perf_counter()
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    closer = asyncio.create_task(close())
+    next_offset = input_data.offset
+    finished = set()
+    processed = failed = 0
+    try:
+        while True:
+            line = await results.get()
+            if line is done:
+                break
+            finished.add(line["offset"])
+            while next_offset in finished:
+                finished.remove(next_offset)
+                next_offset += 1
+            processed += 1
+            failed += line["status"] == "error"
+            BATCH_ITEMS.labels(line["status"]).inc()
+            yield json.dumps({**line, "next_offset": next_offset}, ensure_ascii=False, default=str) + "\n"
+        yield json.dumps({
+            "summary": True,
+            "processed": processed,
+            "failed": failed,
+            "next_offset": next_offset,
+            "elapsed_s": round(time.perf_counter() - start, 3)
+        }) + "\n"
+    finally:
+        # El cliente cortó la conexión: se cancelan los análisis en curso
+        for task in [*workers, closer]:
+            task.cancel()
+        await asyncio.gather(*workers, closer, return_exceptions=True)
+
+@app.post("/analyze/batch")
+async def analyze_batch(input_data: BatchAnalyzeInput, x_admin_token: Optional[str] = Header(None)):
+    """
+    Análisis de muchos usuarios en un solo request (job nocturno de insights).
+    Recibe los items (user_id + token) en el body o en un archivo NDJSON y
+    devuelve application/x-ndjson: una línea por usuario y una línea final de resumen.
+    """
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    if (input_data.items is None) == (input_data.source_file is None):
+        raise HTTPException(status_code=400, detail="Provide either items or source_file")
+    if input_data.offset < 0:
+        raise HTTPException(status_code=400, detail="offset must be >= 0")
+    if input_data.source_file is not None:
+        _batch_source_path(input_data.source_file)  # 400 antes de empezar a responder
+    return StreamingResponse(stream_batch_analysis(input_data, _batch_source(input_data)), media_type="application/x-ndjson")
+
+@app.get("/history/{user_id}")
+async def history(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = settings.HISTORY_PAGE_SIZE,
+    agent_used: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    projection: str = "summary",
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Historial de interacciones paginado por cursor (keyset), de la más reciente
+    a la más antigua. Filtros: agent_used y rango de fechas [date_from, date_to].
+    projection: summary (campos promovidos) | message.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header required")
+    if projection not in ("summary", "message"):
+        raise HTTPException(status_code=400, detail="projection must be summary or message")
+    if not 1 <= limit <= settings.HISTORY_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {settings.HISTORY_MAX_PAGE_SIZE}")
+    try:
+        # Lectura sync en un thread: una página lenta no frena el event loop
+        items, next_cursor = await asyncio.to_thread(
+            get_memory_manager().get_interaction_page,
+            user_id,
+            limit,
+            cursor=cursor,
+            agent_used=agent_used,
+            since=datetime.combine(date_from, dt_time.min) if date_from else None,
+            until=datetime.combine(date_to + timedelta(days=1), dt_time.min) if date_to else None,
+            projection=projection
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/admin/llm-usage")
+async def llm_usage(
+    group_by: str = "day",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    user_id: Optional[int] = None,
+    limit: int = 100,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Consumo del LLM agregado por `group_by` (dimensiones separadas por coma:
+    day, user, endpoint, analyzer, method, model), de mayor a menor, en el rango
+    [date_from, date_to]. Incluye lo que aún no se había escrito.
+    """
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    await asyncio.to_thread(usage_ledger.flush)
+    try:
+        rows = await asyncio.to_thread(
+            usage_ledger.usage_summary,
+            [d.strip() for d in group_by.split(",") if d.strip()],
+            since=datetime.combine(date_from, dt_time.min) if date_from else None,
+            until=datetime.combine(date_to + timedelta(days=1), dt_time.min) if date_to else None,
+            user_id=user_id,
+            limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": rows}
+
 @app.post("/chat")
 async def chat(input_data: AgentInput,authorization: Optional[str] = Header(None)):
     """
@@ -346,14 +676,15 @@ async def chat(input_data: AgentInput,authorization: Optional[str] = Header(None
         raise HTTPException(status_code=401, detail="Authorization header required")
     
     # Obtener historial reciente
-    recent_history = memory_manager.get_recent_interactions(
+    recent_history = get_memory_manager().get_recent_interactions(
         input_data.user_id,
-        limit=5
+        limit=5,
+        projection="message"
     )
     
     # Implementación básica de chat con contexto
     context_messages = "\n".join([
-        f"Usuario: {h['query']}\nAsistente: {h['response'].get('message', '')}"
+        f"Usuario: {h['query']}\nAsistente: {h['message'] or ''}"
         for h in recent_history
     ])
     
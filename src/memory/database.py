@@ -1,16 +1,42 @@
-from sqlalchemy import create_engine
+import os
+from typing import Optional
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from src.config import settings
+from src import deadline
+
+# Tamaño del pool solo fuera de SQLite: SQLite en memoria usa SingletonThreadPool,
+# que no acepta pool_size ni max_overflow (benchmarks y scripts locales)
+_pool_options = {} if settings.DATABASE_URL.startswith("sqlite") else {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW
+}
 
 # Crear engine de SQLAlchemy
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,  # Verifica conexiones antes de usarlas
-    pool_size=5,
-    max_overflow=10,
-    echo=False  # Set to True para debug SQL
+    echo=False,  # Set to True para debug SQL
+    **_pool_options
 )
 
+@event.listens_for(engine, "begin")
+def _apply_deadline(conn):
+    """
+    Dentro de un request con deadline, cada transacción arranca con
+    statement_timeout = lo que le queda al request (SET LOCAL: dura hasta el
+    fin de la transacción), una sola vez y no antes de cada sentencia.
+    Si ya no queda tiempo la transacción no empieza.
+    """
+    left = deadline.budget(reserve=0)  # La BD también atiende a la respuesta de respaldo
+    if left is not None and conn.dialect.name == "postgresql":
+        # Cursor DBAPI directo: ejecutar con `conn` aquí volvería a abrir la transacción
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(f"SET LOCAL statement_timeout = {max(int(left * 1000), 1)}")
+        finally:
+            cursor.close()
+
 # Crear session factory
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -22,13 +48,51 @@ SessionLocal = sessionmaker(
 Base = declarative_base()
 
 def create_tables():
-    """Crea todas las tablas definidas en los modelos"""
+    """
+    Crea todas las tablas definidas en los modelos.
+    Solo para scripts locales: en despliegue el esquema lo gestiona Alembic (alembic upgrade head).
+    """
     try:
         Base.metadata.create_all(bind=engine)
         print("Database tables created successfully")
     except Exception as e:
         print(f"Error creating tables: {e}")
 
+def warm_pool(connections: int) -> int:
+    """Abre `connections` conexiones del pool (SELECT 1) para que los primeros requests no paguen el connect"""
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = engine.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in opened:
+            conn.close()  # Vuelven al pool abiertas
+    return len(opened)
+
+def ping() -> None:
+    """Verifica que la base responde (lanza excepción si no)"""
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+def schema_revision() -> Optional[str]:
+    """Revisión de Alembic aplicada en la base (None si nunca se migró)"""
+    with engine.connect() as conn:
+        try:
+            return conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+        except Exception:
+            return None
+
+def head_revision() -> Optional[str]:
+    """Última revisión de las migraciones incluidas en el código"""
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    config = Config(os.path.join(root, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(root, "migrations"))
+    return ScriptDirectory.from_config(config).get_current_head()
+
 def get_db():
     """Dependency para FastAPI endpoints"""
     db = SessionLocal()
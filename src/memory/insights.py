@@ -0,0 +1,76 @@
+"""
+Insights precalculados del dashboard.
+
+El dashboard llama a /analyze con la consulta genérica; ese análisis solo
+cambia cuando cambian los datos del usuario. Cada resultado se guarda con la
+huella (data_version) de sus entradas: transacciones, metas, contexto
+financiero, perfil semántico y versiones de los prompts. Si la huella actual
+coincide se sirve la fila guardada; si no, se calcula en vivo y se reemplaza.
+El job src.jobs.refresh_insights la mantiene al día para los usuarios activos.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from src.memory.database import SessionLocal
+from src.memory.models import PrecomputedInsight
+from src.llm.prompts import prompts
+from src.observability.metrics import observe_db
+
+# Consultas que equivalen a cargar el dashboard
+DASHBOARD_QUERIES = {"", "análisis general", "analisis general"}
+
+def is_dashboard_query(query: Optional[str]) -> bool:
+    return (query or "").strip().lower() in DASHBOARD_QUERIES
+
+def data_fingerprint(transactions: List[Dict], goals: List[Dict], financial_context: Dict, semantic_profile: Dict) -> str:
+    """sha256 de todo lo que determina el análisis general del usuario"""
+    payload = json.dumps(
+        [transactions, goals, financial_context, semantic_profile, prompts.versions()],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class InsightsStore:
+
+    @observe_db("read")
+    def get_insights(self, user_id: int, data_version: str) -> Optional[Dict]:
+        """Insight guardado si sigue vigente para `data_version` ({analysis_type, result, computed_at})"""
+        db = SessionLocal()
+        try:
+            row = db.query(
+                PrecomputedInsight.analysis_type,
+                PrecomputedInsight.result,
+                PrecomputedInsight.computed_at
+            ).filter(
+                PrecomputedInsight.user_id == user_id,
+                PrecomputedInsight.data_version == data_version
+            ).first()
+            if row is None:
+                return None
+            return {"analysis_type": row.analysis_type, "result": row.result, "computed_at": row.computed_at.isoformat()}
+        finally:
+            db.close()
+
+    @observe_db("write")
+    def save_insights(self, user_id: int, data_version: str, analysis_type: str, result: Dict) -> None:
+        db = SessionLocal()
+        try:
+            insight = db.get(PrecomputedInsight, user_id)
+            if insight is None:
+                insight = PrecomputedInsight(user_id=user_id)
+                db.add(insight)
+            insight.data_version = data_version
+            insight.analysis_type = analysis_type
+            insight.result = result
+            insight.computed_at = datetime.now(timezone.utc)
+            db.commit()
+        except Exception as e:
+            print(f" Error saving insights: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+insights_store = InsightsStore()
@@ -1,13 +1,121 @@
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, case, or_, tuple_
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+import base64
 import json
+import asyncio
 from src.memory.database import SessionLocal
 from src.memory.models import EpisodicMemory, SemanticProfile
 from src.config import settings
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
+from src.llm.chain import invoke_json_chain, invoke_json_chain_batch
+from src.llm.provider import create_chat_model
+from src.llm.prompts import prompts
+from src.llm.structured import LLMOutput, TextList, Identifier, choice
+from src.observability.metrics import observe_db, record_fallback
+from src.cache.backend import get_cache
+
+class SemanticProfileOutput(LLMOutput):
+    """Campos faltantes o fuera de las opciones se omiten: no pisan el perfil guardado"""
+    risk_tolerance: choice("low", "medium", "high")
+    motivation_style: choice("goal_oriented", "balance_focused", "stress_averse")
+    financial_literacy: choice("beginner", "intermediate", "advanced")
+    spending_patterns: Optional[TextList] = None
+    preferred_categories: Optional[List[Identifier]] = None
+    emotional_state: choice("positive", "neutral", "concerned", "stressed")
+    preferred_tone: choice("friendly", "formal", "encouraging", "direct")
+
+class SemanticProfilePackOutput(LLMOutput):
+    profiles: Dict[str, SemanticProfileOutput] = {}
+
+SEMANTIC_PROFILE_PROMPT = prompts.register("semantic_profile", "2", instructions="""
+    Eres un experto en análisis de comportamiento financiero.
+
+    Analiza las interacciones del usuario y genera un perfil semántico compacto.
+
+    Genera un perfil que incluya:
+    - risk_tolerance: low, medium, high
+    - motivation_style: goal_oriented, balance_focused, stress_averse
+    - financial_literacy: beginner, intermediate, advanced
+    - spending_patterns: [lista de patrones detectados]
+    - preferred_categories: [categorías donde más gasta]
+    - emotional_state: positive, neutral, concerned, stressed
+    - preferred_tone: friendly, formal, encouraging, direct
+
+    RESPONDE SOLO EN JSON.
+""", data="""
+    INTERACCIONES:
+    {interactions}
+""", output=SemanticProfileOutput)
+
+# Varios usuarios pequeños en un solo prompt (regeneración por lotes)
+MULTI_PROFILE_PROMPT = prompts.register("semantic_profile_pack", "2", instructions="""
+    Eres un experto en análisis de comportamiento financiero.
+
+    Para CADA usuario listado, analiza sus interacciones y genera un perfil semántico compacto.
+    No mezcles información entre usuarios.
+
+    Cada perfil incluye:
+    - risk_tolerance: low, medium, high
+    - motivation_style: goal_oriented, balance_focused, stress_averse
+    - financial_literacy: beginner, intermediate, advanced
+    - spending_patterns: [lista de patrones detectados]
+    - preferred_categories: [categorías donde más gasta]
+    - emotional_state: positive, neutral, concerned, stressed
+    - preferred_tone: friendly, formal, encouraging, direct
+
+    RESPONDE SOLO EN JSON, con una entrada por user_id:
+    {{
+    "profiles": {{
+        "<user_id>": {{"risk_tolerance": "...", "motivation_style": "...", "...": "..."}}
+    }}
+    }}
+""", data="""
+    USUARIOS:
+    {users}
+""", output=SemanticProfilePackOutput)
+
+# Columnas que trae cada proyección de la memoria episódica (solo se lee lo pedido):
+# - full: respuesta completa (regeneración del perfil semántico)
+# - summary: campos promovidos (listados)
+# - message: lo que usa /chat
+INTERACTION_PROJECTIONS = {
+    "full": (EpisodicMemory.query, EpisodicMemory.agent_used, EpisodicMemory.response, EpisodicMemory.created_at),
+    "summary": (
+        EpisodicMemory.query, EpisodicMemory.agent_used, EpisodicMemory.message,
+        EpisodicMemory.health_score, EpisodicMemory.health_status, EpisodicMemory.created_at
+    ),
+    "message": (EpisodicMemory.query, EpisodicMemory.agent_used, EpisodicMemory.message, EpisodicMemory.created_at)
+}
+
+def promoted_fields(response: Dict) -> Dict:
+    """Campos de la respuesta del agente que se guardan también como columnas"""
+    score = response.get("health_score")
+    message = response.get("message")
+    status = response.get("health_status")
+    return {
+        "message": message if isinstance(message, str) else None,
+        "health_score": float(score) if isinstance(score, (int, float)) and not isinstance(score, bool) else None,
+        "health_status": status if isinstance(status, str) else None
+    }
+
+def encode_cursor(created_at: datetime, interaction_id: int) -> str:
+    """Cursor opaco de /history: posición (created_at, id) de la última fila de la página"""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{interaction_id}".encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """ValueError si el cursor no es válido"""
+    try:
+        created_at, interaction_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(interaction_id)
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def _interaction_dict(row) -> Dict:
+    """Fila de una proyección -> dict (agent_used -> agent, created_at -> timestamp)"""
+    item = dict(row._mapping)
+    item["agent"] = item.pop("agent_used")
+    item["timestamp"] = item.pop("created_at").isoformat()
+    return item
 
 class MemoryManager:
     """
@@ -15,12 +123,9 @@ class MemoryManager:
     """
     
     def __init__(self):
-        self.llm = ChatOpenAI(
-            api_key=settings.OPENAI_API_KEY,
-            model=settings.OPENAI_MODEL,
-            temperature=0.1
-        )
+        self.llm = create_chat_model(temperature=0.1)
     
+    @observe_db("write")
     def log_interaction(self,user_id: int,query: str,agent_type: str,response: Dict) -> None:
         """Guarda una interacción en memoria episódica"""
         db = SessionLocal()
@@ -30,6 +135,7 @@ class MemoryManager:
                 query=query,
                 agent_used=agent_type,
                 response=response,
+                **promoted_fields(response),
                 created_at=datetime.now(timezone.utc)
             )
             db.add(memory)
@@ -41,28 +147,67 @@ class MemoryManager:
         finally:
             db.close()
     
-    def get_recent_interactions(self,user_id: int,limit: int = 10) -> List[Dict]:
-        """Obtiene las últimas interacciones del usuario"""
+    @observe_db("read")
+    def get_recent_interactions(self,user_id: int,limit: int = 10,projection: str = "full") -> List[Dict]:
+        """
+        Obtiene las últimas interacciones del usuario con las columnas de
+        `projection` (ver INTERACTION_PROJECTIONS).
+        """
+        columns = INTERACTION_PROJECTIONS[projection]
         db = SessionLocal()
         try:
-            interactions = db.query(EpisodicMemory)\
+            interactions = db.query(*columns)\
                 .filter(EpisodicMemory.user_id == user_id)\
                 .order_by(desc(EpisodicMemory.created_at))\
                 .limit(limit)\
                 .all()
             
-            return [
-                {
-                    "query": i.query,
-                    "agent": i.agent_used,
-                    "response": i.response,
-                    "timestamp": i.created_at.isoformat()
-                }
-                for i in interactions
-            ]
+            return [_interaction_dict(i) for i in interactions]
         finally:
             db.close()
     
+    @observe_db("read")
+    def get_interaction_page(
+        self,
+        user_id: int,
+        limit: int,
+        cursor: Optional[str] = None,
+        agent_used: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        projection: str = "summary"
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Página del historial, de la más reciente a la más antigua.
+        Keyset sobre (created_at, id) con el índice idx_user_created: cada página
+        arranca donde terminó la anterior (sin OFFSET), así que cuesta lo mismo
+        la primera que la número mil. Devuelve (filas, cursor de la siguiente o None).
+        """
+        columns = INTERACTION_PROJECTIONS[projection]
+        db = SessionLocal()
+        try:
+            query = db.query(EpisodicMemory.id, *columns)\
+                .filter(EpisodicMemory.user_id == user_id)
+            if agent_used:
+                query = query.filter(EpisodicMemory.agent_used == agent_used)
+            if since:
+                query = query.filter(EpisodicMemory.created_at >= since)
+            if until:
+                query = query.filter(EpisodicMemory.created_at < until)
+            if cursor:
+                created_at, interaction_id = decode_cursor(cursor)
+                query = query.filter(tuple_(EpisodicMemory.created_at, EpisodicMemory.id) < tuple_(created_at, interaction_id))
+            rows = query.order_by(desc(EpisodicMemory.created_at), desc(EpisodicMemory.id))\
+                .limit(limit + 1)\
+                .all()
+            
+            page = rows[:limit]
+            next_cursor = encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
+            return [_interaction_dict(i) for i in page], next_cursor
+        finally:
+            db.close()
+    
+    @observe_db("read")
     def get_interaction_count(self, user_id: int) -> int:
         """Cuenta las interacciones del usuario"""
         db = SessionLocal()
@@ -74,7 +219,16 @@ class MemoryManager:
             db.close()
     
     def get_semantic_profile(self, user_id: int) -> Dict:
-        """Obtiene el perfil semántico del usuario"""
+        """Obtiene el perfil semántico del usuario (caché compartida, se invalida al actualizarlo)"""
+        cache = get_cache()
+        profile = cache.get("profile", str(user_id))
+        if profile is None:
+            profile = self._load_semantic_profile(user_id)
+            cache.set("profile", str(user_id), profile, settings.PROFILE_CACHE_TTL_S)
+        return profile
+    
+    @observe_db("read")
+    def _load_semantic_profile(self, user_id: int) -> Dict:
         db = SessionLocal()
         try:
             profile = db.query(SemanticProfile)\
@@ -94,99 +248,269 @@ class MemoryManager:
         finally:
             db.close()
     
-    def update_semantic_profile_if_needed(self, user_id: int) -> None:
+    @observe_db("read")
+    def _interactions_for_profile_update(self, user_id: int) -> List[Dict]:
         """
-        Actualiza el perfil semántico si se alcanzó el threshold de interacciones.
-        Usa el user_id para filtrar interacciones específicas del usuario.
+        Interacciones recientes del usuario si ya toca actualizar su perfil
+        (SEMANTIC_UPDATE_THRESHOLD interacciones nuevas); lista vacía si no.
         """
         db = SessionLocal()
         try:
-            profile = db.query(SemanticProfile)\
+            last_updated = db.query(SemanticProfile.last_updated)\
                 .filter(SemanticProfile.user_id == user_id)\
-                .first()
+                .scalar()
             
             # Verificar si necesita actualización
-            if profile and profile.last_updated:
+            if last_updated:
                 interactions_since = db.query(func.count(EpisodicMemory.id))\
                     .filter(
                         EpisodicMemory.user_id == user_id,
-                        EpisodicMemory.created_at > profile.last_updated
+                        EpisodicMemory.created_at > last_updated
                     ).scalar()
                 
                 if interactions_since < settings.SEMANTIC_UPDATE_THRESHOLD:
-                    return
-            
-            # Obtener interacciones recientes del usuario específico
-            recent = self.get_recent_interactions(
-                user_id,
-                limit=settings.SEMANTIC_UPDATE_THRESHOLD * 2
-            )
-            
+                    return []
+        finally:
+            db.close()
+        
+        return self.get_recent_interactions(
+            user_id,
+            limit=settings.SEMANTIC_UPDATE_THRESHOLD * 2
+        )
+    
+    @observe_db("write")
+    def _save_semantic_profile(self, user_id: int, new_profile: Dict) -> None:
+        """Mezcla `new_profile` con el perfil guardado (o lo crea) e invalida la caché"""
+        db = SessionLocal()
+        try:
+            profile = db.query(SemanticProfile)\
+                .filter(SemanticProfile.user_id == user_id)\
+                .first()
+            if profile:
+                # Dict nuevo: SQLAlchemy no detecta cambios in-place en columnas JSON
+                profile.attributes = {**(profile.attributes or {}), **new_profile}
+                profile.last_updated = datetime.now(timezone.utc)
+            else:
+                db.add(SemanticProfile(
+                    user_id=user_id,
+                    attributes=new_profile,
+                    last_updated=datetime.now(timezone.utc)
+                ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        get_cache().invalidate("profile", str(user_id))
+    
+    async def update_semantic_profile_if_needed(self, user_id: int) -> None:
+        """
+        Actualiza el perfil semántico si se alcanzó el threshold de interacciones.
+        Usa el user_id para filtrar interacciones específicas del usuario.
+        Las consultas a la BD van en un thread para no bloquear el event loop;
+        la llamada al LLM va con prioridad background en el gateway.
+        """
+        try:
+            recent = await asyncio.to_thread(self._interactions_for_profile_update, user_id)
             if not recent:
                 return
             
             # Generar nuevo perfil semántico con LLM usando las interacciones del usuario
-            new_profile = self._generate_semantic_profile(recent)
+            new_profile = await self._generate_semantic_profile(recent)
             
             if not new_profile:
                 return
             
-            # Actualizar o crear perfil
-            if profile:
-                current_attrs = profile.attributes or {}
-                current_attrs.update(new_profile)
-                profile.attributes = current_attrs
-                profile.last_updated = datetime.now(timezone.utc)
-            else:
-                profile = SemanticProfile(
-                    user_id=user_id,
-                    attributes=new_profile,
-                    last_updated=datetime.now(timezone.utc)
-                )
-                db.add(profile)
-            
-            db.commit()
+            await asyncio.to_thread(self._save_semantic_profile, user_id, new_profile)
             print(f" Updated semantic profile for user {user_id}")
             
         except Exception as e:
             print(f" Error updating semantic profile: {e}")
-            db.rollback()
-        finally:
-            db.close()
     
-    def _generate_semantic_profile(self,interactions: List[Dict]) -> Optional[Dict]:
+    async def _generate_semantic_profile(self,interactions: List[Dict]) -> Optional[Dict]:
         """
         Usa el LLM para generar un perfil semántico compacto
         basado en las interacciones recientes del usuario.
         """
         try:
-            prompt = ChatPromptTemplate.from_template("""
-                Eres un experto en análisis de comportamiento financiero.
-
-                Analiza las siguientes interacciones del usuario y genera un perfil semántico compacto.
-
-                INTERACCIONES:
-                {interactions}
-
-                Genera un perfil que incluya:
-                - risk_tolerance: low, medium, high
-                - motivation_style: goal_oriented, balance_focused, stress_averse
-                - financial_literacy: beginner, intermediate, advanced
-                - spending_patterns: [lista de patrones detectados]
-                - preferred_categories: [categorías donde más gasta]
-                - emotional_state: positive, neutral, concerned, stressed
-                - preferred_tone: friendly, formal, encouraging, direct
-
-                RESPONDE SOLO EN JSON:
-            """)
-            chain = prompt | self.llm | JsonOutputParser()
             interactions_text = json.dumps(interactions, indent=2, ensure_ascii=False)
-            result = chain.invoke({"interactions": interactions_text})
+            result = await invoke_json_chain(
+                SEMANTIC_PROFILE_PROMPT,
+                self.llm,
+                {"interactions": interactions_text},
+                "memory_manager",
+                "semantic_profile",
+                priority="background"
+            )
             return result
         except Exception as e:
             print(f" Error generating semantic profile: {e}")
+            record_fallback("memory_manager", "semantic_profile")
             return None
     
+    @observe_db("read")
+    def get_users_pending_profile_update(self, limit: Optional[int] = None) -> List[int]:
+        """
+        Usuarios cuyo perfil semántico debe regenerarse: sin perfil y con al menos
+        una interacción, o con SEMANTIC_UPDATE_THRESHOLD interacciones nuevas.
+        Ordenados por actividad más reciente.
+        """
+        db = SessionLocal()
+        try:
+            last_updated = func.max(SemanticProfile.last_updated)
+            query = db.query(EpisodicMemory.user_id)\
+                .outerjoin(SemanticProfile, SemanticProfile.user_id == EpisodicMemory.user_id)\
+                .filter(or_(
+                    SemanticProfile.last_updated.is_(None),
+                    EpisodicMemory.created_at > SemanticProfile.last_updated
+                ))\
+                .group_by(EpisodicMemory.user_id)\
+                .having(func.count(EpisodicMemory.id) >= case(
+                    (last_updated.is_(None), 1),
+                    else_=settings.SEMANTIC_UPDATE_THRESHOLD
+                ))\
+                .order_by(desc(func.max(EpisodicMemory.created_at)))
+            if limit:
+                query = query.limit(limit)
+            return [row.user_id for row in query.all()]
+        finally:
+            db.close()
+    
+    @observe_db("read")
+    def get_active_user_ids(self, days: int) -> List[int]:
+        """
+        Usuarios con al menos una interacción en los últimos `days` días.
+        Solo cuentan las que pidió el usuario: los jobs no guardan interacciones.
+        """
+        db = SessionLocal()
+        try:
+            since = datetime.now(timezone.utc) - timedelta(days=days)
+            rows = db.query(EpisodicMemory.user_id)\
+                .filter(EpisodicMemory.created_at >= since)\
+                .distinct()\
+                .all()
+            return [row.user_id for row in rows]
+        finally:
+            db.close()
+    
+    @observe_db("read")
+    def get_recent_interactions_bulk(self, user_ids: List[int], limit: int) -> Dict[int, List[Dict]]:
+        """Últimas `limit` interacciones de cada usuario en una sola consulta"""
+        db = SessionLocal()
+        try:
+            rank = func.row_number().over(
+                partition_by=EpisodicMemory.user_id,
+                order_by=desc(EpisodicMemory.created_at)
+            ).label("rank")
+            ranked = db.query(EpisodicMemory.id, rank)\
+                .filter(EpisodicMemory.user_id.in_(user_ids))\
+                .subquery()
+            interactions = db.query(EpisodicMemory.user_id, *INTERACTION_PROJECTIONS["full"])\
+                .join(ranked, ranked.c.id == EpisodicMemory.id)\
+                .filter(ranked.c.rank <= limit)\
+                .order_by(EpisodicMemory.user_id, desc(EpisodicMemory.created_at))\
+                .all()
+            
+            result: Dict[int, List[Dict]] = {}
+            for i in interactions:
+                item = _interaction_dict(i)
+                result.setdefault(item.pop("user_id"), []).append(item)
+            return result
+        finally:
+            db.close()
+    
+    @observe_db("write")
+    def save_semantic_profiles(self, new_profiles: Dict[int, Dict]) -> None:
+        """Actualiza o crea varios perfiles semánticos en una transacción"""
+        db = SessionLocal()
+        try:
+            existing = {
+                p.user_id: p
+                for p in db.query(SemanticProfile)
+                    .filter(SemanticProfile.user_id.in_(list(new_profiles)))
+                    .all()
+            }
+            now = datetime.now(timezone.utc)
+            for user_id, new_profile in new_profiles.items():
+                profile = existing.get(user_id)
+                if profile:
+                    profile.attributes = {**(profile.attributes or {}), **new_profile}
+                    profile.last_updated = now
+                else:
+                    db.add(SemanticProfile(user_id=user_id, attributes=new_profile, last_updated=now))
+            db.commit()
+            for user_id in new_profiles:
+                get_cache().invalidate("profile", str(user_id))
+        except Exception as e:
+            print(f" Error saving semantic profiles: {e}")
+            db.rollback()
+        finally:
+            db.close()
+    
+    async def regenerate_pending_profiles(self, limit: Optional[int] = None, max_concurrency: Optional[int] = None, pack_size: Optional[int] = None) -> int:
+        """
+        Regenera por lotes los perfiles semánticos pendientes.
+        Las llamadas van con `abatch` y concurrencia acotada; si pack_size > 1,
+        los usuarios con poco historial se agrupan en un solo prompt multi-perfil.
+        Devuelve la cantidad de perfiles actualizados.
+        """
+        max_concurrency = max_concurrency or settings.SEMANTIC_BATCH_CONCURRENCY
+        pack_size = pack_size or settings.SEMANTIC_PACK_SIZE
+        pending = self.get_users_pending_profile_update(limit)
+        updated = 0
+        
+        for start in range(0, len(pending), settings.SEMANTIC_BATCH_CHUNK):
+            chunk = pending[start:start + settings.SEMANTIC_BATCH_CHUNK]
+            histories = self.get_recent_interactions_bulk(chunk, settings.SEMANTIC_UPDATE_THRESHOLD * 2)
+            texts = {
+                user_id: json.dumps(histories[user_id], indent=2, ensure_ascii=False)
+                for user_id in chunk if histories.get(user_id)
+            }
+            singles, packs = _plan_profile_batches(texts, pack_size)
+            
+            single_results, pack_results = await asyncio.gather(
+                invoke_json_chain_batch(
+                    SEMANTIC_PROFILE_PROMPT,
+                    self.llm,
+                    [{"interactions": texts[user_id]} for user_id in singles],
+                    "memory_manager",
+                    "semantic_profile",
+                    max_concurrency=max_concurrency
+                ),
+                invoke_json_chain_batch(
+                    MULTI_PROFILE_PROMPT,
+                    self.llm,
+                    [{"users": _format_pack(pack, texts)} for pack in packs],
+                    "memory_manager",
+                    "semantic_profile_pack",
+                    max_concurrency=max_concurrency
+                )
+            )
+            
+            new_profiles: Dict[int, Dict] = {}
+            for user_id, result in zip(singles, single_results):
+                if isinstance(result, dict) and result:
+                    new_profiles[user_id] = result
+            for pack, result in zip(packs, pack_results):
+                profiles = result.get("profiles", {}) if isinstance(result, dict) else {}
+                for user_id in pack:
+                    profile = profiles.get(str(user_id))
+                    if isinstance(profile, dict) and profile:
+                        new_profiles[user_id] = profile
+            
+            failed = len(texts) - len(new_profiles)
+            if failed:
+                record_fallback("memory_manager", "semantic_profile_batch")
+                print(f" Semantic profile batch: {failed} users without new profile")
+            if new_profiles:
+                self.save_semantic_profiles(new_profiles)
+                updated += len(new_profiles)
+        
+        print(f" Regenerated {updated} semantic profiles")
+        return updated
+    
+    @observe_db("write")
     def cleanup_old_interactions(self, days: int = None) -> int:
         """
         Elimina interacciones episódicas antiguas para mantener la BD limpia
@@ -209,6 +533,7 @@ class MemoryManager:
         finally:
             db.close()
 
+    @observe_db("write")
     def create_initial_profile(self, user_id: int, profile_data: Dict) -> None:
         """Crea o sobrescribe el perfil semántico inicial desde el Onboarding"""
         db = SessionLocal()
@@ -228,9 +553,22 @@ class MemoryManager:
                 db.add(profile)
             
             db.commit()
+            get_cache().invalidate("profile", str(user_id))
             print(f"✅ Initial semantic profile created for user {user_id}")
         except Exception as e:
             print(f"❌ Error creating initial profile: {e}")
             db.rollback()
         finally:
-            db.close()
\ No newline at end of file
+            db.close()
+
+def _plan_profile_batches(texts: Dict[int, str], pack_size: int):
+    """Separa usuarios en llamadas individuales y paquetes multi-perfil"""
+    if pack_size <= 1:
+        return list(texts), []
+    small = [u for u, text in texts.items() if len(text) <= settings.SEMANTIC_PACK_MAX_CHARS]
+    singles = [u for u, text in texts.items() if len(text) > settings.SEMANTIC_PACK_MAX_CHARS]
+    packs = [small[i:i + pack_size] for i in range(0, len(small), pack_size)]
+    return singles, packs
+
+def _format_pack(user_ids: List[int], texts: Dict[int, str]) -> str:
+    return "\n\n".join(f"### USUARIO {user_id}\n{texts[user_id]}" for user_id in user_ids)
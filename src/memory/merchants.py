@@ -0,0 +1,128 @@
+"""
+Registro persistente de comercios (tablas merchants / merchant_aliases).
+
+Cada descripción normalizada se resuelve una sola vez por despliegue: la
+primera vez se busca su comercio con MinHash/LSH (src.analytics.merchants) y
+el alias queda guardado. Cada proceso carga los alias al primer uso; las
+descripciones que no conoce las busca primero en la tabla (las pudo resolver
+otro worker) y solo agrupa las que faltan. En el camino del request anotar
+las transacciones es una pasada de búsquedas en un dict.
+"""
+import asyncio
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy.exc import IntegrityError
+from src.analytics.merchants import MerchantIndex, normalize_description
+from src.config import settings
+from src.memory.database import SessionLocal
+from src.memory.models import Merchant, MerchantAlias
+from src.observability.metrics import observe_db, record_error
+
+# Descripciones por consulta al buscar alias guardados por otros workers
+ALIAS_LOOKUP_CHUNK = 500
+
+# Las descripciones crudas se repiten mucho (mismo comercio, mismo usuario)
+_normalize = lru_cache(maxsize=100_000)(normalize_description)
+
+class MerchantRegistry:
+
+    def __init__(self):
+        self._index: Optional[MerchantIndex] = None
+        self._lock = threading.Lock()
+
+    @observe_db("read")
+    def _load(self) -> MerchantIndex:
+        index = MerchantIndex()
+        db = SessionLocal()
+        try:
+            rows = db.query(MerchantAlias.description, MerchantAlias.merchant_id, Merchant.name)\
+                .join(Merchant, Merchant.id == MerchantAlias.merchant_id)\
+                .all()
+        finally:
+            db.close()
+        for row in rows:
+            index.add(row.description, row.merchant_id, row.name)
+        print(f" Merchant index loaded ({len(index.aliases)} aliases, {len(index.names)} merchants)")
+        return index
+
+    @observe_db("write")
+    def _persist(self, index: MerchantIndex, descriptions: List[str]) -> None:
+        """Asigna comercio a `descriptions` (desconocidas para este proceso) y guarda los alias nuevos"""
+        db = SessionLocal()
+        try:
+            for start in range(0, len(descriptions), ALIAS_LOOKUP_CHUNK):
+                known = db.query(MerchantAlias.description, MerchantAlias.merchant_id, Merchant.name)\
+                    .join(Merchant, Merchant.id == MerchantAlias.merchant_id)\
+                    .filter(MerchantAlias.description.in_(descriptions[start:start + ALIAS_LOOKUP_CHUNK]))\
+                    .all()
+                for row in known:
+                    index.add(row.description, row.merchant_id, row.name)
+
+            for description in descriptions:
+                if description in index.aliases:
+                    continue
+                merchant_id = index.match(description)
+                if merchant_id is None:
+                    merchant = Merchant(name=description)
+                    db.add(merchant)
+                    db.flush()
+                    merchant_id = merchant.id
+                db.add(MerchantAlias(description=description, merchant_id=merchant_id))
+                index.add(description, merchant_id)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def resolve(self, descriptions: Iterable[str]) -> None:
+        """Deja en el índice el comercio de cada descripción normalizada"""
+        with self._lock:
+            if self._index is None:
+                self._index = self._load()
+            pending = sorted({d for d in descriptions if d and d not in self._index.aliases})
+            if not pending:
+                return
+            try:
+                try:
+                    self._persist(self._index, pending)
+                except IntegrityError:
+                    # Otro worker guardó alguno de los alias a la vez: recargar y reintentar
+                    self._index = self._load()
+                    self._persist(self._index, [d for d in pending if d not in self._index.aliases])
+            except Exception:
+                # El índice pudo quedar con asignaciones que no se guardaron
+                self._index = None
+                raise
+
+    def _annotate(self, transactions: List[Dict], normalized: List[str]) -> List[Dict]:
+        index = self._index
+        if index is None:
+            return transactions
+        annotated = []
+        for t, description in zip(transactions, normalized):
+            merchant_id = index.aliases.get(description)
+            annotated.append(t if merchant_id is None else {**t, "merchant_id": merchant_id, "merchant": index.names[merchant_id]})
+        return annotated
+
+    async def annotate(self, transactions: List[Dict]) -> List[Dict]:
+        """
+        Copia de las transacciones con merchant_id y merchant (nombre canónico).
+        Solo va a la BD si hay descripciones que este proceso no conoce; si
+        falla, devuelve las transacciones sin anotar.
+        """
+        if not settings.MERCHANT_CANONICALIZATION_ENABLED or not transactions:
+            return transactions
+        normalized = [_normalize(t.get("description") or "") for t in transactions]
+        index = self._index
+        if index is None or any(d and d not in index.aliases for d in normalized):
+            try:
+                await asyncio.to_thread(self.resolve, set(normalized))
+            except Exception as e:
+                print(f" Error resolving merchants: {e}")
+                record_error("merchants")
+        return self._annotate(transactions, normalized)
+
+merchant_registry = MerchantRegistry()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime, Index
+from sqlalchemy import BigInteger, Column, ForeignKey, Integer, String, Text, Float, JSON, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 from src.memory.database import Base
 
@@ -12,7 +13,11 @@ class EpisodicMemory(Base):
     user_id = Column(Integer, nullable=False, index=True)
     query = Column(String, nullable=False)
     agent_used = Column(String, nullable=False)  # 'financial_analysis' o 'goal_analysis'
-    response = Column(JSON, nullable=False)  # Respuesta completa del agente
+    response = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False)  # Respuesta completa del agente
+    # Campos de `response` promovidos a columnas: las lecturas que solo los usan no cargan el JSON
+    message = Column(Text, nullable=True)
+    health_score = Column(Float, nullable=True)
+    health_status = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     __table_args__ = (
         Index('idx_user_created', 'user_id', 'created_at'),
@@ -37,4 +42,56 @@ class SemanticProfile(Base):
     #   "preferred_tone": "friendly|formal|encouraging|direct"
     # }
     last_updated = Column(DateTime, default=datetime.utcnow, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class PrecomputedInsight(Base):
+    """
+    Insights del dashboard (análisis general) ya calculados por usuario.
+    Son válidos mientras data_version coincida con la huella de los datos actuales.
+    """
+    __tablename__ = "precomputed_insights"
+    user_id = Column(Integer, primary_key=True)
+    data_version = Column(String, nullable=False)  # Huella de transacciones, metas, contexto, perfil y prompts
+    analysis_type = Column(String, nullable=False)
+    result = Column(JSON, nullable=False)
+    computed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class LLMUsage(Base):
+    """
+    Registro append-only del uso del LLM: una fila por llamada completada.
+    Se escribe por lotes (src.memory.usage); nunca se actualiza.
+    """
+    __tablename__ = "llm_usage"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    user_id = Column(Integer, nullable=True)  # None en llamadas sin usuario (p.ej. perfiles por lotes)
+    endpoint = Column(String, nullable=True)  # Ruta o job que originó la llamada
+    analyzer = Column(String, nullable=False)
+    method = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    prompt_tokens = Column(Integer, nullable=False)
+    completion_tokens = Column(Integer, nullable=False)
+    cached_tokens = Column(Integer, nullable=False)  # Parte de prompt_tokens servida desde la caché de prefijos
+    latency_ms = Column(Integer, nullable=False)
+    __table_args__ = (
+        # BRIN en Postgres: la tabla solo crece en orden de created_at
+        Index("idx_llm_usage_created_at", "created_at", postgresql_using="brin"),
+        Index("idx_llm_usage_user_created", "user_id", "created_at"),
+    )
+
+class Merchant(Base):
+    """Comercio canónico del despliegue (src.memory.merchants)"""
+    __tablename__ = "merchants"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)  # Primera descripción normalizada asignada al comercio
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class MerchantAlias(Base):
+    """
+    Descripción normalizada -> comercio. Cada descripción se agrupa (MinHash/LSH)
+    una sola vez; después se resuelve por esta tabla.
+    """
+    __tablename__ = "merchant_aliases"
+    description = Column(String, primary_key=True)
+    merchant_id = Column(Integer, ForeignKey("merchants.id"), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
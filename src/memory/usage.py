@@ -0,0 +1,166 @@
+"""
+Registro de uso del LLM (tabla llm_usage).
+
+Cada llamada completada al LLM agrega una fila con tokens de entrada/salida,
+latencia, modelo, analizador y método, atribuida al usuario y al endpoint
+del contexto (set_usage_context). Las filas se acumulan en memoria y se
+escriben por lotes: al llegar a USAGE_FLUSH_ROWS o cada
+USAGE_FLUSH_INTERVAL_S (tarea de fondo de la app), y al apagar. Los jobs,
+que corren fuera de la app, llaman a flush() al terminar.
+"""
+import asyncio
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import desc, func, insert
+from src.config import settings
+from src.memory.database import SessionLocal, engine
+from src.memory.models import LLMUsage
+from src.observability.metrics import observe_db
+
+_usage_endpoint: ContextVar[Optional[str]] = ContextVar("finzen_usage_endpoint", default=None)
+_usage_user: ContextVar[Optional[int]] = ContextVar("finzen_usage_user", default=None)
+
+# Dimensiones por las que se puede agregar el registro
+USAGE_DIMENSIONS = {
+    "day": func.date(LLMUsage.created_at),
+    "user": LLMUsage.user_id,
+    "endpoint": LLMUsage.endpoint,
+    "analyzer": LLMUsage.analyzer,
+    "method": LLMUsage.method,
+    "model": LLMUsage.model
+}
+
+def set_usage_context(endpoint: str, user_id: Optional[int | str] = None) -> None:
+    """Atribuye las llamadas al LLM siguientes del contexto actual a `endpoint` / `user_id`"""
+    if isinstance(user_id, str):
+        # Los endpoints de presupuesto reciben el user_id como texto
+        user_id = int(user_id) if user_id.isdigit() else None
+    _usage_endpoint.set(endpoint)
+    _usage_user.set(user_id)
+
+class UsageLedger:
+
+    def __init__(self):
+        self._rows: List[Dict] = []
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, analyzer: str, method: str, model: str, usage: Optional[Dict], latency_s: float) -> None:
+        """Agrega la fila de una llamada (usage = usage_metadata de LangChain)"""
+        if not settings.USAGE_LEDGER_ENABLED or not usage:
+            return
+        row = {
+            "created_at": datetime.now(timezone.utc),
+            "user_id": _usage_user.get(),
+            "endpoint": _usage_endpoint.get(),
+            "analyzer": analyzer,
+            "method": method,
+            "model": model,
+            "prompt_tokens": usage.get("input_tokens", 0) or 0,
+            "completion_tokens": usage.get("output_tokens", 0) or 0,
+            "cached_tokens": (usage.get("input_token_details") or {}).get("cache_read", 0) or 0,
+            "latency_ms": int(latency_s * 1000)
+        }
+        with self._lock:
+            self._rows.append(row)
+            pending = len(self._rows)
+        if pending >= settings.USAGE_FLUSH_ROWS and self._wakeup is not None:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Escribe lo pendiente en un solo INSERT; si falla, lo devuelve al buffer (acotado)"""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(LLMUsage), rows)
+        except Exception as e:
+            print(f" Error writing LLM usage ({len(rows)} rows): {e}")
+            with self._lock:
+                self._rows[:0] = rows
+                overflow = len(self._rows) - settings.USAGE_MAX_BUFFER
+                if overflow > 0:
+                    del self._rows[:overflow]
+            return 0
+        return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.USAGE_FLUSH_INTERVAL_S)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await asyncio.to_thread(self.flush)
+
+    def start(self) -> None:
+        """Arranca la escritura periódica (en el lifespan de la app)"""
+        if self._task is None and settings.USAGE_LEDGER_ENABLED:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._wakeup = None
+        await asyncio.to_thread(self.flush)
+
+    @observe_db("read")
+    def usage_summary(
+        self,
+        group_by: List[str],
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        user_id: Optional[int] = None,
+        limit: int = 100
+    ) -> List[Dict]:
+        """
+        Totales de tokens y latencia agregados por las dimensiones de `group_by`
+        (ver USAGE_DIMENSIONS), de mayor a menor consumo. ValueError si alguna
+        dimensión no existe.
+        """
+        unknown = [d for d in group_by if d not in USAGE_DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown group_by: {', '.join(unknown)}. Options: {', '.join(USAGE_DIMENSIONS)}")
+        dimensions = [USAGE_DIMENSIONS[d].label(d) for d in group_by]
+        total = func.sum(LLMUsage.prompt_tokens + LLMUsage.completion_tokens)
+        db = SessionLocal()
+        try:
+            query = db.query(
+                *dimensions,
+                func.count().label("calls"),
+                func.sum(LLMUsage.prompt_tokens).label("prompt_tokens"),
+                func.sum(LLMUsage.completion_tokens).label("completion_tokens"),
+                func.sum(LLMUsage.cached_tokens).label("cached_tokens"),
+                total.label("total_tokens"),
+                func.avg(LLMUsage.latency_ms).label("avg_latency_ms")
+            )
+            if since is not None:
+                query = query.filter(LLMUsage.created_at >= since)
+            if until is not None:
+                query = query.filter(LLMUsage.created_at < until)
+            if user_id is not None:
+                query = query.filter(LLMUsage.user_id == user_id)
+            rows = query.group_by(*dimensions).order_by(desc(total)).limit(limit).all()
+        finally:
+            db.close()
+        return [
+            {
+                **{d: (str(getattr(row, d)) if d == "day" else getattr(row, d)) for d in group_by},
+                "calls": row.calls,
+                "prompt_tokens": int(row.prompt_tokens or 0),
+                "completion_tokens": int(row.completion_tokens or 0),
+                "cached_tokens": int(row.cached_tokens or 0),
+                "total_tokens": int(row.total_tokens or 0),
+                "avg_latency_ms": round(float(row.avg_latency_ms or 0), 1)
+            }
+            for row in rows
+        ]
+
+usage_ledger = UsageLedger()
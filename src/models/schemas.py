@@ -18,6 +18,7 @@ class GoalInput(BaseModel):
     category: str
     due_date: Optional[str] = None
     status: str
+    created_at: Optional[str] = None
 
 class FinancialContext(BaseModel):
     monthly_income: float
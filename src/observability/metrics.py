@@ -0,0 +1,189 @@
+"""
+Métricas Prometheus del servicio (expuestas en /metrics).
+
+Los valores de las etiquetas SIEMPRE son literales definidos en el código
+(nombre del servicio, del agente, del método o de la etapa). Nunca se usan
+datos del usuario (user_id, query, token) como etiqueta para mantener la
+cardinalidad acotada.
+"""
+import time
+from contextlib import contextmanager
+from functools import wraps
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from src.observability.tracing import span
+
+# Buckets para etapas que dependen de red (upstream, LLM)
+NETWORK_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+# Buckets para etapas locales (BD, construcción de prompt, parseo)
+LOCAL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+UPSTREAM_FETCH_SECONDS = Histogram(
+    "finzen_upstream_fetch_seconds",
+    "Latencia de las llamadas a microservicios (transactions, reports, goals)",
+    ["service"],
+    buckets=NETWORK_BUCKETS
+)
+DB_SECONDS = Histogram(
+    "finzen_db_seconds",
+    "Latencia de operaciones de base de datos",
+    ["kind", "operation"],
+    buckets=LOCAL_BUCKETS
+)
+PROMPT_BUILD_SECONDS = Histogram(
+    "finzen_prompt_build_seconds",
+    "Tiempo de construcción del prompt",
+    ["analyzer", "method"],
+    buckets=LOCAL_BUCKETS
+)
+LLM_CALL_SECONDS = Histogram(
+    "finzen_llm_call_seconds",
+    "Latencia de la llamada al LLM por método de análisis",
+    ["analyzer", "method"],
+    buckets=NETWORK_BUCKETS
+)
+OUTPUT_PARSE_SECONDS = Histogram(
+    "finzen_output_parse_seconds",
+    "Tiempo de parseo de la respuesta del LLM",
+    ["analyzer", "method"],
+    buckets=LOCAL_BUCKETS
+)
+LLM_OUTPUT_REPAIRS = Counter(
+    "finzen_llm_output_repairs_total",
+    "Respuestas del LLM fuera de formato (result: repaired = JSON reparado localmente | retried = se repitió la llamada | failed = inválida tras los reintentos)",
+    ["method", "result"]
+)
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "finzen_llm_queue_wait_seconds",
+    "Tiempo de espera en la cola del gateway LLM",
+    ["priority"],
+    buckets=NETWORK_BUCKETS
+)
+
+ROUTES = Counter(
+    "finzen_route_total",
+    "Rutas de análisis elegidas por los routers",
+    ["analyzer", "route"]
+)
+LLM_TOKENS = Counter(
+    "finzen_llm_tokens_total",
+    "Tokens consumidos en el LLM (direction: input|output|cached_input)",
+    ["analyzer", "direction"]
+)
+ERRORS = Counter(
+    "finzen_errors_total",
+    "Errores por etapa del pipeline",
+    ["stage"]
+)
+FALLBACKS = Counter(
+    "finzen_fallbacks_total",
+    "Respuestas de respaldo devueltas en lugar del resultado del LLM",
+    ["analyzer", "method"]
+)
+LLM_REJECTIONS = Counter(
+    "finzen_llm_rejections_total",
+    "Llamadas al LLM rechazadas por el gateway por falta de capacidad",
+    ["priority"]
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "finzen_llm_queue_depth",
+    "Llamadas al LLM esperando turno en el gateway"
+)
+LLM_HEDGES = Counter(
+    "finzen_llm_hedges_total",
+    "Llamadas duplicadas (hedge) al LLM (winner: primary|hedge|none)",
+    ["analyzer", "method", "winner"]
+)
+PROMPT_INFO = Gauge(
+    "finzen_prompt_info",
+    "Versión de cada prompt registrado (valor siempre 1)",
+    ["method", "version"]
+)
+STARTUP_SECONDS = Gauge(
+    "finzen_startup_seconds",
+    "Duración del arranque (lifespan) del proceso"
+)
+UPSTREAM_BREAKER_STATE = Gauge(
+    "finzen_upstream_breaker_state",
+    "Estado del circuit breaker por microservicio (0 closed, 1 half_open, 2 open)",
+    ["upstream"]
+)
+UPSTREAM_DEGRADED = Counter(
+    "finzen_upstream_degraded_total",
+    "Lecturas de microservicios no disponibles (result: stale = snapshot | unavailable = vacío)",
+    ["resource", "result"]
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "finzen_admission_in_flight",
+    "Requests caros (/analyze, /budget/*) en curso"
+)
+ADMISSION_SHED = Counter(
+    "finzen_admission_shed_total",
+    "Requests rechazados con 503 por sobrecarga (reason: in_flight | llm_queue)",
+    ["reason"]
+)
+BATCH_ITEMS = Counter(
+    "finzen_batch_items_total",
+    "Usuarios procesados por /analyze/batch (status: ok|error)",
+    ["status"]
+)
+CACHE_REQUESTS = Counter(
+    "finzen_cache_requests_total",
+    "Consultas a caches (result: hit|miss)",
+    ["cache", "result"]
+)
+
+@contextmanager
+def timer(histogram):
+    """Observa en `histogram` (ya con etiquetas) la duración del bloque"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+def observe_db(kind: str):
+    """
+    Decorador para métodos de acceso a BD.
+    kind: 'read' o 'write'. La operación es el nombre de la función.
+    También abre un span `db.<operación>` si hay traza activa.
+    """
+    def decorator(func):
+        histogram = DB_SECONDS.labels(kind, func.__name__)
+        span_name = f"db.{func.__name__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                with span(span_name, kind=kind):
+                    return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def record_route(analyzer: str, route: str) -> None:
+    ROUTES.labels(analyzer, route).inc()
+
+def record_fallback(analyzer: str, method: str) -> None:
+    FALLBACKS.labels(analyzer, method).inc()
+
+def record_error(stage: str) -> None:
+    ERRORS.labels(stage).inc()
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+def record_tokens(analyzer: str, usage: dict) -> None:
+    """Registra el uso de tokens a partir de `usage_metadata` de LangChain"""
+    if not usage:
+        return
+    LLM_TOKENS.labels(analyzer, "input").inc(usage.get("input_tokens", 0) or 0)
+    LLM_TOKENS.labels(analyzer, "output").inc(usage.get("output_tokens", 0) or 0)
+    # Tokens de entrada servidos desde la caché de prefijos del proveedor
+    cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+    LLM_TOKENS.labels(analyzer, "cached_input").inc(cached)
+
+def render_latest():
+    """Devuelve (payload, content_type) en formato de exposición Prometheus"""
+    return generate_latest(), CONTENT_TYPE_LATEST
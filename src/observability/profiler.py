@@ -0,0 +1,68 @@
+"""
+Profiler por muestreo para un request puntual.
+
+Un hilo auxiliar toma la pila del hilo del event loop cada
+PROFILER_INTERVAL_MS y acumula las pilas en formato "folded"
+(`frame;frame;frame count`), listo para flamegraph.pl o speedscope.
+Como el event loop es compartido, las muestras incluyen cualquier otra
+corrutina que se ejecute durante el request.
+"""
+import os
+import sys
+import threading
+from collections import Counter, OrderedDict
+from typing import Optional
+
+MAX_STORED_PROFILES = 20
+
+class SamplingProfiler:
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="finzen-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Detiene el muestreo y devuelve las pilas en formato folded"""
+        self._stop.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+class ProfileStore:
+    """Guarda en memoria los últimos perfiles generados"""
+
+    def __init__(self, max_size: int = MAX_STORED_PROFILES):
+        self.max_size = max_size
+        self._profiles: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, folded: str) -> str:
+        profile_id = os.urandom(8).hex()
+        with self._lock:
+            self._profiles[profile_id] = folded
+            while len(self._profiles) > self.max_size:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str) -> Optional[str]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+profile_store = ProfileStore()
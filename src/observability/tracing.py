@@ -0,0 +1,152 @@
+"""
+Trazas por request basadas en contextvars.
+
+Cuando no hay traza activa, `span()` devuelve un context manager vacío
+compartido: el costo es una lectura de ContextVar por etapa.
+"""
+import json
+import os
+import re
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+SERVICE_NAME = "finzen-ai-service"
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("finzen_trace", default=None)
+_current_span_id: ContextVar[Optional[str]] = ContextVar("finzen_span_id", default=None)
+
+_TOKEN_UNSAFE = re.compile(r"[^A-Za-z0-9_\-]")
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "attributes", "start_ns", "end_ns")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict):
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+class Trace:
+    """Colección de spans de un request"""
+
+    def __init__(self, name: str):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self.root = Span(name, None, {})
+
+    def server_timing(self) -> str:
+        """
+        Cabecera Server-Timing agregada por nombre de span
+        (suma de duraciones), para acotar su tamaño.
+        """
+        totals: Dict[str, List[float]] = {}
+        for s in self.spans:
+            entry = totals.setdefault(s.name, [0.0, 0])
+            entry[0] += s.duration_ms
+            entry[1] += 1
+        parts = [f"total;dur={self.root.duration_ms:.1f}"]
+        for name, (dur, count) in totals.items():
+            metric = _TOKEN_UNSAFE.sub("-", name)
+            parts.append(f'{metric};dur={dur:.1f};desc="x{count}"')
+        return ", ".join(parts)
+
+    def to_otlp(self) -> Dict:
+        """Exporta la traza en formato OTLP/JSON (ResourceSpans)"""
+        return {
+            "resourceSpans": [{
+                "resource": {
+                    "attributes": [_otlp_attr("service.name", SERVICE_NAME)]
+                },
+                "scopeSpans": [{
+                    "scope": {"name": "finzen.tracing"},
+                    "spans": [self._otlp_span(self.root)] + [self._otlp_span(s) for s in self.spans]
+                }]
+            }]
+        }
+
+    def _otlp_span(self, s: Span) -> Dict:
+        data = {
+            "traceId": self.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 2 if s is self.root else 1,  # SERVER | INTERNAL
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns or time.time_ns()),
+            "attributes": [_otlp_attr(k, v) for k, v in s.attributes.items()]
+        }
+        if s.parent_id:
+            data["parentSpanId"] = s.parent_id
+        return data
+
+class _ActiveSpan:
+    __slots__ = ("trace", "span", "token")
+
+    def __init__(self, trace: Trace, name: str, attributes: Dict):
+        self.trace = trace
+        self.span = Span(name, _current_span_id.get(), attributes)
+        self.token = None
+
+    def __enter__(self):
+        self.token = _current_span_id.set(self.span.span_id)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end_ns = time.time_ns()
+        if exc_type is not None:
+            self.span.attributes["error"] = exc_type.__name__
+        _current_span_id.reset(self.token)
+        self.trace.spans.append(self.span)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopSpan()
+
+def span(name: str, **attributes):
+    """Abre un span hijo del span actual (no-op si no hay traza activa)"""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP
+    return _ActiveSpan(trace, name, attributes)
+
+def start_trace(name: str) -> Trace:
+    """Activa una traza en el contexto actual"""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    _current_span_id.set(trace.root.span_id)
+    return trace
+
+def finish_trace(trace: Trace, **attributes) -> None:
+    trace.root.end_ns = time.time_ns()
+    trace.root.attributes.update(attributes)
+
+def export_trace(trace: Trace, path: str) -> None:
+    """Agrega la traza (una línea OTLP/JSON) al archivo indicado"""
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace.to_otlp()) + "\n")
+    except Exception as e:
+        print(f" Error exporting trace: {e}")
+
+def _otlp_attr(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}